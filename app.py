@@ -3,18 +3,18 @@ import streamlit as st
 import pandas as pd
 import json
 import os
-import io
 import time
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-from invoice_extractor import AIInvoiceExtractor
+import config
+from invoice_export import generate_excel, generate_quickbooks_csv
+from invoice_extractor import AIInvoiceExtractor, PARSE_CACHE_VERSION
 from quickbooks_adapter import QuickBooksAdapter
 from supabase_manager import SupabaseManager
 from legal_content import PRIVACY_POLICY, TERMS_OF_SERVICE
-from tempfile import NamedTemporaryFile
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -229,10 +229,17 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 @st.cache_resource
-def get_extractor_v6():
-    """Use Streamlit cache to create and reuse AI extractor instance (Version 6 - Tax Validation)"""
+def get_extractor(prompt_version: str = PARSE_CACHE_VERSION):
+    """
+    Use Streamlit cache to create and reuse AI extractor instance.
+    The prompt/schema version is part of the cache key, so a prompt change builds a fresh extractor.
+    """
     return AIInvoiceExtractor()
 
+# Build the shared extractor on the first script run so the OCR readers start
+# loading in the background before the first image is uploaded
+get_extractor()
+
 # --- Helper: Waitlist Modal (Fake Door Test) ---
 if hasattr(st, "dialog"):
     dialog_decorator = st.dialog
@@ -292,83 +299,6 @@ def init_supabase():
 
 from legal_content import PRIVACY_POLICY, TERMS_OF_SERVICE
 
-def generate_quickbooks_csv(data):
-    """
-    Generate CSV for QuickBooks Online Import.
-    Headers: Vendor, Invoice No, Invoice Date, Due Date, Total Amount, Line Amount, Line Account, Line Description
-    Date Format: MM/DD/YYYY
-    Amount: 2 decimal places
-    Encoding: utf-8-sig
-    """
-    def format_date_us(date_str):
-        if not date_str:
-            return ""
-        try:
-            # Try parsing various formats
-            dt = pd.to_datetime(date_str)
-            return dt.strftime("%m/%d/%Y")
-        except:
-            return date_str
-
-    headers = ["Vendor", "Invoice No", "Invoice Date", "Due Date", "Total Amount", "Line Amount", "Line Account", "Line Description"]
-    rows = []
-    
-    vendor = data.get("vendor_name", "")
-    inv_num = data.get("invoice_number", "")
-    inv_date = format_date_us(data.get("date", ""))
-    due_date = format_date_us(data.get("due_date", ""))
-    
-    # Ensure total_amount is float
-    try:
-        total = float(data.get("total_amount", 0))
-        total_str = "{:.2f}".format(total)
-    except:
-        total_str = "0.00"
-    
-    items = data.get("items", [])
-    
-    if items:
-        for item in items:
-            try:
-                line_amount = float(item.get("total_price", 0))
-                line_amount_str = "{:.2f}".format(line_amount)
-            except:
-                line_amount_str = "0.00"
-            
-            category = item.get("category")
-            if not category:
-                category = "Uncategorized Expense"
-            
-            description = item.get("description", "")
-            
-            row = {
-                "Vendor": vendor,
-                "Invoice No": inv_num,
-                "Invoice Date": inv_date,
-                "Due Date": due_date,
-                "Total Amount": total_str,
-                "Line Amount": line_amount_str,
-                "Line Account": category,
-                "Line Description": description
-            }
-            rows.append(row)
-    else:
-        # Fallback if no items found
-        row = {
-            "Vendor": vendor,
-            "Invoice No": inv_num,
-            "Invoice Date": inv_date,
-            "Due Date": due_date,
-            "Total Amount": total_str,
-            "Line Amount": total_str, # Assume single line item equal to total
-            "Line Account": "Uncategorized Expense",
-            "Line Description": "Invoice Total"
-        }
-        rows.append(row)
-        
-    df = pd.DataFrame(rows, columns=headers)
-    return df.to_csv(index=False).encode('utf-8-sig')
-
 def get_sample_csv():
     """Generate a sample CSV file for users to preview the format"""
     data = {
@@ -1060,7 +990,27 @@ def main():
                             st.error("Insufficient credits!")
                             return
 
-                        extractor = get_extractor_v6() # Get cached instance (v6)
+                        extractor = get_extractor() # Get cached instance
+                        
+                        # --- Progressive results: show header fields while the AI is still writing line items ---
+                        on_field = None
+                        if config.STREAM_RESULTS:
+                            with col2:
+                                live_panel = st.empty()
+                            live_fields = {}
+                            live_labels = {"vendor_name": "Vendor", "invoice_number": "Invoice #", "date": "Date", "total_amount": "Total Amount", "tax_amount": "Tax", "currency": "Currency"}
+                            
+                            def on_field(field, value):
+                                if field == "items[]":
+                                    live_fields["items"] = live_fields.get("items", 0) + 1
+                                elif field in live_labels and value is not None:
+                                    live_fields[field] = value
+                                else:
+                                    return
+                                lines = [f"**{label}:** {live_fields[key]}" for key, label in live_labels.items() if key in live_fields]
+                                if "items" in live_fields:
+                                    lines.append(f"**Line items found:** {live_fields['items']}")
+                                live_panel.info("  \n".join(["⏳ **Reading invoice...**"] + lines))
                         
                         # --- Multi-step "Ritual" Loading ---
                         with st.status("Processing Invoice...", expanded=True) as status:
@@ -1073,15 +1023,27 @@ def main():
                                 
                                 if "image" in uploaded_file.type:
                                     st.write("Optimizing image for OCR...")
-                                    data = extractor.extract_from_image(file_bytes)
+                                    data = extractor.extract_from_image(file_bytes, on_field=on_field)
+                                    documents = [data]
+                                    failures = []
                                 else: # It's a PDF
                                     st.write("Extracting raw text layer...")
-                                    with NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                                        tmp.write(file_bytes)
-                                        tmp_path = tmp.name
-                                    
-                                    data = extractor.process_pdf(tmp_path)
-                                    os.unlink(tmp_path)
+                                    # Straight from the upload buffer, no temp file on disk.
+                                    # A PDF may hold a stack of scanned bills: each one is extracted separately.
+                                    documents = extractor.process_pdf_documents(
+                                        file_bytes, on_field=on_field, tenant=st.session_state.user.id
+                                    )
+                                    if len(documents) > 1:
+                                        st.write(f"Found {len(documents)} invoices in this PDF...")
+                                    # Invoices that failed are reported to the user, the others are still shown
+                                    failures = [d for d in documents if d.get("error")]
+                                    all_failed = len(failures) == len(documents)
+                                    documents = [d for d in documents if not d.get("error")] or documents
+                                    if all_failed:
+                                        failures = []  # The error of the first invoice is shown below instead
+                                    for failure in failures:
+                                        st.write(f"⚠️ {failure['error']}")
+                                    data = documents[0]
                                 
                                 st.write("Identifying line items & totals...")
                                 time.sleep(0.5) 
@@ -1098,6 +1060,9 @@ def main():
                                         del st.session_state['invoice_data']
                                     if 'raw_ocr_output' in st.session_state:
                                         del st.session_state['raw_ocr_output']
+                                    if 'invoice_batch' in st.session_state:
+                                        del st.session_state['invoice_batch']
+                                    st.session_state.pop('invoice_failures', None)
                                 else:
                                     # If Pydantic object, convert to dict for storage and display
                                     if not isinstance(data, dict):
@@ -1108,12 +1073,19 @@ def main():
                                         st.session_state.raw_ocr_output = data["_raw_text"]
                                     
                                     st.session_state['invoice_data'] = data
+                                    st.session_state['invoice_source'] = uploaded_file.name
                                     st.session_state['processed'] = True
+                                    if len(documents) > 1:
+                                        st.session_state['invoice_batch'] = documents
+                                    elif 'invoice_batch' in st.session_state:
+                                        del st.session_state['invoice_batch']
+                                    st.session_state['invoice_failures'] = failures
                                     
                                     # --- SUCCESS: Deduct Credit & Log History ---
                                     try:
                                         supabase.decrement_credits(st.session_state.user.id, st.session_state.access_token)
-                                        supabase.log_invoice(st.session_state.user.id, data, st.session_state.access_token)
+                                        for document in documents:
+                                            supabase.log_invoice(st.session_state.user.id, document, st.session_state.access_token)
                                         st.toast("Credits deducted: -1", icon="💳")
                                         # Update local state to reflect change immediately
                                         st.session_state.credits -= 1
@@ -1132,6 +1104,25 @@ def main():
                 
                 if 'invoice_data' in st.session_state:
                     data = st.session_state['invoice_data']
+                    editor_key = "invoice_items_editor"
+
+                    # Multi-invoice PDF: pick which invoice to review
+                    invoice_batch = st.session_state.get('invoice_batch')
+                    if invoice_batch:
+                        def batch_label(i):
+                            doc = invoice_batch[i]
+                            pages = doc.get('_pages') or ["?", "?"]
+                            return f"Invoice {i + 1}: {doc.get('vendor_name')} #{doc.get('invoice_number') or '-'} (pages {pages[0]}-{pages[1]})"
+                        choice = st.selectbox(f"This PDF contains {len(invoice_batch)} invoices", range(len(invoice_batch)), format_func=batch_label)
+                        data = invoice_batch[choice]
+                        st.session_state['invoice_data'] = data
+                        st.session_state.raw_ocr_output = data.get("_raw_text", "")
+                        editor_key = f"invoice_items_editor_{choice}"
+
+                    # Invoices of the same PDF that could not be extracted: never dropped silently
+                    for failure in st.session_state.get('invoice_failures') or []:
+                        st.warning(f"{failure['error']} This invoice is not included below; "
+                                   f"upload pages {failure['_pages'][0]}-{failure['_pages'][1]} again on their own to retry.")
 
                     # If diagnostic mode result, display specially
                     if "diagnostic_description" in data:
@@ -1143,6 +1134,10 @@ def main():
                     # Warning Display (New)
                     if data.get("warning"):
                         st.warning(f"⚠️ **Smart Audit Report:** {data.get('warning')}")
+                    validation = data.get("_validation")
+                    if validation and not validation.get("ok"):
+                        issues = " ".join(issue["message"] for issue in validation.get("issues", []))
+                        st.info(f"🔎 **Confidence {validation.get('confidence', 0):.0%}:** {issues}")
 
                     # Key Metrics Row
                     m1, m2, m3, m4 = st.columns(4)
@@ -1190,7 +1185,7 @@ def main():
                                 column_config=column_config,
                                 num_rows="dynamic",
                                 use_container_width=True,
-                                key="invoice_items_editor"
+                                key=editor_key
                             )
                             
                             # --- Real-time Validation ---
@@ -1205,6 +1200,16 @@ def main():
                                 
                                 if abs(calculated_total - invoice_total) < 0.02:
                                     st.success(f"✅ **Logic Perfect:** Items(${line_total:.2f}) + Tax(${tax_amount:.2f}) = Total(${invoice_total:.2f})")
+                                    # Verified result: let the user teach us this vendor's layout (PDFs only)
+                                    is_source_pdf = (
+                                        uploaded_file is not None and "pdf" in uploaded_file.type
+                                        and st.session_state.get('invoice_source') == uploaded_file.name
+                                    )
+                                    if is_source_pdf and st.button(f"📌 Remember {data.get('vendor_name')}'s layout", help="Future invoices from this vendor with the same layout are read instantly, without AI."):
+                                        if get_extractor().learn_vendor_template(uploaded_file.getvalue(), data, tenant=st.session_state.user.id):
+                                            st.toast("Layout saved for this vendor", icon="📌")
+                                        else:
+                                            st.info("Could not find the invoice total on the page, layout not saved.")
                                 else:
                                     st.warning(f"⚠️ **Total mismatch detected.** Items(${line_total:.2f}) + Tax(${tax_amount:.2f}) = ${calculated_total:.2f}, but Invoice Total is ${invoice_total:.2f}.")
                                 
@@ -1251,18 +1256,19 @@ def main():
                                     st.write("**Has _raw_text:**", "_raw_text" in data)
                                     if "_raw_text" in data:
                                         st.write("**_raw_text length:**", len(data["_raw_text"]))
+                                    if data.get("_usage"):
+                                        st.write("**LLM usage:**", data["_usage"])
+                                    if data.get("_route"):
+                                        st.write("**Model routing:**", data["_route"])
                                 else:
                                     st.write("**Data Type:**", type(data))
+                                st.write("**DeepSeek circuit / hedging:**", get_extractor().client.resilience_state())
 
                     st.divider()
                     
                     # Action Section
                     st.subheader("3. Export & Sync")
                     
-                    # Prepare data for export
-                    items_data = data.get('items', [])
-                    df_export = pd.DataFrame(items_data) if items_data else pd.DataFrame()
-
                     c1, c2, c3 = st.columns(3)
                     with c1:
                         if st.button("🚀 Sync to QuickBooks"):
@@ -1294,13 +1300,9 @@ def main():
                         )
 
                     with c3:
-                        buffer = io.BytesIO()
-                        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-                            df_export.to_excel(writer, index=False, sheet_name='Invoice')
-                        
                         st.download_button(
                             label="📊 Download Excel",
-                            data=buffer.getvalue(),
+                            data=generate_excel(data),
                             file_name=f"invoice_{data.get('invoice_number', 'export')}.xlsx",
                             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                         )
@@ -1341,6 +1343,17 @@ def main():
                                 pass
                         
                         st.dataframe(df_history, use_container_width=True, hide_index=True)
+
+                        usage = supabase.get_daily_usage(st.session_state.user.id, st.session_state.access_token)
+                        if usage:
+                            st.caption("AI usage per day")
+                            df_usage = pd.DataFrame(usage).rename(columns={
+                                "day": "Day", "invoices": "Invoices", "llm_calls": "AI Calls",
+                                "prompt_tokens": "Prompt Tokens", "completion_tokens": "Completion Tokens",
+                                "cached_tokens": "Cached Tokens", "cost_usd": "Cost (USD)",
+                                "avg_llm_latency_ms": "Avg AI Time (ms)", "p95_llm_latency_ms": "p95 AI Time (ms)"
+                            }).drop(columns=["user_id"], errors="ignore")
+                            st.dataframe(df_usage, use_container_width=True, hide_index=True)
                     else:
                         st.info("No processing history found.")
                 else:
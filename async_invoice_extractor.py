@@ -0,0 +1,211 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import Executor
+from typing import Any, Awaitable, Callable, Optional
+
+import config
+from extraction_cache import hash_bytes
+from invoice_chunking import chunk_instructions, estimate_tokens, merge_chunk_items, merge_chunk_results, split_into_chunks
+from invoice_extractor import AIInvoiceExtractor, ExtractionError, InvoiceData, describe_input, read_input
+from invoice_validation import validate_invoice
+from llm_client import AsyncDeepSeekClient
+from llm_usage import with_usage
+from model_router import can_escalate, escalate, fall_back, route_document
+from metrics import DOCUMENTS, DOCUMENT_SECONDS, LLM_ANSWERS, STAGE_SECONDS, timed
+from pdf_text import join_pages
+from single_flight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAIInvoiceExtractor:
+    """
+    asyncio counterpart of AIInvoiceExtractor for event-loop services.
+    LLM round trips go through a non-blocking HTTP client, limited by a semaphore;
+    CPU-bound work (pdfplumber, OCR, cache I/O) is offloaded to an executor.
+    The prompt, cache and OCR pool are shared with the wrapped synchronous extractor.
+    """
+
+    def __init__(self, extractor: Optional[AIInvoiceExtractor] = None, max_concurrency: Optional[int] = None,
+                 executor: Optional[Executor] = None):
+        self.extractor = extractor or AIInvoiceExtractor()
+        self.client = AsyncDeepSeekClient()
+        self.executor = executor  # None uses the event loop's default thread pool
+        self._semaphore = asyncio.Semaphore(max_concurrency or config.ASYNC_MAX_CONCURRENCY)
+        self.inflight = AsyncSingleFlight()  # Identical concurrent documents share one extraction
+
+    async def _run_blocking(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def complete_json(self, payload: dict, build: Callable[[dict], Any]):
+        """Completion decoded with local repair, re-asked only if still unusable (see AIInvoiceExtractor.complete_json)"""
+        async with self._semaphore:
+            response_json = await self.client.chat_completion(payload)
+        try:
+            return build(self.extractor.response_dict(response_json))
+        except ValueError as e:
+            if not config.LLM_JSON_REASK:
+                raise
+            logger.warning(f"Model answer unusable after local repair ({e}), asking again")
+            LLM_ANSWERS.inc(outcome="reasked")
+            async with self._semaphore:
+                response_json = await self.client.chat_completion(self.extractor.json_reask_payload(payload, response_json, e))
+            return build(self.extractor.response_dict(response_json))
+
+    async def parse_with_ai(self, text: str, model: Optional[str] = None) -> InvoiceData:
+        """Use DeepSeek to convert unstructured text to structured JSON"""
+        try:
+            if config.LLM_CHUNK_TOKEN_BUDGET and estimate_tokens(text) > config.LLM_CHUNK_TOKEN_BUDGET:
+                return await self._parse_chunked(text, model)
+            return await self.complete_json(self.extractor.build_payload(text, model=model), self.extractor.invoice_from_dict)
+        except Exception as e:
+            logger.error(f"AI parsing failed: {e}")
+            raise
+
+    async def _parse_chunked(self, text: str, model: Optional[str] = None) -> InvoiceData:
+        """Map-reduce extraction of a long invoice (see AIInvoiceExtractor._parse_chunked)"""
+        chunks = split_into_chunks(text, config.LLM_CHUNK_TOKEN_BUDGET, config.LLM_CHUNK_OVERLAP_LINES)
+        logger.info(f"Long invoice (~{estimate_tokens(text)} tokens): extracting {len(chunks)} chunks concurrently")
+
+        async def extract_chunk(index: int) -> dict:
+            payload = self.extractor.build_payload(chunks[index], chunk_instructions(index, len(chunks)), model=model)
+            return await self.complete_json(payload, functools.partial(self.extractor.invoice_dict, keep=("line",)))
+
+        results = await asyncio.gather(*(extract_chunk(i) for i in range(len(chunks))))
+        return InvoiceData(**merge_chunk_results(results, merge_chunk_items([result["items"] for result in results])))
+
+    async def parse_pdf_text(self, text: str, items: list, model: Optional[str] = None) -> InvoiceData:
+        """Table fast path (see AIInvoiceExtractor.parse_pdf_text)"""
+        items = self.extractor._valid_items(items)
+        if len(items) < max(1, config.TABLE_MIN_ITEMS):
+            return await self.parse_with_ai(text, model)
+        data = self.extractor.table_shortcut(text, items)
+        if data is not None:
+            logger.info(f"{len(items)} table line items reconcile with the invoice total, skipping the LLM")
+            return data
+        return await self.complete_json(
+            self.extractor.header_payload(text, items, model),
+            lambda header: self.extractor.merge_table_header(self.extractor.invoice_dict(header), items)
+        )
+
+    async def parse_routed(self, route: dict, parse: Callable[[str], Awaitable[InvoiceData]]) -> InvoiceData:
+        """Routed model first, strong model if the fast one's answer does not parse (see AIInvoiceExtractor.parse_routed)"""
+        try:
+            return await parse(route["model"])
+        except (ValueError, KeyError) as e:
+            if not can_escalate(route):
+                raise
+            logger.warning(f"Fast model answer unusable: {e}")
+            escalate(route, "parse_failed")
+            return await parse(route["model"])
+
+    async def reconcile(self, structured_data: InvoiceData, text: str, route: Optional[dict] = None,
+                        reparse: Optional[Callable[[str], Awaitable[InvoiceData]]] = None):
+        """Local validation, targeted re-ask, then strong-model escalation (see AIInvoiceExtractor.reconcile)"""
+        validation = validate_invoice(structured_data.model_dump())
+        if self.extractor.needs_reask(validation):
+            payload = self.extractor.reask_payload(structured_data.model_dump(), text, validation, route["model"] if route else None)
+            try:
+                async with self._semaphore:
+                    response_json = await self.client.chat_completion(payload)
+            except Exception as e:
+                logger.warning(f"Re-ask failed: {e}")
+            else:
+                structured_data, validation = self.extractor.apply_reask(structured_data, validation, response_json)
+        if reparse is None or validation["ok"] or not can_escalate(route):
+            return structured_data, validation
+        escalate(route, "validation_failed")
+        try:
+            stronger = await reparse(route["model"])
+        except Exception as e:
+            logger.warning(f"Strong model extraction failed: {e}")
+            fall_back(route)
+            return structured_data, validation
+        return self.extractor.pick_escalated(structured_data, validation, stronger, route)
+
+    @timed(DOCUMENT_SECONDS, DOCUMENTS, input_type="pdf")
+    @with_usage
+    async def process_pdf(self, pdf_path, tenant: Optional[str] = None) -> dict:
+        """
+        Full PDF processing flow: Extract text -> AI Parse -> Return dict (path, bytes or file-like).
+        tenant (the user id) selects whose learned vendor templates may be used.
+        """
+        pdf_path = read_input(pdf_path)
+        logger.info(f"Processing PDF: {describe_input(pdf_path)}")
+        file_hash = await self._run_blocking(self.extractor.hash_input, pdf_path)
+        variant = self.extractor.tenant_variant(tenant)
+        result, _ = await self.inflight.do(f"pdf:{file_hash}{variant}", self._process_pdf, pdf_path, file_hash, tenant)
+        return result
+
+    async def _process_pdf(self, pdf_path, file_hash: str, tenant: Optional[str]) -> dict:
+        variant = self.extractor.tenant_variant(tenant)
+        cached = await self._run_blocking(self.extractor._cached_result, file_hash, variant)
+        if cached is not None:
+            return cached
+
+        with STAGE_SECONDS.time(stage="pdf_text", input_type="pdf"):
+            pages = await self._run_blocking(self.extractor.pdf_pages_stage, pdf_path, file_hash)
+        raw_text = join_pages(pages)
+        with STAGE_SECONDS.time(stage="tables", input_type="pdf"):
+            table_items = await self._run_blocking(self.extractor.pdf_table_items_stage, pdf_path, file_hash)
+        items = [item for page in table_items for item in page]
+        with STAGE_SECONDS.time(stage="pdf_words", input_type="pdf"):
+            page_words = await self._run_blocking(self.extractor.pdf_words_stage, pdf_path, pages[:1], tenant)
+        route = route_document(raw_text, "pdf", len(items))
+
+        async def parse(model: str) -> InvoiceData:
+            data = self.extractor.template_result(pages, page_words, items, tenant)
+            return data if data is not None else await self.parse_pdf_text(raw_text, items, model)
+
+        with STAGE_SECONDS.time(stage="parse", input_type="pdf"):
+            structured_data = await self.parse_routed(route, parse)
+        with STAGE_SECONDS.time(stage="validation", input_type="pdf"):
+            structured_data, validation = await self.reconcile(structured_data, raw_text, route, parse)
+        return await self._run_blocking(
+            self.extractor.finish_result, file_hash, structured_data, raw_text, validation, route, variant
+        )
+
+    @timed(DOCUMENT_SECONDS, DOCUMENTS, input_type="image")
+    @with_usage
+    async def extract_from_image(self, image_bytes) -> dict:
+        """OCR an image in the executor, then send the text to DeepSeek for structuring"""
+        logger.info("Starting OCR processing for image...")
+        missing = self.extractor.check_ocr_dependencies()
+        if missing:
+            return missing
+
+        image_bytes = read_input(image_bytes)
+        file_hash = hash_bytes(image_bytes)
+        result, _ = await self.inflight.do(f"image:{file_hash}", self._extract_from_image, image_bytes, file_hash)
+        return result
+
+    async def _extract_from_image(self, image_bytes: bytes, file_hash: str) -> dict:
+        cached = await self._run_blocking(self.extractor._cached_result, file_hash)
+        if cached is not None:
+            return cached
+
+        try:
+            text = await self._run_blocking(self.extractor.image_text_stage, image_bytes, file_hash)
+            route = route_document(text, "image")
+            parse = functools.partial(self.parse_with_ai, text)
+            with STAGE_SECONDS.time(stage="parse", input_type="image"):
+                structured_data = await self.parse_routed(route, parse)
+            with STAGE_SECONDS.time(stage="validation", input_type="image"):
+                structured_data, validation = await self.reconcile(structured_data, text, route, parse)
+            return await self._run_blocking(self.extractor.finish_result, file_hash, structured_data, text, validation, route)
+        except ExtractionError as e:
+            return {"error": str(e)}
+        except Exception as e:
+            logger.error(f"OCR processing failed: {e}")
+            return {"error": f"Image recognition failed: {str(e)}"}
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
@@ -0,0 +1 @@
+"""Offline extraction benchmark: synthetic corpus generator, stubbed LLM and stage timer (see run.py)"""
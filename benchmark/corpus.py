@@ -0,0 +1,209 @@
+"""
+Synthetic invoice corpus: digital PDFs with ruled tables or free-text lines, scanned
+(image-only) PDFs and receipt photos, each written with a ground-truth manifest entry.
+"""
+import json
+import os
+import random
+from datetime import date, timedelta
+from io import BytesIO
+from typing import List, NamedTuple
+
+import cv2
+import numpy as np
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+KINDS = ("table", "text", "scanned", "receipt")
+VENDORS = ("Globex Supplies", "Initech Office Supply", "Umbrella Facilities", "Stark Industrial Parts", "Acme Catering Co")
+PRODUCTS = ("Paper ream A4", "Toner cartridge", "Desk lamp", "USB-C cable", "Coffee beans 1kg", "Stapler",
+            "Whiteboard markers", "Monitor stand", "Cleaning service", "Printer maintenance", "Sandwich platter")
+TAX_RATE = 0.08
+MANIFEST = "manifest.json"
+
+
+class CorpusSpec(NamedTuple):
+    kind: str  # One of KINDS
+    pages: int
+    items: int
+    copies: int = 1
+
+
+# Default matrix: small and item-heavy variants of every input type
+DEFAULT_SPECS = (
+    CorpusSpec("table", 1, 10, 3), CorpusSpec("table", 3, 60, 2),
+    CorpusSpec("text", 1, 10, 3), CorpusSpec("text", 5, 120, 1),
+    CorpusSpec("scanned", 1, 10, 2), CorpusSpec("scanned", 2, 30, 1),
+    CorpusSpec("receipt", 1, 8, 3), CorpusSpec("receipt", 1, 25, 1),
+)
+
+
+def random_invoice(rng: random.Random, items: int, number: int) -> dict:
+    """Ground truth for one invoice; amounts are consistent (items + tax = total)"""
+    lines = []
+    for _ in range(items):
+        quantity = rng.randint(1, 5)
+        unit_price = round(rng.uniform(1, 120), 2)
+        lines.append({"description": rng.choice(PRODUCTS), "quantity": float(quantity), "unit_price": unit_price,
+                      "total_price": round(quantity * unit_price, 2), "category": None})
+    subtotal = round(sum(line["total_price"] for line in lines), 2)
+    tax = round(subtotal * TAX_RATE, 2)
+    issued = date(2024, 1, 1) + timedelta(days=rng.randint(0, 360))
+    return {
+        "vendor_name": rng.choice(VENDORS),
+        "invoice_number": f"INV-{number:06d}",
+        "date": issued.strftime("%m/%d/%Y"),
+        "due_date": (issued + timedelta(days=30)).strftime("%m/%d/%Y"),
+        "items": lines,
+        "tax_amount": tax,
+        "total_amount": round(subtotal + tax, 2),
+        "currency": "USD",
+    }
+
+
+def _page_layout(truth: dict, pages: int) -> List[List[tuple]]:
+    """Per page, the (kind, text columns) rows to draw: header on the first page, totals on the last"""
+    header = [("title", [truth["vendor_name"]]),
+              ("line", [f"Invoice No: {truth['invoice_number']}"]),
+              ("line", [f"Invoice Date: {truth['date']}    Due Date: {truth['due_date']}"]),
+              ("head", ["Description", "Qty", "Unit Price", "Amount"])]
+    rows = [("item", [item["description"], f"{item['quantity']:g}", f"{item['unit_price']:.2f}", f"{item['total_price']:.2f}"])
+            for item in truth["items"]]
+    totals = [("total", [f"Tax: ${truth['tax_amount']:,.2f}"]), ("total", [f"Total: ${truth['total_amount']:,.2f}"])]
+    per_page = -(-len(rows) // pages)
+    layout = []
+    for index in range(pages):
+        page = header if index == 0 else [("head", ["Description", "Qty", "Unit Price", "Amount"])]
+        page = page + rows[index * per_page:(index + 1) * per_page]
+        if index == pages - 1:
+            page = page + totals
+        layout.append(page + [("footer", [f"Page {index + 1} of {pages}"])])
+    return layout
+
+
+COLUMNS = (50, 330, 400, 490)  # x positions (pt) of the item columns
+
+
+def digital_pdf(truth: dict, pages: int, ruled: bool) -> bytes:
+    """Text-layer PDF; ruled=True draws grid lines so pdfplumber detects the item table"""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    for page in _page_layout(truth, pages):
+        y = 750
+        table_top = None
+        for kind, cells in page:
+            if kind == "title":
+                c.setFont("Helvetica-Bold", 16)
+                c.drawString(50, y, cells[0])
+                c.setFont("Helvetica", 10)
+            elif kind in ("head", "item"):
+                table_top = y + 12 if table_top is None else table_top
+                for x, cell in zip(COLUMNS, cells):
+                    c.drawString(x + 3, y, cell)
+            elif kind == "footer":
+                c.drawString(280, 30, cells[0])
+                continue
+            else:
+                if table_top is not None:
+                    if ruled:
+                        _draw_grid(c, table_top, y + 12)
+                    table_top = None
+                    y -= 8
+                c.drawString(COLUMNS[1] if kind == "total" else COLUMNS[0], y, cells[0])
+            y -= 16
+        if table_top is not None and ruled:
+            _draw_grid(c, table_top, y + 12)
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def _draw_grid(c, top: float, bottom: float):
+    for y in np.arange(top, bottom - 1, -16):
+        c.line(COLUMNS[0], y, 560, y)
+    c.line(COLUMNS[0], bottom, 560, bottom)
+    for x in COLUMNS + (560,):
+        c.line(x, top, x, bottom)
+
+
+def _render_text_image(lines: List[str], width: int, line_height: int, scale: float, margin: int = 40) -> np.ndarray:
+    image = np.full((margin * 2 + line_height * len(lines), width), 255, np.uint8)
+    for index, line in enumerate(lines):
+        cv2.putText(image, line, (margin, margin + line_height * (index + 1) - 8), cv2.FONT_HERSHEY_SIMPLEX, scale, 0, 2)
+    return image
+
+
+def _degrade(image: np.ndarray, rng: random.Random, angle: float) -> np.ndarray:
+    """Scanner/camera look: slight rotation, blur and noise"""
+    h, w = image.shape
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    image = cv2.warpAffine(image, matrix, (w, h), borderValue=255)
+    image = cv2.GaussianBlur(image, (3, 3), 0)
+    noise = np.random.default_rng(rng.randint(0, 2 ** 31)).normal(0, 8, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def _text_lines(page: List[tuple]) -> List[str]:
+    return ["   ".join(cells) for _, cells in page]
+
+
+def scanned_pdf(truth: dict, pages: int, rng: random.Random) -> bytes:
+    """Image-only PDF: every page is a degraded 150 DPI bitmap, no text layer"""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    for page in _page_layout(truth, pages):
+        image = _render_text_image(_text_lines(page), 1275, 42, 0.9)
+        image = _degrade(image, rng, rng.uniform(-2, 2))
+        ok, png = cv2.imencode(".png", image)
+        scale = min(letter[0] / image.shape[1], letter[1] / image.shape[0])  # Fit the page, keep the aspect ratio
+        c.drawImage(ImageReader(BytesIO(png.tobytes())), 0, letter[1] - image.shape[0] * scale,
+                    width=image.shape[1] * scale, height=image.shape[0] * scale)
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def receipt_photo(truth: dict, rng: random.Random) -> bytes:
+    """Phone-style JPEG: a narrow receipt on a darker table, rotated a few degrees, ~12MP"""
+    lines = [truth["vendor_name"], truth["invoice_number"], truth["date"]]
+    lines += [f"{item['description'][:16]:<16} {item['total_price']:>8.2f}" for item in truth["items"]]
+    lines += [f"TAX {truth['tax_amount']:>8.2f}", f"TOTAL {truth['total_amount']:>8.2f}"]
+    receipt = _render_text_image(lines, 900, 54, 1.1)
+    h, w = receipt.shape
+    photo = np.full((max(4000, h + 600), 3000), 70, np.uint8)
+    top, left = (photo.shape[0] - h) // 2, (photo.shape[1] - w) // 2
+    photo[top:top + h, left:left + w] = receipt
+    photo = _degrade(photo, rng, rng.uniform(-6, 6))
+    ok, jpeg = cv2.imencode(".jpg", cv2.cvtColor(photo, cv2.COLOR_GRAY2BGR), [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return jpeg.tobytes()
+
+
+def generate_corpus(directory: str, specs=DEFAULT_SPECS, seed: int = 7) -> List[dict]:
+    """Write every spec's documents into directory, plus manifest.json with their ground truth"""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    manifest = []
+    for spec in specs:
+        if spec.kind not in KINDS:
+            raise ValueError(f"Unknown corpus kind: {spec.kind}")
+        for copy in range(spec.copies):
+            truth = random_invoice(rng, spec.items, len(manifest) + 1)
+            name = f"{spec.kind}_{spec.pages}p_{spec.items}i_{copy}"
+            if spec.kind == "receipt":
+                name, content = f"{name}.jpg", receipt_photo(truth, rng)
+            elif spec.kind == "scanned":
+                name, content = f"{name}.pdf", scanned_pdf(truth, spec.pages, rng)
+            else:
+                name, content = f"{name}.pdf", digital_pdf(truth, spec.pages, ruled=spec.kind == "table")
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(content)
+            manifest.append({"file": name, "kind": spec.kind, "pages": spec.pages, "truth": truth})
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(directory: str) -> List[dict]:
+    with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,253 @@
+"""
+Extraction benchmark: times every pipeline stage over a synthetic corpus, offline,
+and writes p50/p95 per stage plus end-to-end throughput to a JSON results file.
+
+    python -m benchmark.run --corpus bench_corpus --generate --output results.json
+    python -m benchmark.run --corpus bench_corpus --compare results.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from benchmark.corpus import generate_corpus, load_manifest
+from benchmark.stub_llm import StubDeepSeekClient
+from invoice_export import generate_excel, generate_quickbooks_csv
+from invoice_extractor import AIInvoiceExtractor
+from invoice_validation import validate_invoice
+from pdf_text import has_usable_text, join_pages
+from table_extractor import table_items_from_pages
+
+logger = logging.getLogger("benchmark")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(samples: List[float]) -> dict:
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50), 2),
+        "p95_ms": round(percentile(samples, 95), 2),
+        "mean_ms": round(sum(samples) / len(samples), 2),
+        "max_ms": round(max(samples), 2),
+    }
+
+
+class StageTimer:
+    """Collects wall-clock samples (ms) per stage"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    @contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[stage].append((time.perf_counter() - start) * 1000)
+
+    def summary(self) -> dict:
+        return {stage: summarize(values) for stage, values in self.samples.items()}
+
+
+def _ocr(extractor: AIInvoiceExtractor, timer: StageTimer, image) -> str:
+    with timer.time("ocr"):
+        return "\n".join(extractor.ocr_pool.readtext(image))
+
+
+def bench_stages(extractor: AIInvoiceExtractor, path: str, timer: StageTimer, ocr_available: bool):
+    """Run one document through the pipeline stage by stage, timing each"""
+    import numpy as np
+    from image_preprocess import prepare_for_ocr, preprocess_image
+
+    with open(path, "rb") as f:
+        content = f.read()
+    items = []
+    if path.lower().endswith(".pdf"):
+        with timer.time("text_extraction"):
+            pages = extractor.extract_pages_from_pdf(content)
+        with timer.time("table_extraction"):
+            items = [item for page in table_items_from_pages(extractor.pdf_text.page_tables(content)) for item in page]
+        scanned = [index for index, text in enumerate(pages) if not has_usable_text(text)]
+        if scanned:
+            with timer.time("rasterize"):
+                rendered = list(extractor.pdf_text.render_pages(
+                    content, scanned, config.PDF_OCR_TARGET_SIDE, config.PDF_OCR_MIN_DPI, config.PDF_OCR_MAX_DPI
+                ))
+            for index, page_image in rendered:
+                with timer.time("preprocessing"):
+                    image = prepare_for_ocr(np.asarray(page_image), config.OCR_TARGET_TEXT_HEIGHT, config.OCR_DESKEW, crop=False)
+                if ocr_available:
+                    pages[index] = _ocr(extractor, timer, image)
+        text = join_pages(pages)
+    else:
+        with timer.time("preprocessing"):
+            image, _ = preprocess_image(content, config.OCR_TARGET_TEXT_HEIGHT, config.OCR_DECODE_MAX_SIDE,
+                                        config.OCR_DESKEW, config.OCR_CROP_RECEIPT)
+        text = _ocr(extractor, timer, image) if ocr_available else ""
+
+    if not text.strip():
+        return  # Scans and photos without an OCR engine installed: nothing for the LLM stages
+    with timer.time("prompt_build"):
+        extractor.build_payload(text)
+    with timer.time("llm"):
+        data = extractor.parse_pdf_text(text, items) if items else extractor.parse_with_ai(text)
+    data = data.model_dump()
+    with timer.time("validation"):
+        validate_invoice(data)
+    with timer.time("export_csv"):
+        generate_quickbooks_csv(data)
+    with timer.time("export_xlsx"):
+        generate_excel(data)
+
+
+def is_correct(result: dict, truth: dict) -> bool:
+    """Same total and item count as the ground truth"""
+    if result.get("error") or result.get("total_amount") is None:
+        return False
+    return abs(result["total_amount"] - truth["total_amount"]) < 0.01 and len(result.get("items") or []) == len(truth["items"])
+
+
+def bench_end_to_end(extractor: AIInvoiceExtractor, corpus: str, manifest: List[dict], workers: int) -> dict:
+    """Full process_pdf / extract_from_image per document, `workers` documents at a time"""
+    by_kind: Dict[str, List[float]] = defaultdict(list)
+    outcomes = []
+
+    def run(entry: dict):
+        path = os.path.join(corpus, entry["file"])
+        start = time.perf_counter()
+        try:
+            if path.lower().endswith(".pdf"):
+                result = extractor.process_pdf(path)
+            else:
+                with open(path, "rb") as f:
+                    result = extractor.extract_from_image(f.read())
+        except Exception as e:
+            result = {"error": str(e)}
+        return entry, (time.perf_counter() - start) * 1000, result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for entry, elapsed, result in pool.map(run, manifest):
+            by_kind[entry["kind"]].append(elapsed)
+            outcomes.append((entry, result))
+    wall = time.perf_counter() - started
+
+    return {
+        "documents": len(manifest),
+        "workers": workers,
+        "wall_s": round(wall, 3),
+        "throughput_docs_per_s": round(len(manifest) / wall, 3) if wall else None,
+        "errors": sum(1 for _, result in outcomes if result.get("error")),
+        "correct": sum(1 for entry, result in outcomes if is_correct(result, entry["truth"])),
+        "latency": summarize([ms for values in by_kind.values() for ms in values]),
+        "by_kind": {kind: summarize(values) for kind, values in sorted(by_kind.items())},
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(current: dict, previous: dict):
+    """Print p50/p95 changes per stage against an earlier results file"""
+    print(f"{'stage':<18}{'p50 ms':>12}{'Δ':>9}{'p95 ms':>12}{'Δ':>9}")
+    for stage, stats in current["stages"].items():
+        before = previous.get("stages", {}).get(stage)
+        deltas = [
+            f"{(stats[key] - before[key]) / before[key] * 100:+.0f}%" if before and before[key] else "n/a"
+            for key in ("p50_ms", "p95_ms")
+        ]
+        print(f"{stage:<18}{stats['p50_ms']:>12.1f}{deltas[0]:>9}{stats['p95_ms']:>12.1f}{deltas[1]:>9}")
+    now, then = current["end_to_end"]["throughput_docs_per_s"], previous.get("end_to_end", {}).get("throughput_docs_per_s")
+    print(f"throughput: {now} docs/s (was {then})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the invoice extraction pipeline offline.")
+    parser.add_argument("--corpus", default="bench_corpus", help="Corpus directory (with manifest.json)")
+    parser.add_argument("--generate", action="store_true", help="(Re)generate the synthetic corpus first")
+    parser.add_argument("--seed", type=int, default=7, help="Corpus generator seed")
+    parser.add_argument("--iterations", type=int, default=3, help="Stage-timing passes over the corpus")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent documents in the end-to-end pass")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0, help="Median latency of the stubbed LLM")
+    parser.add_argument("--output", "-o", default="benchmark_results.json", help="Results JSON file")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    args = parse_args(argv)
+
+    manifest = generate_corpus(args.corpus, seed=args.seed) if args.generate else load_manifest(args.corpus)
+    extractor = AIInvoiceExtractor(prewarm_ocr=False)
+    # Measure the pipeline itself: no cached results, no learned vendor layouts, no network
+    extractor.cache = None
+    extractor.templates = None
+    extractor.client = StubDeepSeekClient(manifest, latency_ms=args.llm_latency_ms)
+    ocr_available = extractor.check_ocr_dependencies() is None
+    if ocr_available:
+        extractor.ocr_pool.warm_up(background=False)
+    else:
+        print("EasyOCR is not installed: OCR stages are skipped, scans and photos count as errors end to end.", file=sys.stderr)
+
+    timer = StageTimer()
+    for iteration in range(args.iterations):
+        for entry in manifest:
+            bench_stages(extractor, os.path.join(args.corpus, entry["file"]), timer, ocr_available)
+        print(f"Stage pass {iteration + 1}/{args.iterations} done", file=sys.stderr)
+    end_to_end = bench_end_to_end(extractor, args.corpus, manifest, args.workers)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus": args.corpus,
+            "documents": len(manifest),
+            "iterations": args.iterations,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_calls": extractor.client.calls,
+            "ocr_available": ocr_available,
+        },
+        "stages": timer.summary(),
+        "end_to_end": end_to_end,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+    else:
+        print(json.dumps(results["stages"], indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
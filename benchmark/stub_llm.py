@@ -0,0 +1,65 @@
+"""Offline stand-in for DeepSeekClient that answers from the corpus ground truth"""
+import json
+import math
+import random
+import threading
+import time
+from typing import Iterator, List
+
+from invoice_chunking import estimate_tokens
+
+
+class StubDeepSeekClient:
+    """
+    Same interface as llm_client.DeepSeekClient. Each call sleeps for a log-normal
+    latency (median latency_ms) and returns the ground truth of the invoice whose
+    number appears in the prompt; for chunks without the number, only the items
+    whose amounts appear in the chunk are returned.
+    """
+
+    def __init__(self, manifest: List[dict], latency_ms: float = 800.0, sigma: float = 0.4, seed: int = 0):
+        self.truths = [entry["truth"] for entry in manifest]
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _sleep(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency_ms * math.exp(self._rng.gauss(0, self.sigma)) if self.latency_ms else 0
+        time.sleep(delay / 1000)
+
+    def answer(self, payload: dict) -> str:
+        text = payload["messages"][-1]["content"]
+        for truth in self.truths:
+            if truth["invoice_number"] in text:
+                return json.dumps(truth)
+        # A chunk of a long invoice: the invoice whose item amounts it mentions most
+        best, best_items = None, []
+        for truth in self.truths:
+            items = [item for item in truth["items"] if f"{item['total_price']:.2f}" in text]
+            if len(items) > len(best_items):
+                best, best_items = truth, items
+        answer = {field: None for field in ("vendor_name", "invoice_number", "date", "due_date", "total_amount", "tax_amount")}
+        answer["items"] = best_items
+        return json.dumps(answer)
+
+    def _usage(self, payload: dict, content: str) -> dict:
+        prompt = sum(estimate_tokens(message["content"]) for message in payload["messages"])
+        return {"prompt_tokens": prompt, "completion_tokens": estimate_tokens(content), "total_tokens": prompt + estimate_tokens(content)}
+
+    def chat_completion(self, payload: dict) -> dict:
+        self._sleep()
+        content = self.answer(payload)
+        return {"model": payload.get("model"), "choices": [{"message": {"content": content}}], "usage": self._usage(payload, content)}
+
+    def stream_chat_completion(self, payload: dict) -> Iterator[dict]:
+        self._sleep()
+        content = self.answer(payload)
+        for start in range(0, len(content), 16):
+            yield {"choices": [{"delta": {"content": content[start:start + 16]}}]}
+
+    def close(self):
+        pass
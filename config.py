@@ -5,10 +5,110 @@ load_dotenv()
 
 # DeepSeek API Configuration
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")  # e.g. http://127.0.0.1:8765 for mock_deepseek.py
+DEEPSEEK_POOL_SIZE = int(os.getenv("DEEPSEEK_POOL_SIZE", "10"))  # Max keep-alive connections
+DEEPSEEK_CONNECT_TIMEOUT = float(os.getenv("DEEPSEEK_CONNECT_TIMEOUT", "5"))  # Seconds
+DEEPSEEK_READ_TIMEOUT = float(os.getenv("DEEPSEEK_READ_TIMEOUT", "120"))  # Seconds
+DEEPSEEK_MAX_RETRIES = int(os.getenv("DEEPSEEK_MAX_RETRIES", "3"))
+DEEPSEEK_BACKOFF_BASE = float(os.getenv("DEEPSEEK_BACKOFF_BASE", "1.0"))  # Seconds, doubled per attempt
+DEEPSEEK_BACKOFF_MAX = float(os.getenv("DEEPSEEK_BACKOFF_MAX", "30"))  # Seconds
+STREAM_RESULTS = os.getenv("STREAM_RESULTS", "true").lower() == "true"  # Stream fields into the results panel
+# Hedging: resend a non-streaming request that has not answered after the observed p95, take the first answer
+DEEPSEEK_HEDGE_ENABLED = os.getenv("DEEPSEEK_HEDGE_ENABLED", "false").lower() == "true"
+DEEPSEEK_HEDGE_PERCENTILE = float(os.getenv("DEEPSEEK_HEDGE_PERCENTILE", "95"))
+DEEPSEEK_HEDGE_MIN_SAMPLES = int(os.getenv("DEEPSEEK_HEDGE_MIN_SAMPLES", "20"))  # Latencies observed before the percentile is trusted
+DEEPSEEK_HEDGE_INITIAL_DELAY = float(os.getenv("DEEPSEEK_HEDGE_INITIAL_DELAY", "20"))  # Seconds, until then
+DEEPSEEK_HEDGE_MIN_DELAY = float(os.getenv("DEEPSEEK_HEDGE_MIN_DELAY", "2"))  # Seconds, never hedge sooner
+# Streams (STREAM_RESULTS) are never hedged: one without a chunk after this long is restarted instead (0 = off)
+DEEPSEEK_STREAM_FIRST_CHUNK_TIMEOUT = float(os.getenv("DEEPSEEK_STREAM_FIRST_CHUNK_TIMEOUT", "30"))  # Seconds
+# Circuit breaker: fail fast while too many recent attempts fail (timeouts, connection errors, 429/5xx)
+DEEPSEEK_BREAKER_ENABLED = os.getenv("DEEPSEEK_BREAKER_ENABLED", "true").lower() == "true"
+DEEPSEEK_BREAKER_WINDOW = float(os.getenv("DEEPSEEK_BREAKER_WINDOW", "60"))  # Seconds of attempt outcomes considered
+DEEPSEEK_BREAKER_MIN_CALLS = int(os.getenv("DEEPSEEK_BREAKER_MIN_CALLS", "10"))
+DEEPSEEK_BREAKER_ERROR_RATE = float(os.getenv("DEEPSEEK_BREAKER_ERROR_RATE", "0.5"))
+DEEPSEEK_BREAKER_COOLDOWN = float(os.getenv("DEEPSEEK_BREAKER_COOLDOWN", "30"))  # Seconds open before a probe request
+DEEPSEEK_REPLAY_MODE = os.getenv("DEEPSEEK_REPLAY_MODE", "off").lower()  # off, record or replay (llm_replay.py)
+DEEPSEEK_CASSETTE_DIR = os.getenv("DEEPSEEK_CASSETTE_DIR", ".llm_cassettes")  # Recorded responses, one file per request
 
 # QuickBooks Configuration (Placeholder)
 QUICKBOOKS_CLIENT_ID = os.getenv("QUICKBOOKS_CLIENT_ID")
 QUICKBOOKS_CLIENT_SECRET = os.getenv("QUICKBOOKS_CLIENT_SECRET")
 QUICKBOOKS_REALM_ID = os.getenv("QUICKBOOKS_REALM_ID")
 QUICKBOOKS_ENV = os.getenv("QUICKBOOKS_ENV", "sandbox")  # sandbox or production
+
+# OCR Configuration
+OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "ch_sim,en").split(",")
+OCR_USE_GPU = os.getenv("OCR_USE_GPU", "false").lower() == "true"
+OCR_POOL_SIZE = int(os.getenv("OCR_POOL_SIZE", "2"))  # Readers kept in memory (= concurrent OCR jobs)
+OCR_PREWARM = os.getenv("OCR_PREWARM", "true").lower() == "true"  # Load readers in background at startup
+OCR_BACKEND = os.getenv("OCR_BACKEND", "process")  # "process": OCR in worker processes, "thread": readers in this process
+OCR_WORKER_TORCH_THREADS = int(os.getenv("OCR_WORKER_TORCH_THREADS", str(max(1, (os.cpu_count() or 1) // OCR_POOL_SIZE))))  # Intra-op threads per OCR worker
+OCR_TARGET_TEXT_HEIGHT = int(os.getenv("OCR_TARGET_TEXT_HEIGHT", "28"))  # Images are scaled so characters are about this tall (px)
+OCR_DECODE_MAX_SIDE = int(os.getenv("OCR_DECODE_MAX_SIDE", "2000"))  # Photos are decoded at the smallest 1/2, 1/4 or 1/8 size with a long side of at least this (px)
+OCR_DESKEW = os.getenv("OCR_DESKEW", "true").lower() == "true"
+OCR_CROP_RECEIPT = os.getenv("OCR_CROP_RECEIPT", "true").lower() == "true"  # Crop photos to the paper before OCR
+
+# Extraction Cache (raw text + parsed results, keyed by SHA-256 of the uploaded file)
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", ".extraction_cache")
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# Batch Mode (main.py --batch)
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))  # Keep <= DEEPSEEK_POOL_SIZE to avoid waiting on connections
+
+# Async Extraction (async_invoice_extractor.py)
+ASYNC_MAX_CONCURRENCY = int(os.getenv("ASYNC_MAX_CONCURRENCY", "32"))  # In-flight LLM calls per process
+
+# PDF Text Extraction
+PDF_PARALLEL_WORKERS = int(os.getenv("PDF_PARALLEL_WORKERS", str(min(4, os.cpu_count() or 1))))  # Processes for large PDFs
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))  # Smaller PDFs stay in-process
+SPLIT_MAX_WORKERS = int(os.getenv("SPLIT_MAX_WORKERS", "4"))  # Concurrent LLM calls per multi-invoice PDF
+
+# Long Invoice Chunking (map-reduce over line chunks)
+LLM_CHUNK_TOKEN_BUDGET = int(os.getenv("LLM_CHUNK_TOKEN_BUDGET", "12000"))  # Estimated input tokens per chunk, 0 disables (only statement-sized documents exceed it)
+LLM_CHUNK_OVERLAP_LINES = int(os.getenv("LLM_CHUNK_OVERLAP_LINES", "3"))
+CHUNK_MAX_WORKERS = int(os.getenv("CHUNK_MAX_WORKERS", "4"))  # Concurrent chunk extractions per invoice
+
+# Table Fast Path (digital PDFs: line items from pdfplumber tables, LLM for header fields only)
+TABLE_EXTRACTION_ENABLED = os.getenv("TABLE_EXTRACTION_ENABLED", "true").lower() == "true"
+TABLE_MIN_ITEMS = int(os.getenv("TABLE_MIN_ITEMS", "2"))  # Fewer table rows than this falls back to the full LLM parse
+# No LLM call when items + tax match the printed total and vendor, number and date were all read (items get no category)
+TABLE_SKIP_LLM_WHEN_RECONCILED = os.getenv("TABLE_SKIP_LLM_WHEN_RECONCILED", "false").lower() == "true"
+
+# Vendor Layout Templates (learned from verified results, zero-LLM extraction for repeat vendors)
+VENDOR_TEMPLATES_ENABLED = os.getenv("VENDOR_TEMPLATES_ENABLED", "true").lower() == "true"
+VENDOR_TEMPLATE_DIR = os.getenv("VENDOR_TEMPLATE_DIR", ".vendor_templates")  # One subdirectory per user: templates never cross accounts
+VENDOR_TEMPLATE_MIN_SIMILARITY = float(os.getenv("VENDOR_TEMPLATE_MIN_SIMILARITY", "0.6"))  # Layout signature overlap needed to reuse a template
+
+# Scanned PDF Pages (pages without a usable text layer are rasterized and OCR'd)
+PDF_OCR_FALLBACK = os.getenv("PDF_OCR_FALLBACK", "true").lower() == "true"
+PDF_OCR_TARGET_SIDE = int(os.getenv("PDF_OCR_TARGET_SIDE", "2500"))  # Render DPI is picked so the page's long side is ~this many px
+PDF_OCR_MIN_DPI = int(os.getenv("PDF_OCR_MIN_DPI", "100"))
+PDF_OCR_MAX_DPI = int(os.getenv("PDF_OCR_MAX_DPI", "300"))
+
+# Model Routing (see model_router.py: simple documents to the fast model, complex or failed ones to the strong model)
+LLM_ROUTING_ENABLED = os.getenv("LLM_ROUTING_ENABLED", "true").lower() == "true"  # false: everything uses the fast model
+DEEPSEEK_FAST_MODEL = os.getenv("DEEPSEEK_FAST_MODEL", "deepseek-chat")
+DEEPSEEK_STRONG_MODEL = os.getenv("DEEPSEEK_STRONG_MODEL", "deepseek-reasoner")
+LLM_ROUTE_STRONG_SCORE = int(os.getenv("LLM_ROUTE_STRONG_SCORE", "2"))  # Complexity points that select the strong model
+LLM_ROUTE_MAX_FAST_TOKENS = int(os.getenv("LLM_ROUTE_MAX_FAST_TOKENS", "1500"))  # Longer text scores 2 points
+LLM_ROUTE_MAX_FAST_LINES = int(os.getenv("LLM_ROUTE_MAX_FAST_LINES", "60"))  # More lines scores 1 point
+LLM_ROUTE_TABLE_LINES = int(os.getenv("LLM_ROUTE_TABLE_LINES", "20"))  # Amount-bearing lines that make a dense table in PDF text, 1 point
+LLM_ROUTE_ESCALATE = os.getenv("LLM_ROUTE_ESCALATE", "true").lower() == "true"  # Redo fast-model failures on the strong model
+
+# Result Validation (local arithmetic checks, targeted re-ask of the suspect values on failure)
+RECONCILE_REASK = os.getenv("RECONCILE_REASK", "true").lower() == "true"
+LLM_JSON_REASK = os.getenv("LLM_JSON_REASK", "true").lower() == "true"  # Ask again when a malformed answer cannot be repaired locally
+# max_tokens when asking again after a cut-off answer: each model's output limit, never below the original request's
+LLM_TRUNCATED_MAX_TOKENS = int(os.getenv("LLM_TRUNCATED_MAX_TOKENS", "8192"))  # deepseek-chat
+LLM_TRUNCATED_MAX_TOKENS_REASONER = int(os.getenv("LLM_TRUNCATED_MAX_TOKENS_REASONER", "65536"))  # deepseek-reasoner (default 32K)
+
+# LLM Cost Accounting (USD per million tokens; deepseek-chat list prices, update when pricing changes)
+DEEPSEEK_PRICE_INPUT = float(os.getenv("DEEPSEEK_PRICE_INPUT", "0.28"))  # Prompt tokens, context cache miss
+DEEPSEEK_PRICE_CACHED_INPUT = float(os.getenv("DEEPSEEK_PRICE_CACHED_INPUT", "0.028"))  # Prompt tokens, context cache hit
+DEEPSEEK_PRICE_OUTPUT = float(os.getenv("DEEPSEEK_PRICE_OUTPUT", "0.42"))
+
+# Metrics (Prometheus text format, see metrics.py)
+METRICS_FILE = os.getenv("METRICS_FILE", "")  # e.g. a node_exporter textfile collector path; empty = not written
+METRICS_FILE_INTERVAL = float(os.getenv("METRICS_FILE_INTERVAL", "15"))  # Seconds between rewrites of METRICS_FILE
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Serve /metrics on this port; 0 = no endpoint
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+TEXT_STAGE = "text"
+PAGES_STAGE = "pages"
+TABLES_STAGE = "tables"
+PARSED_STAGE = "parsed"
+
+
+def hash_bytes(data) -> str:
+    """SHA-256 hex digest of the uploaded file content (the cache's content address)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Content-addressed, size-bounded on-disk cache for the two extraction stages.
+    - text stage:   file hash (+ text pipeline version) -> raw text from OCR, or per-page PDF text
+    - tables stage: file hash (+ text pipeline version) -> per-page line items read from PDF tables
+    - parsed stage: file hash + prompt/schema version    -> InvoiceData dict
+    Keeping the stages apart means a prompt change only re-runs the LLM, not OCR.
+    Least recently used entries (by file mtime, refreshed on every hit) are evicted
+    once the directory grows beyond max_bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(os.path.getsize(p) for p, _ in self._entries())
+
+    def _path(self, stage: str, *key_parts: str) -> str:
+        key = hashlib.sha256(":".join(key_parts).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, stage, key[:2], f"{key}.json")
+
+    def _entries(self):
+        """Yield (path, mtime) for every cached entry"""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        yield path, os.path.getmtime(path)
+                    except OSError:
+                        continue
+
+    def _read(self, path: str):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # Mark as recently used
+            return value
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+    def _write(self, path: str, value):
+        """Best effort: a full disk or an unserializable value is logged, never raised to the extraction"""
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+            # Write to a temp file then rename, so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            with self._lock:
+                previous = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(tmp_path, path)
+                tmp_path = None
+                self._total_bytes += len(data) - previous
+                over_budget = self._total_bytes > self.max_bytes
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not write cache entry {path}: {e}")
+            if tmp_path is not None:
+                self._unlink(tmp_path)
+            return
+        if over_budget:
+            self._evict()
+
+    def _unlink(self, path: str) -> int:
+        """Delete one file, returning its size; a file already gone (another eviction) counts as 0"""
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.warning(f"Could not remove cache entry {path}: {e}")
+            return 0
+
+    def _remove(self, path: str):
+        with self._lock:
+            self._total_bytes -= self._unlink(path)
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its budget"""
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        # Under the lock: concurrent writers wait instead of evicting the same entries twice
+        with self._lock:
+            for path, _ in sorted(self._entries(), key=lambda entry: entry[1]):
+                if self._total_bytes <= target:
+                    break
+                self._total_bytes -= self._unlink(path)
+                evicted += 1
+            total_bytes = self._total_bytes
+        logger.info(f"Extraction cache evicted {evicted} entries ({total_bytes} bytes in use).")
+
+    def get_text(self, file_hash: str, pipeline_version: str) -> Optional[str]:
+        entry = self._read(self._path(TEXT_STAGE, pipeline_version, file_hash))
+        return entry.get("text") if entry else None
+
+    def put_text(self, file_hash: str, pipeline_version: str, text: str):
+        self._write(self._path(TEXT_STAGE, pipeline_version, file_hash), {"text": text})
+
+    def get_pages(self, file_hash: str, pipeline_version: str) -> Optional[List[str]]:
+        entry = self._read(self._path(PAGES_STAGE, pipeline_version, file_hash))
+        return entry.get("pages") if entry else None
+
+    def put_pages(self, file_hash: str, pipeline_version: str, pages: List[str]):
+        self._write(self._path(PAGES_STAGE, pipeline_version, file_hash), {"pages": pages})
+
+    def get_table_items(self, file_hash: str, pipeline_version: str) -> Optional[List[List[dict]]]:
+        entry = self._read(self._path(TABLES_STAGE, pipeline_version, file_hash))
+        return entry.get("items") if entry else None
+
+    def put_table_items(self, file_hash: str, pipeline_version: str, items: List[List[dict]]):
+        self._write(self._path(TABLES_STAGE, pipeline_version, file_hash), {"items": items})
+
+    def get_parsed(self, file_hash: str, prompt_version: str):
+        entry = self._read(self._path(PARSED_STAGE, prompt_version, file_hash))
+        return entry.get("data") if entry else None
+
+    def put_parsed(self, file_hash: str, prompt_version: str, data):
+        self._write(self._path(PARSED_STAGE, prompt_version, file_hash), {"data": data})
@@ -0,0 +1,173 @@
+import io
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# cv2 reduced-resolution decode flags: JPEGs are decoded directly at 1/2, 1/4 or 1/8 size
+REDUCED_DECODE_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+# Working size for layout analysis (crop, deskew, text height); the full image is only touched to apply results
+ANALYSIS_SIDE = 1000
+SKEW_ANALYSIS_SIDE = 600  # The skew search rotates its copy ~60 times, keep it small
+MIN_SCALE, MAX_SCALE = 0.25, 3.0
+
+
+def image_size(image_bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from the image header without decoding the pixels"""
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def decode_image(image_bytes, max_side: int) -> Optional[np.ndarray]:
+    """
+    Decode to BGR at the largest reduction (1/2, 1/4 or 1/8) that keeps the long side at or
+    above max_side, so a 12MP photo (4032x3024) is decoded and held at 2016x1512.
+    Images with a long side under 2 * max_side are decoded at full size.
+    EXIF orientation is applied by cv2.imdecode.
+    """
+    buffer = np.frombuffer(image_bytes, np.uint8)
+    flags = cv2.IMREAD_COLOR
+    size = image_size(image_bytes)
+    if size and max_side:
+        for factor in (8, 4, 2):
+            if max(size) / factor >= max_side:
+                flags = REDUCED_DECODE_FLAGS[factor]
+                break
+    return cv2.imdecode(buffer, flags)
+
+
+def _analysis_copy(gray: np.ndarray, side: int = ANALYSIS_SIDE) -> Tuple[np.ndarray, float]:
+    """Downscaled copy for analysis and the factor mapping it back to full size"""
+    scale = min(1.0, side / max(gray.shape))
+    if scale == 1.0:
+        return gray, 1.0
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), 1 / scale
+
+
+def crop_to_receipt(gray: np.ndarray) -> np.ndarray:
+    """
+    Crop a photo to the receipt: the largest bright region (paper against a darker table).
+    Left unchanged when no region covers a plausible share of the frame.
+    """
+    small, back = _analysis_copy(gray)
+    blurred = cv2.GaussianBlur(small, (5, 5), 0)
+    _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((15, 15), np.uint8))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return gray
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    share = (w * h) / float(small.shape[0] * small.shape[1])
+    if not 0.15 <= share <= 0.9:
+        return gray
+    margin = int(0.02 * max(small.shape))
+    x0, y0 = int(max(0, x - margin) * back), int(max(0, y - margin) * back)
+    x1, y1 = int(min(small.shape[1], x + w + margin) * back), int(min(small.shape[0], y + h + margin) * back)
+    return gray[y0:y1, x0:x1]
+
+
+def _text_mask(gray: np.ndarray) -> np.ndarray:
+    """Dark-on-light text pixels as a binary mask (local threshold: robust to shadows and dark borders)"""
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 15)
+
+
+def _profile_score(mask: np.ndarray, angle: float) -> float:
+    """Variance of the row sums of the mask rotated by angle: peaks when text lines are horizontal"""
+    h, w = mask.shape
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    rotated = cv2.warpAffine(mask, matrix, (w, h), flags=cv2.INTER_NEAREST, borderValue=0)
+    return float(np.var(rotated.sum(axis=1, dtype=np.float64)))
+
+
+def skew_angle(gray: np.ndarray, max_angle: float = 20.0) -> float:
+    """
+    Skew of the text lines in degrees, by projection profile: the rotation that makes
+    row sums of the text mask most uneven. Coarse 1 degree search, then 0.1 degree refinement.
+    """
+    small, _ = _analysis_copy(gray, SKEW_ANALYSIS_SIDE)
+    mask = _text_mask(small)
+    best = max(np.arange(-max_angle, max_angle + 1), key=lambda a: _profile_score(mask, a))
+    best = max(np.arange(best - 1, best + 1.01, 0.1), key=lambda a: _profile_score(mask, a))
+    return round(float(best), 1)
+
+
+def rotate(gray: np.ndarray, angle: float) -> np.ndarray:
+    """Rotate by angle degrees (counter-clockwise), growing the canvas and repeating the edge pixels"""
+    h, w = gray.shape
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_w, new_h = int(h * sin + w * cos), int(h * cos + w * sin)
+    matrix[0, 2] += new_w / 2 - w / 2
+    matrix[1, 2] += new_h / 2 - h / 2
+    return cv2.warpAffine(gray, matrix, (new_w, new_h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def text_height(gray: np.ndarray) -> Optional[float]:
+    """Median character height in pixels, from connected components of the text mask"""
+    small, back = _analysis_copy(gray)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(_text_mask(small), connectivity=8)
+    heights = [
+        stats[i, cv2.CC_STAT_HEIGHT] for i in range(1, count)
+        if 3 <= stats[i, cv2.CC_STAT_HEIGHT] <= small.shape[0] / 8
+        and 0.1 <= stats[i, cv2.CC_STAT_WIDTH] / stats[i, cv2.CC_STAT_HEIGHT] <= 3
+    ]
+    if len(heights) < 10:
+        return None
+    return float(np.median(heights)) * back
+
+
+def _timed(timings: Dict[str, float], step: str, func, *args):
+    start = time.perf_counter()
+    value = func(*args)
+    timings[step] = round((time.perf_counter() - start) * 1000, 1)
+    return value
+
+
+def prepare_for_ocr(img: np.ndarray, target_text_height: int, deskew: bool = True, crop: bool = True,
+                    timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """
+    Receipt crop, deskew, rescale so characters are about target_text_height pixels tall,
+    grayscale + CLAHE. Accepts a BGR or grayscale image; step timings (ms) go into `timings`.
+    """
+    timings = {} if timings is None else timings
+    gray = _timed(timings, "grayscale", cv2.cvtColor, img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+    if crop:
+        gray = _timed(timings, "crop", crop_to_receipt, gray)
+    if deskew:
+        angle = _timed(timings, "deskew_detect", skew_angle, gray)
+        # Small angles are not worth the resampling, large ones are more likely misdetections
+        if 0.5 <= abs(angle) <= 20:
+            gray = _timed(timings, "deskew", rotate, gray, angle)
+
+    height = _timed(timings, "text_height", text_height, gray)
+    if height:
+        scale = min(MAX_SCALE, max(MIN_SCALE, target_text_height / height))
+        if not 0.85 <= scale <= 1.15:
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+            gray = _timed(timings, "resize", cv2.resize, gray, None, None, scale, scale, interpolation)
+
+    # Contrast Enhancement (CLAHE): darker text, lighter background, without the harshness of thresholding
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return _timed(timings, "clahe", clahe.apply, gray)
+
+
+def preprocess_image(image_bytes, target_text_height: int, decode_max_side: int, deskew: bool = True,
+                     crop: bool = True) -> Tuple[Optional[np.ndarray], Dict[str, float]]:
+    """
+    Prepare a photo or scan for OCR: reduced decode, then prepare_for_ocr.
+    Returns (image or None if it cannot be decoded, per-step timings in ms).
+    """
+    timings = {}
+    img = _timed(timings, "decode", decode_image, image_bytes, decode_max_side)
+    if img is None:
+        return None, timings
+    return prepare_for_ocr(img, target_text_height, deskew, crop, timings), timings
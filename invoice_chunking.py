@@ -0,0 +1,127 @@
+import logging
+import math
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+HEADER_FIELDS = ("vendor_name", "invoice_number", "date", "due_date", "currency")
+TOTAL_FIELDS = ("total_amount", "tax_amount")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count without a tokenizer: ~3.5 characters per token for
+    Latin text, ~0.7 tokens per CJK/other non-ASCII character.
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return math.ceil((len(text) - non_ascii) / 3.5 + non_ascii * 0.7)
+
+
+def split_into_chunks(text: str, budget_tokens: int, overlap_lines: int) -> List[str]:
+    """
+    Split text along line boundaries into chunks of at most ~budget_tokens each.
+    Consecutive chunks share `overlap_lines` lines so an item cut at a boundary
+    is seen whole by at least one chunk. Lines are numbered across the whole text
+    ("12| ...") so each extracted item can name the line it came from.
+    """
+    lines = [f"{number}| {line}" for number, line in enumerate((l for l in text.splitlines() if l.strip()), 1)]
+    chunks = []
+    start = 0
+    while start < len(lines):
+        end = start
+        used = 0
+        while end < len(lines):
+            cost = estimate_tokens(lines[end]) + 1
+            if used + cost > budget_tokens and end > start:
+                break
+            used += cost
+            end += 1
+        chunks.append("\n".join(lines[start:end]))
+        if end >= len(lines):
+            break
+        # Step back for the overlap, but always make progress
+        start = max(start + 1, end - overlap_lines)
+    return chunks
+
+
+def head_and_tail(text: str, budget_tokens: int) -> str:
+    """
+    Text cut to ~budget_tokens by dropping lines from the middle: the start (letterhead,
+    invoice number, dates) and the end (totals) are kept, half the budget each.
+    """
+    if not budget_tokens or estimate_tokens(text) <= budget_tokens:
+        return text
+    lines = [line for line in text.splitlines() if line.strip()]
+    costs = [estimate_tokens(line) + 1 for line in lines]
+    head, used = 0, 0
+    while head < len(lines) and used + costs[head] <= budget_tokens // 2:
+        used += costs[head]
+        head += 1
+    tail = len(lines)
+    while tail > head and used + costs[tail - 1] <= budget_tokens:
+        tail -= 1
+        used += costs[tail]
+    if tail == head:
+        return text
+    marker = f"[... {tail - head} lines of line items omitted ...]"
+    return "\n".join(lines[:head] + [marker] + lines[tail:])
+
+
+def _item_line(item: dict) -> Optional[int]:
+    try:
+        return int(item.get("line"))
+    except (TypeError, ValueError):
+        return None
+
+
+def merge_chunk_items(chunk_items: List[List[dict]]) -> List[dict]:
+    """
+    Concatenate per-chunk line items (tagged with their 'line' number, see split_into_chunks),
+    dropping the duplicates produced by the overlap: an item from the same line as one the
+    previous chunk already extracted. Identical items on different lines are all kept.
+    """
+    merged = []
+    previous_lines = set()
+    for items in chunk_items:
+        lines = set()
+        for item in items:
+            line = _item_line(item)
+            if line is not None and line in previous_lines:
+                continue
+            if line is not None:
+                lines.add(line)
+            merged.append({key: value for key, value in item.items() if key != "line"})
+        previous_lines = lines
+    return merged
+
+
+def merge_chunk_results(results: List[dict], items: List[dict]) -> dict:
+    """
+    Reduce per-chunk extractions to one invoice dict: header fields from the first
+    chunk that has them, totals from the last chunk that has them.
+    """
+    merged = {"items": items}
+    for field in HEADER_FIELDS:
+        merged[field] = next((r.get(field) for r in results if r.get(field) not in (None, "")), None)
+    for field in TOTAL_FIELDS:
+        merged[field] = next((r.get(field) for r in reversed(results) if r.get(field) not in (None, "", 0)), None)
+
+    warnings = [r.get("warning") for r in results if r.get("warning")]
+    if merged["total_amount"] is None:
+        merged["total_amount"] = round(sum(item.get("total_price") or 0 for item in items) + (merged["tax_amount"] or 0), 2)
+        warnings.append("Invoice total not found; computed from line items.")
+    merged["vendor_name"] = merged["vendor_name"] or "Unknown Vendor"
+    merged["currency"] = merged["currency"] or "USD"
+    merged["tax_amount"] = merged["tax_amount"] or 0.0
+    merged["warning"] = " ".join(dict.fromkeys(warnings)) or None
+    return merged
+
+
+def chunk_instructions(index: int, total: int) -> Optional[str]:
+    """Extra user-message instructions telling the model which part of the document it sees"""
+    return (
+        f"This is part {index + 1} of {total} of a long invoice, split by lines with a small overlap. "
+        "Extract ONLY the line items that appear in this part. Lines are numbered (\"12| ...\"): give each item "
+        "a \"line\" field with the number of the line it starts on. Fill header fields and totals only if they "
+        "appear in this part, otherwise use null."
+    )
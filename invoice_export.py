@@ -0,0 +1,95 @@
+import io
+
+import pandas as pd
+
+from metrics import EXPORT_SECONDS, timed
+
+
+@timed(EXPORT_SECONDS, format="quickbooks_csv")
+def generate_quickbooks_csv(data):
+    """
+    Generate CSV for QuickBooks Online Import.
+    Headers: Vendor, Invoice No, Invoice Date, Due Date, Total Amount, Line Amount, Line Account, Line Description
+    Date Format: MM/DD/YYYY
+    Amount: 2 decimal places
+    Encoding: utf-8-sig
+    """
+    def format_date_us(date_str):
+        if not date_str:
+            return ""
+        try:
+            # Try parsing various formats
+            dt = pd.to_datetime(date_str)
+            return dt.strftime("%m/%d/%Y")
+        except:
+            return date_str
+
+    headers = ["Vendor", "Invoice No", "Invoice Date", "Due Date", "Total Amount", "Line Amount", "Line Account", "Line Description"]
+    rows = []
+    
+    vendor = data.get("vendor_name", "")
+    inv_num = data.get("invoice_number", "")
+    inv_date = format_date_us(data.get("date", ""))
+    due_date = format_date_us(data.get("due_date", ""))
+    
+    # Ensure total_amount is float
+    try:
+        total = float(data.get("total_amount", 0))
+        total_str = "{:.2f}".format(total)
+    except:
+        total_str = "0.00"
+    
+    items = data.get("items", [])
+    
+    if items:
+        for item in items:
+            try:
+                line_amount = float(item.get("total_price", 0))
+                line_amount_str = "{:.2f}".format(line_amount)
+            except:
+                line_amount_str = "0.00"
+            
+            category = item.get("category")
+            if not category:
+                category = "Uncategorized Expense"
+            
+            description = item.get("description", "")
+            
+            row = {
+                "Vendor": vendor,
+                "Invoice No": inv_num,
+                "Invoice Date": inv_date,
+                "Due Date": due_date,
+                "Total Amount": total_str,
+                "Line Amount": line_amount_str,
+                "Line Account": category,
+                "Line Description": description
+            }
+            rows.append(row)
+    else:
+        # Fallback if no items found
+        row = {
+            "Vendor": vendor,
+            "Invoice No": inv_num,
+            "Invoice Date": inv_date,
+            "Due Date": due_date,
+            "Total Amount": total_str,
+            "Line Amount": total_str, # Assume single line item equal to total
+            "Line Account": "Uncategorized Expense",
+            "Line Description": "Invoice Total"
+        }
+        rows.append(row)
+        
+    df = pd.DataFrame(rows, columns=headers)
+    return df.to_csv(index=False).encode('utf-8-sig')
+
+
+@timed(EXPORT_SECONDS, format="xlsx")
+def generate_excel(data) -> bytes:
+    """Line items of one invoice as an .xlsx workbook (single 'Invoice' sheet)"""
+    items_data = data.get('items', [])
+    df_export = pd.DataFrame(items_data) if items_data else pd.DataFrame()
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        df_export.to_excel(writer, index=False, sheet_name='Invoice')
+    return buffer.getvalue()
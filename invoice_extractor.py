@@ -1,11 +1,30 @@
-import pdfplumber
+import hashlib
+import functools
 import json
 import logging
-from typing import List, Optional
-from pydantic import BaseModel, Field
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError
 import config
 import os
-import requests
+from extraction_cache import ExtractionCache, hash_bytes
+from invoice_chunking import chunk_instructions, estimate_tokens, head_and_tail, merge_chunk_items, merge_chunk_results, split_into_chunks
+from invoice_splitter import letterhead_key, split_invoice_pages
+from invoice_validation import apply_corrections, suspect_context, validate_invoice
+from json_repair import JSONRepairError, TruncatedAnswerError, loads_object
+from llm_client import DeepSeekClient
+from llm_usage import UsageRecord, in_current_context, track_usage, with_usage
+from model_router import can_escalate, escalate, fall_back, route_document
+from metrics import CACHE_LOOKUPS, DOCUMENTS, DOCUMENT_SECONDS, LLM_ANSWERS, STAGE_SECONDS, start_exporter, timed
+from ocr_pool import create_ocr_pool
+from single_flight import SingleFlight
+from pdf_text import PdfSource, PdfTextExtractor, has_usable_text, join_pages
+from streaming_json import StreamingJSONObjectParser
+from table_extractor import extract_header_fields, parse_amount, reconciles, table_items_from_pages
+from vendor_templates import VendorTemplateStore, apply_template, layout_signature, learn_template
 
 
 logger = logging.getLogger(__name__)
@@ -30,102 +49,889 @@ class InvoiceData(BaseModel):
     currency: str = Field("USD", description="Currency code")
     warning: Optional[str] = Field(None, description="Audit warning for suspected OCR or logic errors")
 
+# Bump when the prompt or model changes: invalidates cached parse results (not raw text)
+PROMPT_VERSION = "12"
+# Bump when pdfplumber/OCR text extraction changes: invalidates cached raw text
+TEXT_PIPELINE_VERSION = "3"
+# The schema fingerprint is part of the parse cache key, so model changes invalidate it automatically
+SCHEMA_VERSION = hashlib.sha256(json.dumps(InvoiceData.model_json_schema(), sort_keys=True).encode("utf-8")).hexdigest()[:12]
+PARSE_CACHE_VERSION = f"{PROMPT_VERSION}-{SCHEMA_VERSION}"
+
+EXTRACTION_RULES = """You are a professional financial audit assistant. Extract key information from the invoice text in the user message and return it in the required JSON format.
+
+**CRITICAL EXTRACTION RULES (MUST FOLLOW):**
+1. **Exclude Keywords:** COMPLETELY IGNORE lines containing 'SUBTOTAL', 'TOTAL', 'CASH', 'CHANGE', 'BALANCE' when parsing line items. 'TAX' lines should be extracted to 'tax_amount', not line items.
+2. **Amount Extraction:** For each line item, the 'total_price' is usually the number on the FAR RIGHT of the line.
+3. **Quantity Logic:** Default 'quantity' to 1 unless you explicitly see an '@' symbol (e.g., "3 @ 1.50"). Do NOT guess quantity based on price.
+4. **Strict Validation:** Before outputting JSON, you MUST verify: Sum(items.total_price) + tax_amount ~= Total Amount.
+5. **Date Format:** Convert all dates to 'MM/DD/YYYY' format.
+
+**EXTREME AUDIT LOGIC (FOR WALMART & RETAIL RECEIPTS):**
+1. **Decimal Restoration:** OCR often misses decimal points (e.g., reads '$4.03' as '03' or '403'). If you see an integer like '60', '03', '63' in a price column, it is highly likely '2.60', '4.03', '6.63'. Use context to restore the float value.
+2. **Walmart Barcodes:** In Walmart receipts, the first number under a product name is often a barcode, and the SECOND number is the price. The 'SUBTOTAL' line immediately follows the last item - do NOT include it as an item.
+3. **Realism Check:** Do NOT invent unit prices to make the math work. If a price seems impossible (e.g., $60 for a small grocery item), flag it in the 'warning' field: "OCR accuracy issue suspected near [Item Name]".
+4. **Sum over Accuracy:** It is better to have a Sum(Line Items) that slightly mismatches the Total than to hallucinate prices."""
+
+# Used when line items were read from the PDF's tables: the model only fills the header
+HEADER_RULES = """You are a professional financial audit assistant. The line items of this invoice have already been extracted; the user message contains the invoice text and the item subtotal. Extract ONLY the header fields and totals. Do NOT output line items.
+
+**RULES:**
+1. 'total_amount' is the final amount payable (grand total), 'tax_amount' the total tax (0 if none).
+2. Dates must be in 'MM/DD/YYYY' format.
+3. If Sum(items) + tax_amount does not match total_amount, explain the difference briefly in 'warning'."""
+
+# Follow-up prompt when local validation fails: only the suspect values and their source lines are sent
+REASK_RULES = """You are a professional financial audit assistant correcting a previous invoice extraction. The user message lists the checks that failed, the extracted values under suspicion and the invoice lines they came from.
+Re-read those lines and return corrected values as JSON: {"items":[{"index":int,"quantity":num|null,"unit_price":num|null,"total_price":num}],"total_amount":num,"tax_amount":num,"date":"MM/DD/YYYY"|null,"due_date":"MM/DD/YYYY"|null}
+Include only the items and fields listed as suspect. Keep a value unchanged if the lines confirm it. Do NOT invent values that are not in the lines."""
+
+# Field hints kept from the model descriptions; everything else in the schema is implied by the sketch
+SCHEMA_NOTES = """Field notes: 'category' is the expense category (e.g., Office Supplies, Meals, Travel); 'currency' is an ISO currency code; 'warning' is an audit note for suspected OCR or logic errors."""
+
+
+# Called with (field, value) as fields stream in; "items[]" is reported once per completed line item
+FieldCallback = Callable[[str, Any], None]
+
+
+def compact_schema(model, last: tuple = (), exclude: tuple = ()) -> str:
+    """
+    Render a pydantic model as a minified type sketch, e.g. {"vendor_name":"str","items":[{...}]}.
+    Much smaller than the indented JSON Schema (no titles, descriptions, $defs or whitespace)
+    while still telling the model every key, its type and whether it may be null.
+    Top-level keys in `last` are moved to the end, keys in `exclude` are left out.
+    """
+    schema = model.model_json_schema()
+    defs = schema.get("$defs", {})
+    type_names = {"string": "str", "number": "num", "integer": "int", "boolean": "bool", "null": "null"}
+
+    def sketch(node):
+        if "$ref" in node:
+            return sketch(defs[node["$ref"].split("/")[-1]])
+        if "anyOf" in node:
+            variants = [sketch(option) for option in node["anyOf"]]
+            if all(isinstance(v, str) for v in variants):
+                return "|".join(variants)
+            return next(v for v in variants if not isinstance(v, str))
+        if node.get("type") == "object":
+            return {name: sketch(prop) for name, prop in node.get("properties", {}).items()}
+        if node.get("type") == "array":
+            return [sketch(node.get("items", {}))]
+        return type_names.get(node.get("type"), "any")
+
+    shape = {k: v for k, v in sketch(schema).items() if k not in exclude}
+    shape = {**{k: v for k, v in shape.items() if k not in last}, **{k: shape[k] for k in last if k in shape}}
+    return json.dumps(shape, separators=(",", ":"))
+
+
+def build_system_prompt() -> str:
+    """Static part of the extraction prompt: role, rules and compact schema"""
+    return (
+        "You are a financial assistant that only outputs structured JSON. Output JSON directly, "
+        "without markdown formatting markers (such as ```json ... ```).\n\n"
+        f"{EXTRACTION_RULES}\n\n"
+        f"Output a single JSON object with exactly this shape (null where unknown):\n{compact_schema(InvoiceData, last=('items',))}\n"
+        f"{SCHEMA_NOTES}"
+    )
+
+def build_header_system_prompt() -> str:
+    """System prompt for the table fast path: line items are already known, only header fields are asked for"""
+    return (
+        "You are a financial assistant that only outputs structured JSON. Output JSON directly, "
+        "without markdown formatting markers (such as ```json ... ```).\n\n"
+        f"{HEADER_RULES}\n\n"
+        f"Output a single JSON object with exactly this shape (null where unknown):\n{compact_schema(InvoiceData, exclude=('items',))}\n"
+        f"{SCHEMA_NOTES}"
+    )
+
+def read_input(source):
+    """
+    Normalize an uploaded document for the pipeline without touching disk.
+    Paths are kept as paths; bytes, bytearray and memoryview pass through; file-like
+    objects become a zero-copy view of their buffer when they have one (BytesIO,
+    Streamlit's UploadedFile), otherwise their content is read once.
+    """
+    if isinstance(source, (str, os.PathLike, bytes, bytearray, memoryview)):
+        return source
+    if hasattr(source, "getbuffer"):
+        return source.getbuffer()
+    if hasattr(source, "read"):
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return source.read()
+    raise TypeError(f"Unsupported document input: {type(source).__name__}")
+
+def coerce_amount(value):
+    """
+    Numeric strings from the model ("$4.03", "1,299.00", "1.234,56") as floats, None when a string
+    holds no number; other values unchanged. A percentage ("12.5%") is a rate, not an amount, so it is left for validation to reject.
+    """
+    if not isinstance(value, str) or "%" in value:
+        return value
+    return parse_amount(value)
+
+def describe_input(source) -> str:
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    return f"<{len(source)} bytes in memory>"
+
+class ExtractionError(ValueError):
+    """Extraction failed for a reason that can be shown to the user as-is"""
+
 class AIInvoiceExtractor:
-    def __init__(self):
-        # Empty init as we handle requests manually
-        pass
+    def __init__(self, ocr_pool_size: Optional[int] = None, prewarm_ocr: Optional[bool] = None):
+        # OCR models are expensive to load: kept for the lifetime of the extractor, in worker processes by default
+        self.ocr_pool = create_ocr_pool(
+            config.OCR_BACKEND,
+            config.OCR_LANGUAGES,
+            size=ocr_pool_size or config.OCR_POOL_SIZE,
+            gpu=config.OCR_USE_GPU,
+            torch_threads=config.OCR_WORKER_TORCH_THREADS
+        )
+        if config.OCR_PREWARM if prewarm_ocr is None else prewarm_ocr:
+            self.ocr_pool.warm_up(background=True)
+        # Pooled keep-alive client, shared by every caller of this extractor
+        self.client = DeepSeekClient()
+        # Large PDFs are split into page ranges extracted by a process pool
+        self.pdf_text = PdfTextExtractor(
+            config.PDF_PARALLEL_WORKERS, config.PDF_PARALLEL_MIN_PAGES,
+            prefetch=("tables",) if config.TABLE_EXTRACTION_ENABLED else ()  # Read in the same pass as the text
+        )
+        # Built once: the prompt prefix never changes between invoices
+        self.system_prompt = build_system_prompt()
+        self.header_system_prompt = build_header_system_prompt()
+        # Content-addressed cache of raw text and parsed results, keyed by file hash
+        self.cache = None
+        if config.EXTRACTION_CACHE_ENABLED:
+            self.cache = ExtractionCache(config.EXTRACTION_CACHE_DIR, config.EXTRACTION_CACHE_MAX_BYTES)
+        # Layouts learned from verified results: repeat vendors are read without the LLM
+        self.templates = None
+        if config.VENDOR_TEMPLATES_ENABLED:
+            self.templates = VendorTemplateStore(config.VENDOR_TEMPLATE_DIR, config.VENDOR_TEMPLATE_MIN_SIMILARITY)
+        # Concurrent requests for the same document (double clicks, email + upload) share one extraction
+        self.inflight = SingleFlight()
+        # Per-stage histograms, exported on METRICS_PORT and/or to METRICS_FILE
+        start_exporter()
 
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Extract all text from PDF"""
-        text = ""
+    def _cached_result(self, file_hash: str, variant: str = ""):
+        if self.cache is None:
+            return None
+        result = self.cache.get_parsed(file_hash, PARSE_CACHE_VERSION + variant)
+        if result is not None:
+            logger.info(f"Extraction cache hit for {file_hash[:12]}")
+        CACHE_LOOKUPS.inc(outcome="miss" if result is None else "hit")
+        return result
+
+    def tenant_variant(self, tenant: Optional[str]) -> str:
+        """
+        Cache and in-flight key suffix of a tenant's PDF results: they may come from the tenant's
+        private vendor templates, so they are never served to another tenant for the same file.
+        """
+        if self.templates is None or not tenant:
+            return ""
+        return f":tenant={hashlib.sha256(tenant.encode('utf-8')).hexdigest()[:16]}"
+
+    def _cached_text(self, file_hash: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return self.cache.get_text(file_hash, TEXT_PIPELINE_VERSION)
+
+    def _store_text(self, file_hash: str, text: str):
+        if self.cache is not None:
+            self.cache.put_text(file_hash, TEXT_PIPELINE_VERSION, text)
+
+    def _store_result(self, file_hash: str, result, variant: str = ""):
+        if self.cache is not None:
+            self.cache.put_parsed(file_hash, PARSE_CACHE_VERSION + variant, result)
+
+    def extract_pages_from_pdf(self, pdf_path: PdfSource) -> List[str]:
+        """Extract the text of every PDF page in order (page-parallel for large documents)"""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-            return text
+            return self.pdf_text.page_texts(pdf_path)
         except Exception as e:
-            logger.error(f"Error extracting text from PDF {pdf_path}: {e}")
+            logger.error(f"Error extracting text from PDF {describe_input(pdf_path)}: {e}")
+            raise
+
+    def extract_text_from_pdf(self, pdf_path: PdfSource) -> str:
+        """Extract all text from PDF"""
+        return join_pages(self.extract_pages_from_pdf(pdf_path))
+
+    def build_payload(self, text: str, instructions: Optional[str] = None, system_prompt: Optional[str] = None,
+                      model: Optional[str] = None) -> dict:
+        """Chat completion request body for one invoice text (model: see model_router, default the fast model)"""
+        user_content = f"Invoice Text Content:\n---\n{text}\n---"
+        if instructions:
+            user_content = f"{instructions}\n\n{user_content}"
+        return {
+            "model": model or config.DEEPSEEK_FAST_MODEL,
+            # Static system prompt first, invoice text last: identical prefixes hit DeepSeek's context cache
+            "messages": [
+                {"role": "system", "content": system_prompt or self.system_prompt},
+                {"role": "user", "content": user_content}
+            ],
+            "response_format": {"type": "json_object"},
+            "temperature": 0.1
+        }
+
+    @staticmethod
+    def finish_reason(response_json: dict) -> Optional[str]:
+        try:
+            return response_json["choices"][0].get("finish_reason")
+        except (KeyError, IndexError, TypeError, AttributeError):
+            return None
+
+    @staticmethod
+    def response_content(response_json: dict) -> str:
+        try:
+            return response_json["choices"][0]["message"]["content"] or ""
+        except (KeyError, IndexError, TypeError):
+            raise JSONRepairError("Model response has no message content")
+
+    def response_dict(self, response_json: dict) -> dict:
+        """
+        Decode the JSON object in a chat completion response, repairing malformed output locally.
+        Missing closing brackets are added, but an answer cut off at max_tokens, or one whose
+        repair had to drop a cut-off value, raises TruncatedAnswerError instead of losing data.
+        """
+        try:
+            if self.finish_reason(response_json) == "length":
+                raise TruncatedAnswerError("Model answer was cut off at max_tokens")
+            data, repairs = loads_object(self.response_content(response_json))
+            if "dropped value" in repairs:
+                raise TruncatedAnswerError("Model answer was cut off in the middle of a value")
+        except TruncatedAnswerError:
+            LLM_ANSWERS.inc(outcome="truncated")
             raise
+        except JSONRepairError:
+            LLM_ANSWERS.inc(outcome="unrepairable")
+            raise
+        if repairs:
+            logger.info(f"Repaired the model answer locally: {', '.join(repairs)}")
+        LLM_ANSWERS.inc(outcome="repaired" if repairs else "clean")
+        return data
 
-    def parse_with_ai(self, text: str) -> InvoiceData:
-        """Use DeepSeek to convert unstructured text to structured JSON"""
-        
-        schema = InvoiceData.model_json_schema()
-        
-        prompt = f"""
-        You are a professional financial audit assistant. Please extract key information from the following invoice text and return it in the required JSON format.
-        
-        **CRITICAL EXTRACTION RULES (MUST FOLLOW):**
-        1. **Exclude Keywords:** COMPLETELY IGNORE lines containing 'SUBTOTAL', 'TOTAL', 'CASH', 'CHANGE', 'BALANCE' when parsing line items. 'TAX' lines should be extracted to 'tax_amount', not line items.
-        2. **Amount Extraction:** For each line item, the 'total_price' is usually the number on the FAR RIGHT of the line.
-        3. **Quantity Logic:** Default 'quantity' to 1 unless you explicitly see an '@' symbol (e.g., "3 @ 1.50"). Do NOT guess quantity based on price.
-        4. **Strict Validation:** Before outputting JSON, you MUST verify: Sum(items.total_price) + tax_amount ~= Total Amount.
-        5. **Date Format:** Convert all dates to 'MM/DD/YYYY' format.
-        
-        **EXTREME AUDIT LOGIC (FOR WALMART & RETAIL RECEIPTS):**
-        1. **Decimal Restoration:** OCR often misses decimal points (e.g., reads '$4.03' as '03' or '403'). If you see an integer like '60', '03', '63' in a price column, it is highly likely '2.60', '4.03', '6.63'. Use context to restore the float value.
-        2. **Walmart Barcodes:** In Walmart receipts, the first number under a product name is often a barcode, and the SECOND number is the price. The 'SUBTOTAL' line immediately follows the last item - do NOT include it as an item.
-        3. **Realism Check:** Do NOT invent unit prices to make the math work. If a price seems impossible (e.g., $60 for a small grocery item), flag it in the 'warning' field: "OCR accuracy issue suspected near [Item Name]".
-        4. **Sum over Accuracy:** It is better to have a Sum(Line Items) that slightly mismatches the Total than to hallucinate prices.
-
-        You must strictly follow this JSON Schema:
-        {json.dumps(schema, indent=2)}
-        
-        Invoice Text Content:
-        ---
-        {text}
-        ---
+    @classmethod
+    def invoice_dict(cls, data: dict, keep: Tuple[str, ...] = ()) -> dict:
+        """
+        Model output normalized for InvoiceData: amounts given as strings coerced, invalid line
+        items dropped. Item keys in keep (e.g. a chunk's 'line' tag) are carried past validation.
         """
+        data = dict(data)
+        for field in ("total_amount", "tax_amount"):
+            if field in data:
+                data[field] = coerce_amount(data[field])
+        items = data.get("items") if isinstance(data.get("items"), list) else []
+        data["items"] = cls._valid_items([
+            {**item, **{key: coerce_amount(item[key]) for key in ("quantity", "unit_price", "total_price") if key in item}}
+            if isinstance(item, dict) else item
+            for item in items
+        ], keep)
+        return data
 
+    def invoice_from_dict(self, data: dict) -> InvoiceData:
+        return InvoiceData(**self.invoice_dict(data))
+
+    def parse_response(self, response_json: dict) -> InvoiceData:
+        """Turn a chat completion response into a validated InvoiceData"""
+        return self.invoice_from_dict(self.response_dict(response_json))
+
+    @staticmethod
+    def max_output_tokens(model: Optional[str]) -> int:
+        """Largest max_tokens the model accepts (reasoner models also spend output tokens on reasoning)"""
+        if model and "reasoner" in model:
+            return config.LLM_TRUNCATED_MAX_TOKENS_REASONER
+        return config.LLM_TRUNCATED_MAX_TOKENS
+
+    def json_reask_payload(self, payload: dict, response_json: dict, error: Exception) -> dict:
+        """
+        The original request followed by the unusable answer and why (same prefix: hits the context cache).
+        A truncated answer is not shown back: the request is sent again with a larger max_tokens.
+        """
+        if isinstance(error, TruncatedAnswerError):
+            return dict(payload, max_tokens=max(self.max_output_tokens(payload.get("model")), payload.get("max_tokens") or 0))
         try:
-            # Manually construct request
-            headers = {
-                "Authorization": f"Bearer {config.DEEPSEEK_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {"role": "system", "content": "You are a financial assistant that only outputs structured JSON. Please output JSON directly, do not include markdown formatting markers (such as ```json ... ```)."},
-                    {"role": "user", "content": prompt}
-                ],
-                "response_format": {"type": "json_object"},
-                "temperature": 0.1
-            }
-            
-            response = requests.post(f"{config.DEEPSEEK_BASE_URL}/chat/completions", headers=headers, json=payload)
-            response.raise_for_status()
-            response_json = response.json()
-            
-            content = response_json['choices'][0]['message']['content']
-            content = content.replace("```json", "").replace("```", "").strip()
-            
-            invoice_dict = json.loads(content)
-            return InvoiceData(**invoice_dict)
+            content = self.response_content(response_json)
+        except JSONRepairError:
+            content = ""
+        return dict(payload, messages=payload["messages"] + [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": f"That answer could not be used: {str(error)[:300]}\n"
+                                        f"Reply with the complete JSON object only, in the required format."}
+        ])
+
+    def complete_json(self, payload: dict, build: Callable[[dict], Any], on_field: Optional[FieldCallback] = None):
+        """
+        Run a completion and build the caller's result from its JSON object; build raises
+        ValueError (e.g. a pydantic ValidationError) when the object is unusable. Malformed
+        JSON is repaired locally, so only an answer that stays unusable costs a second request.
+        """
+        if on_field is None:
+            response_json = self.client.chat_completion(payload)
+        else:
+            response_json = self._stream_completion(payload, on_field)
+        try:
+            return build(self.response_dict(response_json))
+        except ValueError as e:
+            if not config.LLM_JSON_REASK:
+                raise
+            logger.warning(f"Model answer unusable after local repair ({e}), asking again")
+            LLM_ANSWERS.inc(outcome="reasked")
+            response_json = self.client.chat_completion(self.json_reask_payload(payload, response_json, e))
+            return build(self.response_dict(response_json))
+
+    def parse_with_ai(self, text: str, on_field: Optional[FieldCallback] = None,
+                      model: Optional[str] = None) -> InvoiceData:
+        """
+        Use DeepSeek to convert unstructured text to structured JSON.
+        If on_field is given the response is streamed and header fields are reported
+        as soon as they are complete, before the line items finish generating.
+        """
+        try:
+            if config.LLM_CHUNK_TOKEN_BUDGET and estimate_tokens(text) > config.LLM_CHUNK_TOKEN_BUDGET:
+                return self._parse_chunked(text, model)
+
+            return self.complete_json(self.build_payload(text, model=model), self.invoice_from_dict, on_field)
         except Exception as e:
             logger.error(f"AI parsing failed: {e}")
             raise
 
-    def process_pdf(self, pdf_path: str) -> dict:
-        """Full PDF processing flow: Extract text -> AI Parse -> Return dict"""
-        logger.info(f"Processing PDF: {pdf_path}")
-        raw_text = self.extract_text_from_pdf(pdf_path)
-        if not raw_text.strip():
-            raise ValueError("PDF text extraction resulted in empty content.")
-        
-        structured_data = self.parse_with_ai(raw_text)
-        # Return both structured data and raw text for debugging
+    def _parse_chunked(self, text: str, model: Optional[str] = None) -> InvoiceData:
+        """
+        Map-reduce extraction for invoices too long for one prompt: split the text into
+        overlapping line chunks, extract each chunk in parallel, then merge the line
+        items (dropping overlap duplicates) and take header fields from the first chunk
+        and totals from the last.
+        """
+        chunks = split_into_chunks(text, config.LLM_CHUNK_TOKEN_BUDGET, config.LLM_CHUNK_OVERLAP_LINES)
+        logger.info(f"Long invoice (~{estimate_tokens(text)} tokens): extracting {len(chunks)} chunks in parallel")
+
+        def extract_chunk(index: int) -> dict:
+            payload = self.build_payload(chunks[index], chunk_instructions(index, len(chunks)), model=model)
+            return self.complete_json(payload, functools.partial(self.invoice_dict, keep=("line",)))
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(chunks), config.CHUNK_MAX_WORKERS))) as pool:
+            results = list(pool.map(in_current_context(extract_chunk), range(len(chunks))))
+
+        merged = merge_chunk_results(results, merge_chunk_items([result["items"] for result in results]))
+        return InvoiceData(**merged)
+
+    @staticmethod
+    def _valid_items(items, keep: Tuple[str, ...] = ()) -> List[dict]:
+        """Line items that pass InvoiceItem validation; malformed ones are dropped"""
+        valid = []
+        for item in items or []:
+            try:
+                valid.append({**InvoiceItem(**item).model_dump(), **{key: item[key] for key in keep if key in item}})
+            except (TypeError, ValidationError) as e:
+                logger.warning(f"Dropping invalid line item {item!r}: {e}")
+        return valid
+
+    def _stream_completion(self, payload: dict, on_field: FieldCallback) -> dict:
+        """Consume a streamed completion, reporting fields incrementally, and rebuild the full response"""
+        parser = StreamingJSONObjectParser()
+        parts = []
+        finish_reason = None
+        for chunk in self.client.stream_chat_completion(payload):
+            choices = chunk.get("choices") or [{}]
+            finish_reason = choices[0].get("finish_reason") or finish_reason
+            delta = (choices[0].get("delta") or {}).get("content")
+            if not delta:
+                continue
+            parts.append(delta)
+            for field, value in parser.feed(delta):
+                try:
+                    on_field(field, value)
+                except Exception as e:
+                    logger.warning(f"Streaming field callback failed for {field}: {e}")
+        return {"choices": [{"message": {"content": "".join(parts)}, "finish_reason": finish_reason}]}
+
+    def table_shortcut(self, text: str, items: List[dict]) -> Optional[InvoiceData]:
+        """
+        Invoice built without the LLM: header fields from a regex pass over the text, used
+        only when vendor, number and date were all read and the table items plus tax add
+        up to the printed total. Otherwise the LLM reads the header (header_payload).
+        """
+        if not config.TABLE_SKIP_LLM_WHEN_RECONCILED:
+            return None
+        header = extract_header_fields(text)
+        # Every header field the LLM would otherwise check must have been read, not guessed
+        if not all(header[field] for field in ("vendor_name", "invoice_number", "date")):
+            return None
+        if not reconciles(items, header["total_amount"], header["tax_amount"]):
+            return None
+        return InvoiceData(**header, items=items)
+
+    def header_payload(self, text: str, items: List[dict], model: Optional[str] = None) -> dict:
+        """
+        Request body asking only for header fields; the known item subtotal helps the model check totals.
+        A long document is cut to its start and end (header and totals) within LLM_CHUNK_TOKEN_BUDGET.
+        """
+        subtotal = sum(item["total_price"] for item in items)
+        instructions = f"Line items already extracted: {len(items)} items, subtotal {subtotal:.2f}."
+        text = head_and_tail(text, config.LLM_CHUNK_TOKEN_BUDGET)
+        return self.build_payload(text, instructions, system_prompt=self.header_system_prompt, model=model)
+
+    @staticmethod
+    def merge_table_header(header: dict, items: List[dict]) -> InvoiceData:
+        """Combine LLM header fields with table line items, flagging totals that do not add up"""
+        header = {k: v for k, v in header.items() if k != "items"}
+        data = InvoiceData(**header, items=items)
+        if not data.warning and not reconciles(items, data.total_amount, data.tax_amount):
+            data.warning = "Line items from the PDF table do not add up to the invoice total."
+        return data
+
+    def parse_pdf_text(self, text: str, items: List[dict], on_field: Optional[FieldCallback] = None,
+                       model: Optional[str] = None) -> InvoiceData:
+        """
+        Parse a digital PDF, using line items read from its tables when there are enough of them:
+        the LLM is then only asked for the header fields (or skipped entirely when the items
+        reconcile with the printed total), otherwise the whole text goes through parse_with_ai.
+        """
+        items = self._valid_items(items)
+        if len(items) < max(1, config.TABLE_MIN_ITEMS):
+            return self.parse_with_ai(text, on_field, model)
+
+        data = self.table_shortcut(text, items)
+        if data is not None:
+            logger.info(f"{len(items)} table line items reconcile with the invoice total, skipping the LLM")
+            if on_field is not None:
+                self._report_fields(data.model_dump(), on_field)
+            return data
+
+        logger.info(f"Read {len(items)} line items from PDF tables, asking the LLM for header fields only")
+        try:
+            header_only = None
+            if on_field is not None:
+                self._report_fields({"items": items}, on_field)
+                # The table items are authoritative, ignore any the model outputs anyway
+                header_only = lambda field, value: field == "items[]" or on_field(field, value)
+            return self.complete_json(
+                self.header_payload(text, items, model),
+                lambda header: self.merge_table_header(self.invoice_dict(header), items),
+                header_only
+            )
+        except Exception as e:
+            logger.error(f"AI header parsing failed: {e}")
+            raise
+
+    def template_result(self, page_texts: List[str], page_words: Optional[List[List[list]]],
+                        items: List[dict], tenant: Optional[str] = None) -> Optional[InvoiceData]:
+        """
+        Invoice read with the vendor's learned layout template (among the tenant's own):
+        header fields from their learned positions, line items from the PDF tables. None when
+        there is no matching template or the result does not reconcile (the caller then falls back to the LLM).
+        """
+        if self.templates is None or not page_words or not page_texts:
+            return None
+        items = self._valid_items(items)
+        template = self.templates.find(letterhead_key(page_texts[0]), layout_signature(page_words), tenant)
+        if template is None or not items:
+            return None
+        header = apply_template(template, page_words)
+        if header is None or not reconciles(items, header["total_amount"], header["tax_amount"]):
+            logger.info(f"Vendor template for {template['vendor_name']} did not validate, falling back to the LLM")
+            return None
+        logger.info(f"Read invoice with the learned layout of {template['vendor_name']} ({len(items)} items)")
+        return InvoiceData(**header, items=items)
+
+    def parse_pdf_pages(self, page_texts: List[str], items: List[dict], page_words: Optional[List[List[list]]] = None,
+                        on_field: Optional[FieldCallback] = None, model: Optional[str] = None,
+                        tenant: Optional[str] = None) -> InvoiceData:
+        """Cheapest path first: learned vendor template, then the table fast path, then the LLM"""
+        data = self.template_result(page_texts, page_words, items, tenant)
+        if data is None:
+            return self.parse_pdf_text(join_pages(page_texts), items, on_field, model)
+        if on_field is not None:
+            self._report_fields(data.model_dump(), on_field)
+        return data
+
+    def learn_vendor_template(self, pdf_path, verified: dict, tenant: Optional[str] = None) -> bool:
+        """
+        Remember the layout of a PDF whose extraction the user has checked, so later invoices
+        of the same tenant with the same letterhead and layout are read without the LLM.
+        A result from process_pdf_documents is matched to its pages through '_pages'.
+        """
+        if self.templates is None:
+            return False
+        pdf_path = read_input(pdf_path)
+        pages = self.pdf_pages_stage(pdf_path, self.hash_input(pdf_path))
+        start, end = verified.get("_pages") or [1, len(pages)]
+        pages = pages[start - 1:end]
+        words = self.pdf_text.page_words(pdf_path)[start - 1:end]
+        vendor_key = letterhead_key(pages[0]) if pages else None
+        template = learn_template(words, verified) if vendor_key else None
+        if template is None:
+            logger.info(f"Could not learn a layout for {verified.get('vendor_name')}: invoice total not found on the page")
+            return False
+        self.templates.save(vendor_key, template, tenant)
+        logger.info(f"Learned layout of {verified.get('vendor_name')} ({', '.join(template['fields'])})")
+        return True
+
+    @staticmethod
+    def _report_fields(fields: dict, on_field: FieldCallback):
+        """Report already known fields through a streaming callback, the same way streamed ones are"""
+        events = []
+        for field, value in fields.items():
+            if field == "items":
+                events.extend(("items[]", item) for item in value)
+            else:
+                events.append((field, value))
+        for field, value in events:
+            try:
+                on_field(field, value)
+            except Exception as e:
+                logger.warning(f"Streaming field callback failed for {field}: {e}")
+
+    def hash_input(self, source) -> str:
+        """Content hash of a path or in-memory buffer"""
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                return hash_bytes(f.read())
+        return hash_bytes(source)
+
+    def single_flight(self, key: str, func, *args):
+        """
+        Run an extraction, or join an identical one already in flight (same kind and content hash)
+        and return a copy of its result. Joined results report zero usage: the leader spent it.
+        """
+        result, shared = self.inflight.do(key, func, *args)
+        if shared:
+            logger.info(f"Joined the in-flight extraction {key[:24]}")
+            for document in result if isinstance(result, list) else [result]:
+                if isinstance(document, dict) and "_usage" in document:
+                    document["_usage"] = UsageRecord().summary()
+        return result
+
+    def pdf_pages_stage(self, pdf_path: PdfSource, file_hash: str) -> List[str]:
+        """Per-page text of a PDF, from the cache or pdfplumber (OCR for scanned pages)"""
+        pages = self.cache.get_pages(file_hash, TEXT_PIPELINE_VERSION) if self.cache is not None else None
+        if pages is None:
+            pages = self.ocr_scanned_pages(pdf_path, self.extract_pages_from_pdf(pdf_path))
+            if not any(page.strip() for page in pages):
+                raise ValueError("PDF text extraction resulted in empty content.")
+            if self.cache is not None:
+                self.cache.put_pages(file_hash, TEXT_PIPELINE_VERSION, pages)
+        return pages
+
+    def pdf_table_items_stage(self, pdf_path: PdfSource, file_hash: str) -> List[List[dict]]:
+        """
+        Per-page line items read from the PDF's tables, from the cache or pdfplumber.
+        Best effort: any failure just means no table items (the LLM reads the text instead).
+        """
+        if not config.TABLE_EXTRACTION_ENABLED:
+            return []
+        items = self.cache.get_table_items(file_hash, TEXT_PIPELINE_VERSION) if self.cache is not None else None
+        if items is None:
+            try:
+                items = table_items_from_pages(self.pdf_text.page_tables(pdf_path))
+            except Exception as e:
+                logger.warning(f"Table extraction failed for {describe_input(pdf_path)}: {e}")
+                return []
+            if self.cache is not None:
+                self.cache.put_table_items(file_hash, TEXT_PIPELINE_VERSION, items)
+        return items
+
+    def pdf_words_stage(self, pdf_path: PdfSource, first_pages: List[str],
+                        tenant: Optional[str] = None) -> Optional[List[List[list]]]:
+        """
+        Positioned words for the template path. Only extracted when one of the given
+        (first) pages carries the letterhead of a vendor the tenant has a learned template for.
+        """
+        if self.templates is None or not any(self.templates.has_vendor(letterhead_key(page), tenant) for page in first_pages):
+            return None
+        try:
+            return self.pdf_text.page_words(pdf_path)
+        except Exception as e:
+            logger.warning(f"Word extraction failed for {describe_input(pdf_path)}: {e}")
+            return None
+
+    def pdf_text_stage(self, pdf_path: PdfSource, file_hash: str) -> str:
+        """Raw text of a PDF, from the cache or pdfplumber"""
+        return join_pages(self.pdf_pages_stage(pdf_path, file_hash))
+
+    def image_text_stage(self, image_bytes: bytes, file_hash: str) -> str:
+        """Raw text of an image, from the cache or OCR. Raises ExtractionError with a user-facing message."""
+        text = self._cached_text(file_hash)
+        if text is None:
+            text = self._ocr_image(image_bytes)
+            if text is None:
+                raise ExtractionError("Unable to decode image file")
+            if not text.strip():
+                raise ExtractionError("OCR failed to identify any text from the image.")
+            self._store_text(file_hash, text)
+        return text
+
+    def reask_payload(self, data: dict, text: str, validation: dict, model: Optional[str] = None) -> dict:
+        """Small follow-up request covering only the values that failed local validation"""
+        items = data.get("items") or []
+        suspects = {
+            "items": [{"index": i, **{k: items[i].get(k) for k in ("description", "quantity", "unit_price", "total_price")}}
+                      for i in validation["suspect_items"]],
+            **{field: data.get(field) for field in validation["suspect_fields"]},
+        }
+        failed = "\n".join(f"- {issue['message']}" for issue in validation["issues"])
+        context = "\n".join(suspect_context(text, data, validation))
+        return {
+            "model": model or config.DEEPSEEK_FAST_MODEL,
+            "messages": [
+                {"role": "system", "content": REASK_RULES},
+                {"role": "user", "content": (
+                    f"Failed checks:\n{failed}\n\nSuspect values:\n{json.dumps(suspects, ensure_ascii=False)}\n\n"
+                    f"Invoice lines:\n---\n{context}\n---"
+                )}
+            ],
+            "response_format": {"type": "json_object"},
+            "temperature": 0.1
+        }
+
+    def apply_reask(self, structured_data: InvoiceData, validation: dict, response_json: dict):
+        """Merge a re-ask answer and keep it only if it validates better than the original"""
+        data = structured_data.model_dump()
+        try:
+            corrected = self.invoice_from_dict(apply_corrections(data, self.response_dict(response_json), validation))
+        except Exception as e:
+            logger.warning(f"Discarding re-ask answer: {e}")
+            return structured_data, {**validation, "reasked": True}
+        corrected_validation = {**validate_invoice(corrected.model_dump()), "reasked": True}
+        if corrected_validation["confidence"] > validation["confidence"]:
+            logger.info(f"Re-ask fixed {validation['confidence']} -> {corrected_validation['confidence']} confidence")
+            return corrected, corrected_validation
+        return structured_data, {**validation, "reasked": True}
+
+    def needs_reask(self, validation: dict) -> bool:
+        return not validation["ok"] and config.RECONCILE_REASK and bool(validation["suspect_items"] or validation["suspect_fields"])
+
+    def parse_routed(self, route: dict, parse: Callable[[str], InvoiceData],
+                     reparse: Optional[Callable[[str], InvoiceData]] = None) -> InvoiceData:
+        """
+        parse(model) on the routed model; a fast-model answer that does not parse is redone on
+        the strong model with reparse(model) (defaults to parse), which must not stream fields again.
+        """
+        try:
+            return parse(route["model"])
+        except (ValueError, KeyError) as e:  # Bad JSON or schema; transport errors would fail the same way again
+            if not can_escalate(route):
+                raise
+            logger.warning(f"Fast model answer unusable: {e}")
+            escalate(route, "parse_failed")
+            return (reparse or parse)(route["model"])
+
+    @staticmethod
+    def pick_escalated(structured_data: InvoiceData, validation: dict, stronger: InvoiceData, route: dict):
+        """Keep the strong model's extraction unless it validates worse than the fast one"""
+        stronger_validation = validate_invoice(stronger.model_dump())
+        if stronger_validation["confidence"] >= validation["confidence"]:
+            return stronger, stronger_validation
+        logger.info(f"Strong model validated worse ({stronger_validation['confidence']}), keeping the fast model's answer")
+        fall_back(route)
+        return structured_data, validation
+
+    def escalate_invalid(self, structured_data: InvoiceData, validation: dict, route: Optional[dict],
+                         reparse: Optional[Callable[[str], InvoiceData]]):
+        """Redo a fast-model extraction that still fails validation on the strong model (reparse never streams)"""
+        if reparse is None or validation["ok"] or not can_escalate(route):
+            return structured_data, validation
+        escalate(route, "validation_failed")
+        try:
+            stronger = reparse(route["model"])
+        except Exception as e:
+            logger.warning(f"Strong model extraction failed: {e}")
+            fall_back(route)
+            return structured_data, validation
+        return self.pick_escalated(structured_data, validation, stronger, route)
+
+    def reconcile(self, structured_data: InvoiceData, text: str, route: Optional[dict] = None,
+                  reparse: Optional[Callable[[str], InvoiceData]] = None):
+        """
+        Check the extraction locally (see invoice_validation.validate_invoice). On failure,
+        the model is first asked again about the suspect values only; a fast-model extraction
+        that still fails is then redone on the strong model (reparse(model), see model_router).
+        Returns (InvoiceData, validation report).
+        """
+        validation = validate_invoice(structured_data.model_dump())
+        structured_data, validation = self.reask_invalid(structured_data, text, validation, route)
+        return self.escalate_invalid(structured_data, validation, route, reparse)
+
+    def reask_invalid(self, structured_data: InvoiceData, text: str, validation: dict, route: Optional[dict]):
+        """Targeted re-ask of the suspect values of an extraction that failed validation"""
+        if not self.needs_reask(validation):
+            return structured_data, validation
+        logger.info(f"Validation failed ({len(validation['issues'])} issue(s)), re-asking for the suspect values")
+        try:
+            payload = self.reask_payload(structured_data.model_dump(), text, validation, route["model"] if route else None)
+            response_json = self.client.chat_completion(payload)
+        except Exception as e:
+            logger.warning(f"Re-ask failed: {e}")
+            return structured_data, validation
+        return self.apply_reask(structured_data, validation, response_json)
+
+    @staticmethod
+    def result_dict(structured_data: InvoiceData, raw_text: str, validation: Optional[dict] = None,
+                    route: Optional[dict] = None) -> dict:
         result = structured_data.model_dump()
+        # Return both structured data and raw text for debugging
         result["_raw_text"] = raw_text
+        result["_validation"] = validation if validation is not None else validate_invoice(result)
+        if route is not None:
+            result["_route"] = route
+        return result
+
+    def finish_result(self, file_hash: str, structured_data: InvoiceData, raw_text: str,
+                      validation: Optional[dict] = None, route: Optional[dict] = None, variant: str = "") -> dict:
+        """Build the result dict and store it in the parse cache"""
+        result = self.result_dict(structured_data, raw_text, validation, route)
+        self._store_result(file_hash, result, variant)
         return result
 
-    def extract_from_image(self, image_bytes: bytes) -> dict:
+    @timed(DOCUMENT_SECONDS, DOCUMENTS, input_type="pdf")
+    @with_usage
+    def process_pdf(self, pdf_path, on_field: Optional[FieldCallback] = None, tenant: Optional[str] = None) -> dict:
+        """
+        Full PDF processing flow: Extract text -> AI Parse -> Return dict.
+        Accepts a file path, bytes/bytearray/memoryview or a file-like object.
+        tenant (the user id) selects whose learned vendor templates may be used.
+        """
+        pdf_path = read_input(pdf_path)
+        logger.info(f"Processing PDF: {describe_input(pdf_path)}")
+        file_hash = self.hash_input(pdf_path)
+        variant = self.tenant_variant(tenant)
+        return self.single_flight(f"pdf:{file_hash}{variant}", self._process_pdf, pdf_path, file_hash, on_field, tenant)
+
+    def _process_pdf(self, pdf_path: PdfSource, file_hash: str, on_field: Optional[FieldCallback],
+                     tenant: Optional[str]) -> dict:
+        variant = self.tenant_variant(tenant)
+        cached = self._cached_result(file_hash, variant)
+        if cached is not None:
+            return cached
+
+        with STAGE_SECONDS.time(stage="pdf_text", input_type="pdf"):
+            pages = self.pdf_pages_stage(pdf_path, file_hash)
+        with STAGE_SECONDS.time(stage="tables", input_type="pdf"):
+            table_items = self.pdf_table_items_stage(pdf_path, file_hash)
+        with STAGE_SECONDS.time(stage="pdf_words", input_type="pdf"):
+            page_words = self.pdf_words_stage(pdf_path, pages[:1], tenant)
+        items = [item for page in table_items for item in page]
+        raw_text = join_pages(pages)
+        route = route_document(raw_text, "pdf", len(items))
+
+        def parse(model: str, on_field: Optional[FieldCallback] = None) -> InvoiceData:
+            return self.parse_pdf_pages(pages, items, page_words, on_field, model, tenant)
+
+        with STAGE_SECONDS.time(stage="parse", input_type="pdf"):
+            structured_data = self.parse_routed(route, lambda model: parse(model, on_field), parse)
+        with STAGE_SECONDS.time(stage="validation", input_type="pdf"):
+            structured_data, validation = self.reconcile(structured_data, raw_text, route, parse)
+        return self.finish_result(file_hash, structured_data, raw_text, validation, route, variant)
+
+    @timed(DOCUMENT_SECONDS, DOCUMENTS, input_type="pdf")
+    def process_pdf_documents(self, pdf_path, on_field: Optional[FieldCallback] = None,
+                              tenant: Optional[str] = None) -> List[dict]:
+        """
+        Like process_pdf, but for a PDF holding several invoices (e.g. a scanned stack of bills).
+        Pages are split into invoice segments and each segment is extracted concurrently,
+        returning one result dict per invoice with its 1-based page range in '_pages'.
+        A segment that fails yields an {"error": ...} dict instead of failing the whole document.
+        on_field streaming is only used when the document turns out to hold a single invoice.
+        """
+        pdf_path = read_input(pdf_path)
+        logger.info(f"Processing multi-invoice PDF: {describe_input(pdf_path)}")
+        file_hash = self.hash_input(pdf_path)
+        variant = self.tenant_variant(tenant)
+        return self.single_flight(f"pdf_split:{file_hash}{variant}", self._process_pdf_documents, pdf_path, file_hash,
+                                  on_field, tenant)
+
+    def _process_pdf_documents(self, pdf_path: PdfSource, file_hash: str, on_field: Optional[FieldCallback],
+                               tenant: Optional[str]) -> List[dict]:
+        variant = ":split" + self.tenant_variant(tenant)
+        cached = self._cached_result(file_hash, variant)
+        if cached is not None:
+            return [dict(result, _usage=UsageRecord().summary()) for result in cached]  # Nothing spent this time
+
+        with STAGE_SECONDS.time(stage="pdf_text", input_type="pdf"):
+            pages = self.pdf_pages_stage(pdf_path, file_hash)
+        segments = split_invoice_pages(pages)
+        texts = [join_pages(pages[start:end]) for start, end in segments]
+        with STAGE_SECONDS.time(stage="tables", input_type="pdf"):
+            table_items = self.pdf_table_items_stage(pdf_path, file_hash)
+        with STAGE_SECONDS.time(stage="pdf_words", input_type="pdf"):
+            page_words = self.pdf_words_stage(pdf_path, [pages[start] for start, _ in segments], tenant)
+        logger.info(f"Detected {len(segments)} invoice(s) in {len(pages)} page(s)")
+
+        def extract_segment(index: int) -> dict:
+            start, end = segments[index]
+            with track_usage() as usage:
+                try:
+                    items = [item for page in table_items[start:end] for item in page]
+                    route = route_document(texts[index], "pdf", len(items))
+
+                    def parse(model: str, on_field: Optional[FieldCallback] = None) -> InvoiceData:
+                        return self.parse_pdf_pages(pages[start:end], items, page_words[start:end] if page_words else None,
+                                                    on_field, model, tenant)
+
+                    stream = on_field if len(segments) == 1 else None
+                    with STAGE_SECONDS.time(stage="parse", input_type="pdf"):
+                        structured_data = self.parse_routed(route, lambda model: parse(model, stream), parse)
+                    with STAGE_SECONDS.time(stage="validation", input_type="pdf"):
+                        structured_data, validation = self.reconcile(structured_data, texts[index], route, parse)
+                    result = self.result_dict(structured_data, texts[index], validation, route)
+                except Exception as e:
+                    result = {"error": f"Invoice on pages {start + 1}-{end} failed: {e}"}
+            result["_pages"] = [start + 1, end]
+            result["_usage"] = usage.summary()
+            return result
+
+        if len(segments) == 1:
+            # Inline, so on_field streams from the caller's thread (Streamlit has no context in a worker)
+            results = [extract_segment(0)]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(segments), config.SPLIT_MAX_WORKERS)) as pool:
+                results = list(pool.map(extract_segment, range(len(segments))))
+
+        if not any("error" in result for result in results):
+            self._store_result(file_hash, results, variant)
+        return results
+
+    @timed(DOCUMENT_SECONDS, DOCUMENTS, input_type="image")
+    @with_usage
+    def extract_from_image(self, image_bytes, on_field: Optional[FieldCallback] = None) -> dict:
         """
         Use EasyOCR to extract text from images, then send to DeepSeek for structuring.
+        Accepts bytes/bytearray/memoryview or a file-like object.
         """
         logger.info("Starting OCR processing for image...")
+        missing = self.check_ocr_dependencies()
+        if missing:
+            return missing
+
+        image_bytes = read_input(image_bytes)
+        file_hash = hash_bytes(image_bytes)
+        return self.single_flight(f"image:{file_hash}", self._extract_from_image, image_bytes, file_hash, on_field)
+
+    def _extract_from_image(self, image_bytes: bytes, file_hash: str, on_field: Optional[FieldCallback]) -> dict:
+        cached = self._cached_result(file_hash)
+        if cached is not None:
+            return cached
+
+        try:
+            text = self.image_text_stage(image_bytes, file_hash)
+
+            # Send to DeepSeek for structuring, on the model picked by complexity
+            route = route_document(text, "image")
+            reparse = functools.partial(self.parse_with_ai, text)  # Without on_field: fields are streamed once
+            with STAGE_SECONDS.time(stage="parse", input_type="image"):
+                structured_data = self.parse_routed(route, lambda model: self.parse_with_ai(text, on_field, model), reparse)
+            with STAGE_SECONDS.time(stage="validation", input_type="image"):
+                structured_data, validation = self.reconcile(structured_data, text, route, reparse)
+            return self.finish_result(file_hash, structured_data, text, validation, route)
+
+        except ExtractionError as e:
+            return {"error": str(e)}
+        except Exception as e:
+            logger.error(f"OCR processing failed: {e}")
+            return {"error": f"Image recognition failed: {str(e)}"}
+
+    @staticmethod
+    def check_ocr_dependencies() -> Optional[dict]:
+        """Error dict if the OCR libraries are not installed, else None"""
         try:
             import easyocr
             import numpy as np
@@ -134,54 +940,92 @@ class AIInvoiceExtractor:
             return {
                 "error": "Missing necessary OCR libraries. Please run in terminal: pip install easyocr opencv-python-headless"
             }
+        return None
 
-        try:
-            # 1. Convert image bytes to OpenCV format
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if img is None:
-                return {"error": "Unable to decode image file"}
-
-            # 2. Pre-processing for Receipt OCR (Upscaling + Contrast)
-            # Strategy: Upscale image to make decimal points larger and clearer.
-            # Binarization is removed as it was causing data loss (garbled text).
-            
-            # Upscale (2x or 3x) to separate dots from numbers
-            # Use Cubic interpolation for better text quality
-            scale_factor = 2.0
-            if img.shape[1] < 2000: # Only upscale if not already huge
-                img = cv2.resize(img, None, fx=scale_factor, fy=scale_factor, interpolation=cv2.INTER_CUBIC)
-
-            # Convert to grayscale
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # Contrast Enhancement (CLAHE)
-            # Makes text darker and background lighter without the harshness of thresholding
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            processed_img = clahe.apply(gray)
-            
-            # 3. Initialize EasyOCR (Supports Chinese and English)
-            # Note: First run will download model, may take some time
-            reader = easyocr.Reader(['ch_sim', 'en'], gpu=False) 
-            
-            # 4. Extract text from PROCESSED image
-            result = reader.readtext(processed_img, detail=0)
-            text = "\n".join(result)
-            
-            logger.info(f"OCR extracted {len(text)} characters.")
-            
-            if not text.strip():
-                return {"error": "OCR failed to identify any text from the image."}
+    def _ocr_image(self, image_bytes: bytes) -> Optional[str]:
+        """Decode, pre-process and OCR an image. Returns None if the image cannot be decoded."""
+        from image_preprocess import preprocess_image
 
-            # 4. Send to DeepSeek for structuring
-            structured_data = self.parse_with_ai(text)
-            
-            # Return both structured data and raw text for debugging
-            result_dict = structured_data.model_dump()
-            result_dict["_raw_text"] = text
-            return result_dict
+        # 1. Pre-processing: reduced decode, receipt crop, deskew, scale to the target text height, CLAHE
+        processed_img, timings = preprocess_image(
+            image_bytes,
+            target_text_height=config.OCR_TARGET_TEXT_HEIGHT,
+            decode_max_side=config.OCR_DECODE_MAX_SIDE,
+            deskew=config.OCR_DESKEW,
+            crop=config.OCR_CROP_RECEIPT
+        )
+        if processed_img is None:
+            return None
 
-        except Exception as e:
-            logger.error(f"OCR processing failed: {e}")
-            return {"error": f"Image recognition failed: {str(e)}"}
+        # 2. Extract text from PROCESSED image using a pooled EasyOCR reader
+        return self._ocr_prepared(processed_img, timings, input_type="image")
+
+    def _ocr_prepared(self, processed_img, timings: dict, input_type: str) -> str:
+        """OCR an already pre-processed image and log (and record) where the time went"""
+        STAGE_SECONDS.observe(sum(timings.values()) / 1000, stage="preprocess", input_type=input_type, outcome="ok")
+        # Note: First run will download model, may take some time
+        start = time.perf_counter()
+        with STAGE_SECONDS.time(stage="ocr", input_type=input_type):
+            result = self.ocr_pool.readtext(processed_img)
+        timings["ocr"] = round((time.perf_counter() - start) * 1000, 1)
+        text = "\n".join(result)
+
+        steps = ", ".join(f"{step} {ms:.0f}ms" for step, ms in timings.items())
+        logger.info(f"OCR timings ({processed_img.shape[1]}x{processed_img.shape[0]} px): {steps}")
+        logger.info(f"OCR extracted {len(text)} characters.")
+        return text
+
+    def _ocr_pdf_page(self, page_image) -> str:
+        """OCR one rasterized PDF page (grayscale PIL image) through the same pipeline as uploaded photos"""
+        import numpy as np
+        from image_preprocess import prepare_for_ocr
+
+        timings = {}
+        processed_img = prepare_for_ocr(
+            np.asarray(page_image),
+            target_text_height=config.OCR_TARGET_TEXT_HEIGHT,
+            deskew=config.OCR_DESKEW,
+            crop=False,  # A page is already the document
+            timings=timings
+        )
+        return self._ocr_prepared(processed_img, timings, input_type="pdf")
+
+    def ocr_scanned_pages(self, pdf_path: PdfSource, pages: List[str]) -> List[str]:
+        """
+        Replace the text of pages without a usable text layer (scans, image-only pages,
+        unmapped fonts) with OCR text. Only those pages are rasterized; they are OCR'd
+        concurrently (bounded by the OCR pool) while later pages render, and merged back in order.
+        """
+        scanned = [index for index, text in enumerate(pages) if not has_usable_text(text)]
+        if not scanned or not config.PDF_OCR_FALLBACK:
+            return pages
+        if self.check_ocr_dependencies():
+            logger.warning(f"{len(scanned)} PDF page(s) have no usable text layer, but OCR is not installed")
+            return pages
+
+        logger.info(f"OCR fallback for {len(scanned)} of {len(pages)} PDF page(s)")
+        pages = list(pages)
+        in_flight = threading.BoundedSemaphore(self.ocr_pool.size * 2)  # Rendered pages held in memory
+
+        def ocr_page(page_image) -> str:
+            try:
+                return self._ocr_pdf_page(page_image)
+            finally:
+                in_flight.release()
+
+        with ThreadPoolExecutor(max_workers=self.ocr_pool.size) as pool:
+            futures = {}
+            for index, page_image in self.pdf_text.render_pages(
+                pdf_path, scanned, config.PDF_OCR_TARGET_SIDE, config.PDF_OCR_MIN_DPI, config.PDF_OCR_MAX_DPI
+            ):
+                in_flight.acquire()
+                futures[index] = pool.submit(ocr_page, page_image)
+            for index, future in futures.items():
+                try:
+                    text = future.result()
+                except Exception as e:
+                    logger.warning(f"OCR failed for PDF page {index + 1}: {e}")
+                    continue
+                if text.strip():
+                    pages[index] = text
+        return pages
@@ -0,0 +1,102 @@
+import re
+from typing import List, Optional, Tuple
+
+# "Page 1 of 3", "Page 1/3", "Pg. 1 of 3"
+PAGE_OF_RE = re.compile(r"\b(?:page|pg\.?)\s*(\d+)\s*(?:of|/)\s*(\d+)\b", re.IGNORECASE)
+INVOICE_NUMBER_RE = re.compile(
+    r"\b(?:invoice|inv|bill|receipt)\s*(?:no\.?|number|num|#)\s*[:#.]?\s*([A-Z0-9][A-Z0-9\-/]{2,})",
+    re.IGNORECASE
+)
+# Words that usually appear near the top of the first page of a document
+FIRST_PAGE_KEYWORDS_RE = re.compile(r"\b(?:invoice|bill|receipt|statement|tax invoice)\b|发票", re.IGNORECASE)
+HEADER_LINES = 8
+# A continuation page never starts an invoice, whatever else it shows
+CONTINUED_RE = re.compile(r"\(\s*continued\s*\)|\bcont(?:'|\u2019)?d\b|\bcontinued (?:from|on)\b", re.IGNORECASE)
+# The total block that closes an invoice ("Total", "Grand Total", "Amount Due"; not "Subtotal")
+TOTAL_BLOCK_RE = re.compile(
+    r"^\s*(?:grand\s+|invoice\s+)?total(?:\s+(?:due|amount|payable))?\b|\b(?:amount|balance)\s+due\b|合计|总计",
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+def _top_lines(page_text: str) -> List[str]:
+    return [line.strip() for line in page_text.splitlines() if line.strip()][:HEADER_LINES]
+
+
+def letterhead_key(page_text: str) -> Optional[str]:
+    """First non-empty line, normalized: usually the vendor letterhead"""
+    lines = _top_lines(page_text)
+    if not lines:
+        return None
+    return re.sub(r"[^a-z0-9]", "", lines[0].lower()) or None
+
+
+def _page_position(page_text: str) -> Optional[int]:
+    """The 'k' of a 'Page k of N' marker, if any"""
+    match = PAGE_OF_RE.search(page_text)
+    return int(match.group(1)) if match else None
+
+
+def _invoice_number(page_text: str) -> Optional[str]:
+    match = INVOICE_NUMBER_RE.search(page_text)
+    return match.group(1).upper() if match else None
+
+
+def split_invoice_pages(page_texts: List[str]) -> List[Tuple[int, int]]:
+    """
+    Split a document's pages into invoice segments, returned as [start, end) page ranges.
+    A page starts a new invoice when it is marked "Page 1 of N". Without page markers, a
+    different invoice number, or a different letterhead on a page that looks like a first
+    page, only starts a new invoice once the current one has shown its total block: a
+    statement listing other invoice numbers stays whole. "Page k of N" with k > 1 and
+    "(continued)" pages always continue the current invoice, and pages without text are
+    attached to the invoice before them.
+    """
+    if not page_texts:
+        return []
+
+    segments = []
+    start = 0
+    current_number = _invoice_number(page_texts[0])
+    current_header = letterhead_key(page_texts[0])
+    segment_has_total = bool(TOTAL_BLOCK_RE.search(page_texts[0]))
+
+    for index in range(1, len(page_texts)):
+        text = page_texts[index]
+        if not text.strip():
+            continue
+
+        position = _page_position(text)
+        number = _invoice_number(text)
+        header = letterhead_key(text)
+
+        if CONTINUED_RE.search(text):
+            is_boundary = False
+        elif position is not None:
+            is_boundary = position == 1
+        elif not segment_has_total:
+            is_boundary = False
+        elif number and current_number and number != current_number:
+            is_boundary = True
+        else:
+            looks_like_first_page = bool(FIRST_PAGE_KEYWORDS_RE.search("\n".join(_top_lines(text))))
+            is_boundary = (
+                looks_like_first_page
+                and header is not None
+                and current_header is not None
+                and header != current_header
+            )
+
+        if is_boundary:
+            segments.append((start, index))
+            start = index
+            current_number = number
+            current_header = header
+            segment_has_total = False
+        else:
+            current_number = current_number or number
+            current_header = current_header or header
+        segment_has_total = segment_has_total or bool(TOTAL_BLOCK_RE.search(text))
+
+    segments.append((start, len(page_texts)))
+    return segments
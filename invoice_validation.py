@@ -0,0 +1,135 @@
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from table_extractor import DATE_LINE_RE, TAX_LINE_RE, TOTAL_LINE_RE
+
+# Same tolerance as the data editor check in the app
+AMOUNT_TOLERANCE = 0.02
+MAX_TAX_RATE = 0.3
+DATE_FORMAT = "%m/%d/%Y"
+# Confidence deductions per failed check
+PENALTIES = {"total": 0.4, "line_math": 0.1, "tax": 0.15, "date": 0.1}
+MAX_LINE_MATH_PENALTY = 0.3
+MAX_CONTEXT_LINES = 40
+
+
+def _close(a: float, b: float) -> bool:
+    return abs(a - b) <= max(AMOUNT_TOLERANCE, abs(b) * 0.001)
+
+
+def _parse_date(value) -> Optional[datetime]:
+    try:
+        return datetime.strptime(str(value), DATE_FORMAT)
+    except ValueError:
+        return None
+
+
+def validate_invoice(data: dict) -> dict:
+    """
+    Local arithmetic and sanity checks on an extracted invoice dict:
+    - line_math: quantity x unit_price = total_price for each item that has both
+    - total:     Sum(items.total_price) + tax_amount = total_amount
+    - tax:       0 <= tax_amount, and at most MAX_TAX_RATE of the pre-tax amount
+    - date:      dates in MM/DD/YYYY, not far in the future, due date not before the invoice date
+    Returns a JSON-serializable report: ok, confidence (0-1), the failed checks,
+    and the suspect item indices and header fields a targeted re-ask should cover.
+    """
+    items = data.get("items") or []
+    total = data.get("total_amount") or 0.0
+    tax = data.get("tax_amount") or 0.0
+    issues = []
+    suspect_items = []
+    suspect_fields = []
+
+    for index, item in enumerate(items):
+        quantity, unit_price = item.get("quantity"), item.get("unit_price")
+        if quantity is None or unit_price is None:
+            continue
+        expected = round(quantity * unit_price, 2)
+        if not _close(expected, item.get("total_price") or 0.0):
+            suspect_items.append(index)
+            issues.append({
+                "check": "line_math", "item": index,
+                "message": f"Item {index + 1}: {quantity} x {unit_price} = {expected}, but total_price is {item.get('total_price')}"
+            })
+
+    if items:
+        items_sum = round(sum(item.get("total_price") or 0.0 for item in items), 2)
+        if not _close(items_sum + tax, total):
+            suspect_fields.extend(["total_amount", "tax_amount"])
+            issues.append({
+                "check": "total",
+                "message": f"Items ({items_sum:.2f}) + tax ({tax:.2f}) = {items_sum + tax:.2f}, but total_amount is {total:.2f}"
+            })
+
+    if suspect_items and "total_amount" not in suspect_fields:
+        # A fixed line changes the item sum: let the re-ask confirm the total against the same lines
+        suspect_fields.append("total_amount")
+
+    if tax < 0 or (total > 0 and tax > (total - tax) * MAX_TAX_RATE):
+        if "tax_amount" not in suspect_fields:
+            suspect_fields.append("tax_amount")
+        issues.append({"check": "tax", "message": f"Implausible tax_amount {tax:.2f} for total {total:.2f}"})
+
+    dates = {}
+    for field in ("date", "due_date"):
+        value = data.get(field)
+        if value in (None, ""):
+            continue
+        parsed = _parse_date(value)
+        if parsed is None or parsed.year < 2000 or parsed > datetime.now() + timedelta(days=366):
+            suspect_fields.append(field)
+            issues.append({"check": "date", "field": field, "message": f"{field} '{value}' is not a plausible MM/DD/YYYY date"})
+        else:
+            dates[field] = parsed
+    if "date" in dates and "due_date" in dates and dates["due_date"] < dates["date"]:
+        suspect_fields.append("due_date")
+        issues.append({"check": "date", "field": "due_date", "message": "due_date is before the invoice date"})
+
+    line_math_penalty = min(MAX_LINE_MATH_PENALTY, PENALTIES["line_math"] * len(suspect_items))
+    penalty = line_math_penalty + sum(PENALTIES[issue["check"]] for issue in issues if issue["check"] != "line_math")
+    return {
+        "ok": not issues,
+        "confidence": round(max(0.0, 1.0 - penalty), 2),
+        "issues": issues,
+        "suspect_items": suspect_items,
+        "suspect_fields": list(dict.fromkeys(suspect_fields)),
+    }
+
+
+def suspect_context(text: str, data: dict, validation: dict) -> List[str]:
+    """
+    Source lines the suspect values most likely came from: lines mentioning a suspect
+    item's description, and total/tax/date lines for suspect header fields.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    items = data.get("items") or []
+    needles = []
+    for index in validation["suspect_items"]:
+        item = items[index]
+        description = re.sub(r"\s+", " ", str(item.get("description") or "")).strip().lower()
+        needles.append(lambda line, d=description[:12]: bool(d) and d in line.lower())
+    fields = validation["suspect_fields"]
+    if "total_amount" in fields:
+        needles.append(lambda line: bool(TOTAL_LINE_RE.search(line)))
+    if "tax_amount" in fields:
+        needles.append(lambda line: bool(TAX_LINE_RE.search(line)))
+    if "date" in fields or "due_date" in fields:
+        needles.append(lambda line: bool(DATE_LINE_RE.search(line)))
+    return [line for line in lines if any(needle(line) for needle in needles)][:MAX_CONTEXT_LINES]
+
+
+def apply_corrections(data: dict, corrections: dict, validation: dict) -> dict:
+    """Merge a re-ask answer into the invoice dict, touching only the suspect items and fields"""
+    corrected = {**data, "items": [dict(item) for item in data.get("items") or []]}
+    for fix in corrections.get("items") or []:
+        index = fix.get("index")
+        if isinstance(index, int) and index in validation["suspect_items"]:
+            for key in ("quantity", "unit_price", "total_price"):
+                if fix.get(key) is not None:
+                    corrected["items"][index][key] = fix[key]
+    for field in validation["suspect_fields"]:
+        if corrections.get(field) is not None:
+            corrected[field] = corrections[field]
+    return corrected
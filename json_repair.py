@@ -0,0 +1,148 @@
+"""
+Tolerant decoding of the JSON object in an LLM answer. json.loads is tried first; only
+malformed output is repaired: prose and markdown fences around the object are dropped,
+trailing commas removed, mismatched brackets fixed, and a truncated answer is cut back to
+its last complete value and closed. The caller still validates the result (InvoiceData).
+"""
+import json
+import re
+from typing import List, Tuple
+
+WHITESPACE = " \t\r\n"
+CLOSERS = {"{": "}", "[": "]"}
+
+# The last scalar of a truncated answer: a number may have lost digits, a literal is incomplete
+PARTIAL_SCALAR_RE = re.compile(r"(?:-?\d[\d.eE+-]*|-|t|tr|tru|f|fa|fal|fals|n|nu|nul)$")
+LAST_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"$', re.DOTALL)
+
+
+class JSONRepairError(ValueError):
+    """The answer holds no JSON object, even after repair"""
+
+
+class TruncatedAnswerError(JSONRepairError):
+    """The answer was cut off (max_tokens reached): repairing it would silently lose fields or items"""
+
+
+def strip_fences(content: str) -> str:
+    return content.replace("```json", "").replace("```", "").strip()
+
+
+def _scan(text: str):
+    """
+    Copy the first JSON object in text, dropping trailing commas and stray or mismatched
+    closers. Returns (output chars, brackets still open, start of an unterminated string, repairs).
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    repairs: List[str] = []
+    in_string = escape = False
+    string_start = None
+    start = text.find("{")
+    if start < 0:
+        raise JSONRepairError("No JSON object in the model answer")
+    if text[:start].strip():
+        repairs.append("leading prose")
+
+    for index in range(start, len(text)):
+        ch = text[index]
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+            string_start = len(out)
+        elif ch in CLOSERS:
+            stack.append(CLOSERS[ch])
+        elif ch in "}]":
+            if ch not in stack:
+                repairs.append(f"stray {ch}")
+                continue
+            while out and out[-1] in WHITESPACE + ",":
+                if out.pop() == ",":
+                    repairs.append("trailing comma")
+            while stack[-1] != ch:
+                out.append(stack.pop())
+                repairs.append("unclosed bracket")
+            stack.pop()
+            if not stack:
+                out.append(ch)
+                if text[index + 1:].strip():
+                    repairs.append("trailing prose")
+                break
+        out.append(ch)
+    return out, stack, string_start if in_string else None, repairs
+
+
+def _trim_dangling(text: str, inside_object: bool) -> Tuple[str, bool]:
+    """
+    Cut a truncated answer back to its last complete value: a trailing number or literal
+    may be cut short, so it is dropped along with its key, as are dangling commas and keys.
+    Returns (trimmed text, whether a value or key was dropped).
+    """
+    cut_at = len(text.rstrip(WHITESPACE))
+    dropped = False
+    while True:
+        trimmed = text.rstrip(WHITESPACE)
+        # Only the scalar the answer was cut in is suspect; those before it are complete
+        scalar = PARTIAL_SCALAR_RE.search(trimmed) if len(trimmed) == cut_at else None
+        if trimmed.endswith(","):
+            trimmed = trimmed[:-1]
+        elif trimmed.endswith(":"):
+            trimmed = LAST_STRING_RE.sub("", trimmed[:-1].rstrip(WHITESPACE))  # The key of the missing value
+            dropped = True
+        elif scalar and trimmed[:scalar.start()].rstrip(WHITESPACE).endswith((":", "[", ",")):
+            trimmed = trimmed[:scalar.start()]
+            dropped = True
+        elif inside_object and LAST_STRING_RE.search(trimmed):
+            key = LAST_STRING_RE.search(trimmed)
+            before = trimmed[:key.start()].rstrip(WHITESPACE)
+            if before.endswith(("{", ",")):
+                trimmed = before  # A key whose colon never came
+                dropped = True
+        if trimmed == text:
+            return text, dropped
+        text = trimmed
+
+
+def repair(text: str) -> Tuple[str, List[str]]:
+    """
+    Repaired JSON text of the first object in text, and the repairs made. A truncated
+    answer is closed; "dropped value" is reported when the cut-off value had to be removed.
+    """
+    out, stack, string_start, repairs = _scan(text)
+    if stack:
+        repairs.append("truncated")
+        if string_start is not None:
+            del out[string_start:]  # A cut-off string ("Gad" for "Gadget") is dropped, not guessed
+        fixed, dropped = _trim_dangling("".join(out), stack[-1] == "}")
+        if dropped or string_start is not None:
+            repairs.append("dropped value")
+        # Trimming can remove an opening bracket's last content but never the bracket itself
+        return fixed + "".join(reversed(stack)), repairs
+    return "".join(out), repairs
+
+
+def loads_object(content: str) -> Tuple[dict, List[str]]:
+    """(decoded JSON object, repairs applied: empty for well-formed output); raises JSONRepairError"""
+    text = strip_fences(content)
+    try:
+        value = json.loads(text)
+        if isinstance(value, dict):
+            return value, []
+    except ValueError:
+        pass
+    fixed, repairs = repair(text)
+    try:
+        value = json.loads(fixed, strict=False)  # strict=False: raw newlines inside strings
+    except ValueError as e:
+        raise JSONRepairError(f"Model answer is not valid JSON, even after repair: {e}") from e
+    if not isinstance(value, dict):
+        raise JSONRepairError("Model answer is not a JSON object")
+    return value, repairs
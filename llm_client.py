@@ -0,0 +1,381 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from typing import Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+from llm_replay import OFF, AsyncRecordReplayTransport, Cassette, MODES, RecordReplayAdapter
+from llm_resilience import LatencyTracker, create_breaker, resilience_state, usable_completion
+from llm_usage import in_current_context, record_call
+from metrics import LLM_HEDGES, LLM_REQUEST_SECONDS, LLM_RETRIES, record_usage
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: rate limiting and transient server/gateway errors
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def compute_backoff(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Delay before retry number `attempt` (starting at 1).
+    Full-jitter exponential backoff, but never shorter than the server's Retry-After.
+    """
+    ceiling = min(config.DEEPSEEK_BACKOFF_MAX, config.DEEPSEEK_BACKOFF_BASE * (2 ** (attempt - 1)))
+    delay = random.uniform(0, ceiling)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, config.DEEPSEEK_BACKOFF_MAX))
+    return delay
+
+
+def replay_cassette() -> Optional[Cassette]:
+    """The cassette for DEEPSEEK_REPLAY_MODE=record/replay, None when recording and replay are off"""
+    if config.DEEPSEEK_REPLAY_MODE not in MODES:
+        raise ValueError(f"DEEPSEEK_REPLAY_MODE must be one of {', '.join(MODES)}, got {config.DEEPSEEK_REPLAY_MODE!r}")
+    if config.DEEPSEEK_REPLAY_MODE == OFF:
+        return None
+    logger.info(f"DeepSeek requests in {config.DEEPSEEK_REPLAY_MODE} mode, cassette {config.DEEPSEEK_CASSETTE_DIR}")
+    return Cassette(config.DEEPSEEK_CASSETTE_DIR)
+
+
+def account_call(payload: dict, model: Optional[str], usage: Optional[dict], started: float):
+    """Feed one completed call into the token metrics and the usage record of the extraction it belongs to"""
+    record_usage(usage)
+    record_call(model or payload.get("model"), usage, started)
+
+
+def retry_reason(error: Exception) -> str:
+    """Metrics label for a retried attempt: the HTTP status, or the transport error type"""
+    response = getattr(error, "response", None)
+    return str(response.status_code) if response is not None else type(error).__name__
+
+
+class DeepSeekClient:
+    """
+    Thread-safe, keep-alive HTTP client for the DeepSeek chat completions API.
+    One instance is shared by every session using the extractor, so TCP/TLS
+    connections are reused instead of re-handshaking per invoice.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 pool_size: Optional[int] = None, max_retries: Optional[int] = None):
+        self.base_url = (base_url or config.DEEPSEEK_BASE_URL).rstrip('/')
+        self.api_key = api_key or config.DEEPSEEK_API_KEY
+        self.max_retries = config.DEEPSEEK_MAX_RETRIES if max_retries is None else max_retries
+        self.timeout = (config.DEEPSEEK_CONNECT_TIMEOUT, config.DEEPSEEK_READ_TIMEOUT)
+        self.first_chunk_timeout = config.DEEPSEEK_STREAM_FIRST_CHUNK_TIMEOUT
+
+        pool_size = pool_size or config.DEEPSEEK_POOL_SIZE
+        self.session = requests.Session()
+        # Retries are handled in _post so Retry-After and jitter are applied uniformly
+        adapter_options = dict(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        cassette = replay_cassette()
+        if cassette is not None:
+            adapter = RecordReplayAdapter(cassette, config.DEEPSEEK_REPLAY_MODE, **adapter_options)
+        else:
+            adapter = HTTPAdapter(**adapter_options)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        })
+        self.breaker = create_breaker("sync")
+        self.latency = LatencyTracker()
+        self.hedging = config.DEEPSEEK_HEDGE_ENABLED
+        # Primary and hedge attempts run here so the caller can wait for whichever answers first
+        self._hedge_pool = ThreadPoolExecutor(max_workers=2 * pool_size, thread_name_prefix="deepseek-hedge") if self.hedging else None
+
+    def _post(self, payload: dict, stream: bool = False) -> requests.Response:
+        """POST /chat/completions with timeouts and retries, returning the successful response"""
+        url = f"{self.base_url}/chat/completions"
+        attempt = 0
+        while True:
+            attempt += 1
+            retry_after = None
+            if self.breaker is not None:
+                self.breaker.before_request()
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout, stream=stream)
+                if response.status_code not in RETRYABLE_STATUS:
+                    if not (stream and response.ok):  # A stream's outcome is recorded once it has been read
+                        self._record_outcome(failed=False)
+                    if not response.ok:
+                        response.close()  # Release the pooled connection of an unread stream
+                    response.raise_for_status()
+                    return response
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                error = requests.HTTPError(f"{response.status_code} from DeepSeek: {response.text[:200]}", response=response)
+                response.close()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            self._record_outcome(failed=True, error=error)
+
+            if attempt > self.max_retries:
+                logger.error(f"DeepSeek request failed after {attempt} attempt(s): {error}")
+                raise error
+
+            delay = compute_backoff(attempt, retry_after)
+            logger.warning(f"DeepSeek request attempt {attempt} failed ({error}), retrying in {delay:.1f}s")
+            LLM_RETRIES.inc(reason=retry_reason(error))
+            time.sleep(delay)
+
+    def _record_outcome(self, failed: bool, error: Optional[Exception] = None):
+        if self.breaker is not None:
+            self.breaker.record(failed, error)
+
+    def _complete(self, payload: dict) -> dict:
+        """One request (with its retries): accounted, and its latency fed to the hedge delay"""
+        started = time.perf_counter()
+        body = self._post(payload).json()
+        self.latency.observe(time.perf_counter() - started)
+        account_call(payload, body.get("model"), body.get("usage"), started)
+        return body
+
+    def chat_completion(self, payload: dict) -> dict:
+        """Non-streaming chat completion, returning the decoded JSON body"""
+        with LLM_REQUEST_SECONDS.time(mode="sync"):
+            if self.hedging:
+                return self._hedged(payload)
+            return self._complete(payload)
+
+    def _hedged(self, payload: dict) -> dict:
+        """
+        Send the request; if it has not answered after the hedge delay (the observed p95),
+        send it again and return the first usable answer. requests cannot abort a call in
+        progress, so the slower attempt is abandoned: it finishes in the background, its
+        answer is dropped and its tokens (billed all the same) are still accounted.
+        """
+        attempt = in_current_context(self._complete)
+        primary = self._hedge_pool.submit(attempt, payload)
+        delay = self.latency.hedge_delay()
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        logger.info(f"No DeepSeek answer after {delay:.1f}s, sending a hedge request")
+        pending = {primary: "primary", self._hedge_pool.submit(attempt, payload): "hedge"}
+        body = error = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                winner = pending.pop(future)
+                try:
+                    body = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if usable_completion(body):
+                    LLM_HEDGES.inc(winner=winner)
+                    for other in pending:
+                        other.cancel()  # Only stops an attempt still queued for a worker
+                    return body
+        if body is not None:
+            return body  # Neither answer is usable: the caller's validation reports it
+        raise error
+
+    def resilience_state(self) -> dict:
+        return resilience_state(self.breaker, self.latency, self.hedging)
+
+    def stream_chat_completion(self, payload: dict) -> Iterator[dict]:
+        """
+        Streaming chat completion: yields each server-sent event chunk as a dict.
+        A stream that fails or sends no chunk within first_chunk_timeout (the server may
+        queue it behind keep-alives) is restarted, as nothing was yielded yet; once chunks
+        have been yielded a broken stream raises. The breaker records the outcome of the
+        whole stream, not just its headers.
+        """
+        started = time.perf_counter()
+        model = usage = None
+        # include_usage: the final chunk carries the token counts
+        body = dict(payload, stream=True, stream_options={"include_usage": True})
+        attempt = 0
+        with LLM_REQUEST_SECONDS.time(mode="stream"):
+            while True:
+                attempt += 1
+                response = self._post(body, stream=True)
+                opened = time.perf_counter()
+                chunks = 0
+                try:
+                    with response:
+                        for line in response.iter_lines(decode_unicode=True):
+                            if not chunks and self.first_chunk_timeout and time.perf_counter() - opened > self.first_chunk_timeout:
+                                raise requests.Timeout(f"No stream chunk within {self.first_chunk_timeout:.0f}s")
+                            if not line or not line.startswith("data:"):
+                                continue  # Blank separators and SSE keep-alive comments
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                break
+                            chunk = json.loads(data)
+                            model = chunk.get("model") or model
+                            usage = chunk.get("usage") or usage
+                            chunks += 1
+                            yield chunk
+                except (requests.RequestException, ValueError) as e:  # ValueError: a malformed event
+                    self._record_outcome(failed=True, error=e)
+                    if chunks or attempt > self.max_retries:
+                        logger.error(f"DeepSeek stream failed after {chunks} chunk(s): {e}")
+                        raise
+                    logger.warning(f"DeepSeek stream failed before its first chunk ({e}), restarting it")
+                    LLM_RETRIES.inc(reason=retry_reason(e))
+                    continue
+                self._record_outcome(failed=False)
+                break
+        account_call(payload, model, usage, started)
+
+    def close(self):
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+class AsyncDeepSeekClient:
+    """
+    asyncio counterpart of DeepSeekClient built on httpx.AsyncClient.
+    Same timeouts and retry policy; the underlying connection pool is created
+    lazily so the client can be constructed outside a running event loop.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 pool_size: Optional[int] = None, max_retries: Optional[int] = None):
+        self.base_url = (base_url or config.DEEPSEEK_BASE_URL).rstrip('/')
+        self.api_key = api_key or config.DEEPSEEK_API_KEY
+        self.max_retries = config.DEEPSEEK_MAX_RETRIES if max_retries is None else max_retries
+        self.pool_size = pool_size or config.DEEPSEEK_POOL_SIZE
+        self.breaker = create_breaker("async")
+        self.latency = LatencyTracker()
+        self.hedging = config.DEEPSEEK_HEDGE_ENABLED
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            import httpx
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            transport = None
+            cassette = replay_cassette()
+            if cassette is not None:
+                # A custom transport owns the pool, so the limits move onto the wrapped one
+                transport = AsyncRecordReplayTransport(
+                    cassette, config.DEEPSEEK_REPLAY_MODE, httpx.AsyncHTTPTransport(limits=limits)
+                )
+            self._client = httpx.AsyncClient(
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                timeout=httpx.Timeout(config.DEEPSEEK_READ_TIMEOUT, connect=config.DEEPSEEK_CONNECT_TIMEOUT),
+                limits=limits,
+                transport=transport
+            )
+        return self._client
+
+    async def chat_completion(self, payload: dict) -> dict:
+        """POST /chat/completions with timeouts and retries, returning the decoded JSON body"""
+        with LLM_REQUEST_SECONDS.time(mode="async"):
+            if self.hedging:
+                return await self._hedged(payload)
+            return await self._complete(payload)
+
+    async def _complete(self, payload: dict) -> dict:
+        started = time.perf_counter()
+        body = await self._post(payload)
+        self.latency.observe(time.perf_counter() - started)
+        account_call(payload, body.get("model"), body.get("usage"), started)
+        return body
+
+    async def _hedged(self, payload: dict) -> dict:
+        """As DeepSeekClient._hedged, except the losing attempt is cancelled (httpx aborts the request)"""
+        primary = asyncio.ensure_future(self._complete(payload))
+        delay = self.latency.hedge_delay()
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        logger.info(f"No DeepSeek answer after {delay:.1f}s, sending a hedge request")
+        pending = {primary: "primary", asyncio.ensure_future(self._complete(payload)): "hedge"}
+        body = error = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    winner = pending.pop(task)
+                    try:
+                        body = task.result()
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    if usable_completion(body):
+                        LLM_HEDGES.inc(winner=winner)
+                        return body
+        finally:
+            for task in pending:
+                task.cancel()
+        if body is not None:
+            return body
+        raise error
+
+    def resilience_state(self) -> dict:
+        return resilience_state(self.breaker, self.latency, self.hedging)
+
+    async def _post(self, payload: dict) -> dict:
+        import httpx
+        client = self._get_client()
+        url = f"{self.base_url}/chat/completions"
+        attempt = 0
+        while True:
+            attempt += 1
+            retry_after = None
+            if self.breaker is not None:
+                self.breaker.before_request()
+            try:
+                response = await client.post(url, json=payload)
+                if response.status_code not in RETRYABLE_STATUS:
+                    self._record_outcome(failed=False)
+                    response.raise_for_status()
+                    return response.json()
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                error = httpx.HTTPStatusError(
+                    f"{response.status_code} from DeepSeek: {response.text[:200]}",
+                    request=response.request, response=response
+                )
+            except httpx.TransportError as e:
+                error = e
+            self._record_outcome(failed=True, error=error)
+
+            if attempt > self.max_retries:
+                logger.error(f"DeepSeek request failed after {attempt} attempt(s): {error}")
+                raise error
+
+            delay = compute_backoff(attempt, retry_after)
+            logger.warning(f"DeepSeek request attempt {attempt} failed ({error}), retrying in {delay:.1f}s")
+            LLM_RETRIES.inc(reason=retry_reason(error))
+            await asyncio.sleep(delay)
+
+    def _record_outcome(self, failed: bool, error: Optional[Exception] = None):
+        if self.breaker is not None:
+            self.breaker.record(failed, error)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
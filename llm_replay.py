@@ -0,0 +1,150 @@
+"""
+Record/replay transport for the DeepSeek clients: capture real chat completions once
+(DEEPSEEK_REPLAY_MODE=record), then answer the same requests from disk, deterministically
+and without network access (DEEPSEEK_REPLAY_MODE=replay).
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+OFF, RECORD, REPLAY = "off", "record", "replay"
+MODES = (OFF, RECORD, REPLAY)
+
+
+class CassetteMiss(LookupError):
+    """Replay mode got a request that was never recorded (not retryable)"""
+
+
+def request_key(body) -> str:
+    """SHA-256 of the request JSON with sorted keys, so field order does not change the key"""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    try:
+        canonical = json.dumps(json.loads(body or b"null"), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    except ValueError:
+        canonical = body or b""
+    return hashlib.sha256(canonical).hexdigest()
+
+
+def recorded_content(entry: dict) -> str:
+    """Assistant message text of a recorded response, whether it was recorded streaming or not"""
+    body = entry["body"]
+    if not body.lstrip().startswith("data:"):
+        return json.loads(body)["choices"][0]["message"]["content"]
+    parts = []
+    for line in body.splitlines():
+        data = line[len("data:"):].strip() if line.startswith("data:") else ""
+        if data and data != "[DONE]":
+            parts.append(json.loads(data)["choices"][0].get("delta", {}).get("content") or "")
+    return "".join(parts)
+
+
+class Cassette:
+    """Recorded responses on disk: one JSON file {status, content_type, body} per request key"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable cassette entry {key[:12]}: {e}")
+            return None
+
+    def put(self, key: str, status: int, content_type: str, body: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file then rename, so a concurrent replay never sees a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"status": status, "content_type": content_type, "body": body}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class RecordReplayAdapter(HTTPAdapter):
+    """
+    requests transport adapter. Replay answers from the cassette and raises CassetteMiss
+    for unknown requests; record forwards to the network and stores successful responses.
+    Recorded streams are buffered before being handed back, so record timing is not realistic.
+    """
+
+    def __init__(self, cassette: Cassette, mode: str, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+        self.mode = mode
+
+    def send(self, request, stream=False, **kwargs):
+        key = request_key(request.body)
+        if self.mode == REPLAY:
+            entry = self.cassette.get(key)
+            if entry is None:
+                raise CassetteMiss(f"No recorded response for request {key[:12]} in {self.cassette.directory}")
+            return self._replayed(request, entry)
+
+        response = super().send(request, stream=stream, **kwargs)
+        if self.mode == RECORD and response.ok:
+            body = response.content.decode("utf-8")  # Reads the whole stream; iter_lines then replays the buffer
+            self.cassette.put(key, response.status_code, response.headers.get("Content-Type", ""), body)
+        return response
+
+    def _replayed(self, request, entry: dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict({"Content-Type": entry["content_type"]})
+        response.raw = io.BytesIO(entry["body"].encode("utf-8"))
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+
+class AsyncRecordReplayTransport:
+    """The same record/replay behavior as an httpx async transport wrapping the real one"""
+
+    def __init__(self, cassette: Cassette, mode: str, inner):
+        self.cassette = cassette
+        self.mode = mode
+        self.inner = inner
+
+    async def handle_async_request(self, request):
+        import httpx
+        key = request_key(await request.aread())
+        if self.mode == REPLAY:
+            entry = self.cassette.get(key)
+            if entry is None:
+                raise CassetteMiss(f"No recorded response for request {key[:12]} in {self.cassette.directory}")
+            return httpx.Response(entry["status"], headers={"Content-Type": entry["content_type"]},
+                                  content=entry["body"].encode("utf-8"), request=request)
+
+        response = await self.inner.handle_async_request(request)
+        if self.mode == RECORD and response.is_success:
+            await response.aread()
+            content_type = response.headers.get("Content-Type", "")
+            self.cassette.put(key, response.status_code, content_type, response.text)
+            # Decoded body: drop Content-Encoding so httpx does not decode it twice
+            return httpx.Response(response.status_code, headers={"Content-Type": content_type},
+                                  content=response.content, request=request)
+        return response
+
+    async def aclose(self):
+        await self.inner.aclose()
@@ -0,0 +1,172 @@
+"""
+Tail-latency and failure protection for the DeepSeek clients:
+- LatencyTracker: rolling window of successful request latencies, giving the hedge delay (observed p95)
+- CircuitBreaker: fails fast while the endpoint's recent error rate is too high
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import config
+from metrics import LLM_CIRCUIT_REJECTIONS, LLM_CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """DeepSeek requests are not being sent because the endpoint is failing; shown to users as-is"""
+
+
+class LatencyTracker:
+    """Latencies (seconds) of the last `size` successful requests"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))]
+
+    def __len__(self):
+        return len(self._samples)
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait before hedging: the observed percentile once there are enough samples"""
+        if len(self) < config.DEEPSEEK_HEDGE_MIN_SAMPLES:
+            return config.DEEPSEEK_HEDGE_INITIAL_DELAY
+        return max(config.DEEPSEEK_HEDGE_MIN_DELAY, self.percentile(config.DEEPSEEK_HEDGE_PERCENTILE))
+
+
+class CircuitBreaker:
+    """
+    Closed: requests flow, outcomes of the last `window` seconds are kept. Once at least
+    `min_calls` outcomes are in the window and the error share reaches `error_rate`, the
+    circuit opens: requests fail immediately with CircuitOpenError for `cooldown` seconds.
+    Then it is half-open: one probe request goes through; success closes the circuit,
+    failure opens it again.
+    """
+
+    def __init__(self, name: str, window: float, min_calls: int, error_rate: float, cooldown: float):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self._outcomes = deque()  # (monotonic time, failed)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._last_error = None
+        self._lock = threading.Lock()
+        LLM_CIRCUIT_STATE.set(0, client=name)
+
+    def _set_state(self, state: str):
+        if state != self._state:
+            log = logger.warning if state == OPEN else logger.info
+            log(f"DeepSeek circuit ({self.name}) {self._state} -> {state}")
+            self._state = state
+            LLM_CIRCUIT_STATE.set(STATE_VALUES[state], client=self.name)
+
+    def _prune(self, now: float):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def before_request(self):
+        """Raise CircuitOpenError if no request may be sent now"""
+        with self._lock:
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at >= self.cooldown:
+                self._set_state(HALF_OPEN)
+            if self._state == CLOSED:
+                return
+            # A probe that never reported (cancelled, unexpected error) is replaced after a cooldown
+            if self._state == HALF_OPEN and (not self._probing or now - self._probe_started >= self.cooldown):
+                self._probing = True  # This request is the probe
+                self._probe_started = now
+                return
+            retry_in = max(0.0, self.cooldown - (now - self._opened_at))
+        LLM_CIRCUIT_REJECTIONS.inc(client=self.name)
+        raise CircuitOpenError(
+            f"The AI service is currently failing ({self._last_error}); requests are paused, "
+            f"please try again in {math.ceil(retry_in) or 1}s."
+        )
+
+    def record(self, failed: bool, error: Optional[Exception] = None):
+        """Outcome of one request attempt (failed = transport error or retryable HTTP status)"""
+        with self._lock:
+            now = time.monotonic()
+            if failed:
+                self._last_error = str(error)[:120] if error is not None else "request failed"
+            if self._state == HALF_OPEN and self._probing:
+                self._probing = False
+                self._outcomes.clear()
+                if failed:
+                    self._opened_at = now
+                    self._set_state(OPEN)
+                else:
+                    self._set_state(CLOSED)
+                return
+            self._outcomes.append((now, failed))
+            self._prune(now)
+            failures = sum(1 for _, f in self._outcomes if f)
+            if (self._state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.error_rate):
+                self._opened_at = now
+                self._set_state(OPEN)
+
+    def state(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            failures = sum(1 for _, f in self._outcomes if f)
+            return {
+                "state": self._state,
+                "window_calls": len(self._outcomes),
+                "window_error_rate": round(failures / len(self._outcomes), 3) if self._outcomes else 0.0,
+                "open_for_s": round(max(0.0, self.cooldown - (now - self._opened_at)), 1) if self._state == OPEN else 0.0,
+                "last_error": self._last_error,
+            }
+
+
+def create_breaker(name: str) -> Optional[CircuitBreaker]:
+    if not config.DEEPSEEK_BREAKER_ENABLED:
+        return None
+    return CircuitBreaker(name, config.DEEPSEEK_BREAKER_WINDOW, config.DEEPSEEK_BREAKER_MIN_CALLS,
+                          config.DEEPSEEK_BREAKER_ERROR_RATE, config.DEEPSEEK_BREAKER_COOLDOWN)
+
+
+def usable_completion(body) -> bool:
+    """A hedged attempt's answer is only taken if it has message content"""
+    try:
+        return bool(body["choices"][0]["message"]["content"])
+    except (KeyError, IndexError, TypeError):
+        return False
+
+
+def resilience_state(breaker: Optional[CircuitBreaker], latency: LatencyTracker, hedging: bool) -> dict:
+    """Circuit and hedging state of a client, for logs, the app's debug panel and health checks"""
+    p95 = latency.percentile(config.DEEPSEEK_HEDGE_PERCENTILE)
+    return {
+        "circuit": breaker.state() if breaker is not None else {"state": "disabled"},
+        "hedging": {
+            "enabled": hedging,
+            "delay_s": round(latency.hedge_delay(), 2),
+            f"p{config.DEEPSEEK_HEDGE_PERCENTILE:g}_s": round(p95, 2) if p95 is not None else None,
+            "samples": len(latency),
+        },
+    }
@@ -0,0 +1,133 @@
+"""
+Token usage, latency and cost of the DeepSeek calls made for one extraction.
+The clients report every call to the record of the extraction being tracked (a context
+variable, so concurrent extractions never mix); results carry its summary as "_usage".
+"""
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import config
+
+_current: contextvars.ContextVar[Optional["UsageRecord"]] = contextvars.ContextVar("llm_usage", default=None)
+
+
+def token_counts(usage: Optional[dict]) -> Tuple[int, int, int]:
+    """(prompt, completion, cached prompt) tokens from a DeepSeek or OpenAI-style usage block"""
+    usage = usage or {}
+    cached = usage.get("prompt_cache_hit_tokens")
+    if cached is None:
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    return int(usage.get("prompt_tokens") or 0), int(usage.get("completion_tokens") or 0), int(cached or 0)
+
+
+def cost_usd(prompt_tokens: int, completion_tokens: int, cached_tokens: int) -> float:
+    """List-price cost: cache-hit prompt tokens are billed at the cached input rate"""
+    return (
+        (prompt_tokens - cached_tokens) * config.DEEPSEEK_PRICE_INPUT
+        + cached_tokens * config.DEEPSEEK_PRICE_CACHED_INPUT
+        + completion_tokens * config.DEEPSEEK_PRICE_OUTPUT
+    ) / 1_000_000
+
+
+class UsageRecord:
+    """Accumulates the calls of one extraction; thread-safe (chunks and segments call in parallel)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.models: List[str] = []
+        self._intervals: List[Tuple[float, float]] = []
+
+    def add(self, model: Optional[str], usage: Optional[dict], started: float, ended: float):
+        prompt, completion, cached = token_counts(usage)
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+            self.cached_tokens += cached
+            if model and model not in self.models:
+                self.models.append(model)
+            self._intervals.append((started, ended))
+
+    def latency_ms(self) -> float:
+        """Wall-clock time with at least one call in flight (parallel chunk calls count once)"""
+        total, end = 0.0, None
+        for start, stop in sorted(self._intervals):
+            if end is None or start > end:
+                total += stop - start
+                end = stop
+            elif stop > end:
+                total += stop - end
+                end = stop
+        return round(total * 1000, 1)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "model": ",".join(self.models) or None,
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+                "total_tokens": self.prompt_tokens + self.completion_tokens,
+                "llm_latency_ms": self.latency_ms(),
+                "cost_usd": round(cost_usd(self.prompt_tokens, self.completion_tokens, self.cached_tokens), 6),
+            }
+
+
+def record_call(model: Optional[str], usage: Optional[dict], started: float):
+    """Called by the clients after each completed chat completion (started: time.perf_counter())"""
+    record = _current.get()
+    if record is not None:
+        record.add(model, usage, started, time.perf_counter())
+
+
+@contextmanager
+def track_usage():
+    """Collect the usage of every call made in this block (and in tasks/threads started from it)"""
+    record = UsageRecord()
+    token = _current.set(record)
+    try:
+        yield record
+    finally:
+        _current.reset(token)
+
+
+def in_current_context(func):
+    """
+    Wrap func for a thread pool: each call runs in a copy of the submitting thread's
+    context, so its calls are added to the extraction being tracked there.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+def _attach(result, record: UsageRecord):
+    # A cached result carries the usage of the run that produced it: this run's own (zero) usage replaces it
+    if isinstance(result, dict):
+        result["_usage"] = record.summary()
+    return result
+
+
+def with_usage(func):
+    """Decorator (sync or async): track the call's LLM usage and attach it to the result dict as "_usage" """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with track_usage() as record:
+                return _attach(await func(*args, **kwargs), record)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with track_usage() as record:
+            return _attach(func(*args, **kwargs), record)
+    return wrapper
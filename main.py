@@ -1,8 +1,15 @@
 import os
 import sys
+import glob
 import json
+import time
 import logging
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import config
 from invoice_extractor import AIInvoiceExtractor
+from metrics import write_metrics_file
 from quickbooks_adapter import QuickBooksAdapter
 
 # Configure logging
@@ -12,9 +19,109 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+PDF_EXTENSIONS = {".pdf"}
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+
+def collect_batch_files(target: str) -> list:
+    """Expand a directory or glob pattern into the sorted list of supported invoice files"""
+    if os.path.isdir(target):
+        paths = [os.path.join(target, name) for name in os.listdir(target)]
+    else:
+        paths = glob.glob(target, recursive=True)
+    supported = PDF_EXTENSIONS | IMAGE_EXTENSIONS
+    return sorted(p for p in paths if os.path.isfile(p) and os.path.splitext(p)[1].lower() in supported)
+
+def _finish_record(record: dict, data: dict, qb: QuickBooksAdapter = None) -> dict:
+    if data.get("error"):
+        record.update(status="error", error=data["error"])
+        return record
+    data.pop("_raw_text", None)
+    record.update(status="ok", validation=data.pop("_validation", None), usage=data.pop("_usage", None),
+                  route=data.pop("_route", None), data=data)
+    if qb is not None:
+        record["synced"] = qb.sync_invoice(data)
+    return record
+
+def process_file(extractor: AIInvoiceExtractor, path: str, qb: QuickBooksAdapter = None, split: bool = False) -> list:
+    """Extract one file and return its NDJSON records, one per invoice (never raises)"""
+    started = time.perf_counter()
+    try:
+        if os.path.splitext(path)[1].lower() not in PDF_EXTENSIONS:
+            with open(path, "rb") as f:
+                records = [_finish_record({"file": path}, extractor.extract_from_image(f.read()), qb)]
+        elif split:
+            records = []
+            for data in extractor.process_pdf_documents(path):
+                records.append(_finish_record({"file": path, "pages": data.pop("_pages", None)}, data, qb))
+        else:
+            records = [_finish_record({"file": path}, extractor.process_pdf(path), qb)]
+    except Exception as e:
+        records = [{"file": path, "status": "error", "error": str(e)}]
+    for record in records:
+        if record["status"] != "ok":
+            logger.error(f"Failed to process {path}: {record['error']}")
+        record["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return records
+
+def run_batch(target: str, workers: int, output_path: str = None, should_sync: bool = False, split: bool = False) -> int:
+    """
+    Process every invoice in a directory/glob with a bounded worker pool,
+    streaming one JSON line per invoice. Returns the process exit code.
+    """
+    files = collect_batch_files(target)
+    if not files:
+        logger.error(f"No PDF or image files found for: {target}")
+        return 1
+
+    has_images = any(os.path.splitext(p)[1].lower() in IMAGE_EXTENSIONS for p in files)
+    extractor = AIInvoiceExtractor(prewarm_ocr=has_images)
+    qb = QuickBooksAdapter() if should_sync else None
+
+    out = open(output_path, "w", encoding="utf-8") if output_path else sys.stdout
+    succeeded = failures = 0
+    started = time.perf_counter()
+    logger.info(f"Batch processing {len(files)} file(s) with {workers} worker(s)...")
+    try:
+        # Keep stdout clean for NDJSON: anything else printed (e.g. QuickBooks mock) goes to stderr
+        with contextlib.redirect_stdout(sys.stderr), ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(process_file, extractor, path, qb, split) for path in files]
+            for future in as_completed(futures):
+                for record in future.result():
+                    if record["status"] == "ok":
+                        succeeded += 1
+                    else:
+                        failures += 1
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+    finally:
+        if output_path:
+            out.close()
+        write_metrics_file(force=True)  # The periodic writes may have skipped the last documents
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Batch finished: {succeeded} ok, {failures} failed from {len(files)} file(s) in {elapsed:.1f}s "
+        f"({len(files) / elapsed:.2f} files/s)"
+    )
+    return 1 if failures else 0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Extract invoice data with AI and optionally sync to QuickBooks.")
+    parser.add_argument("pdf_path", nargs="?", help="Invoice PDF to process (omit for auto-test mode)")
+    parser.add_argument("--sync", action="store_true", help="Sync extracted invoices to QuickBooks")
+    parser.add_argument("--batch", metavar="DIR_OR_GLOB", help="Process every PDF/image in a directory or glob, one JSON line per file")
+    parser.add_argument("--workers", type=int, default=config.BATCH_WORKERS, help="Concurrent extractions in batch mode")
+    parser.add_argument("--output", "-o", help="Write batch NDJSON to this file instead of stdout")
+    parser.add_argument("--split", action="store_true", help="Split PDFs holding several invoices and extract each one")
+    return parser.parse_args(argv)
+
 def main():
+    args = parse_args(sys.argv[1:])
+    if args.batch:
+        sys.exit(run_batch(args.batch, max(1, args.workers), args.output, args.sync, args.split))
+
     # Check arguments
-    if len(sys.argv) < 2:
+    if not args.pdf_path:
         # If no arguments, auto-generate a test PDF and run
         print("No PDF file path provided, entering auto-test mode...")
         test_pdf = "test_invoice_auto.pdf"
@@ -27,11 +134,11 @@ def main():
             pdf_path = test_pdf
             should_sync = True # Default test mode enables sync mock
         except ImportError:
-            print("Usage: python main.py <invoice_pdf_path> [--sync]")
+            print("Usage: python main.py <invoice_pdf_path> [--sync] | --batch <dir_or_glob> [--workers N] [--output results.ndjson] [--split] [--sync]")
             return
     else:
-        pdf_path = sys.argv[1]
-        should_sync = "--sync" in sys.argv
+        pdf_path = args.pdf_path
+        should_sync = args.sync
 
     if not os.path.exists(pdf_path):
         logger.error(f"File not found: {pdf_path}")
@@ -39,7 +146,7 @@ def main():
 
     try:
         # 1. Initialize extractor
-        extractor = AIInvoiceExtractor()
+        extractor = AIInvoiceExtractor(prewarm_ocr=False)  # PDF only, no OCR needed
         
         # 2. Extract and parse invoice
         print(f"\n[1/2] Extracting invoice info: {pdf_path}...")
@@ -0,0 +1,358 @@
+"""
+Pipeline metrics in the Prometheus text exposition format, without a client library:
+per-stage latency histograms and counters, labeled by input type and outcome.
+Exposed through METRICS_FILE (for a node_exporter textfile collector or any side process)
+and/or an HTTP endpoint on METRICS_PORT. A side process can serve a metrics file with:
+
+    python metrics.py --file /var/lib/invoice/metrics.prom --port 9108
+"""
+import argparse
+import functools
+import inspect
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Seconds: from a cached lookup to a slow OCR + LLM round trip
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(pairs) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{_label_text(pairs)} {value:g}" for name, pairs, value in self.samples()]
+        return "\n".join(lines)
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}  # key -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration of the block. Yields the labels so the block can refine them;
+        the outcome label defaults to "ok", or "error" if the block raises.
+        """
+        if "outcome" in self.labelnames:
+            labels.setdefault("outcome", "ok")
+        start = time.perf_counter()
+        try:
+            yield labels
+        except BaseException:
+            if "outcome" in self.labelnames:
+                labels["outcome"] = "error"
+            raise
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[len(self.buckets)] if series else 0
+
+    def samples(self):
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            pairs = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, series):
+                yield f"{self.name}_bucket", pairs + [("le", f"{bound:g}")], count
+            yield f"{self.name}_bucket", pairs + [("le", "+Inf")], series[len(self.buckets)]
+            yield f"{self.name}_sum", pairs, series[-1]
+            yield f"{self.name}_count", pairs, series[len(self.buckets)]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        metric = Gauge(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# Pipeline (stage: pdf_text, tables, pdf_words, preprocess, ocr, parse, validation; input_type: pdf, image)
+STAGE_SECONDS = REGISTRY.histogram(
+    "invoice_stage_duration_seconds", "Time spent in each extraction stage", ("stage", "input_type", "outcome"))
+DOCUMENT_SECONDS = REGISTRY.histogram(
+    "invoice_document_duration_seconds", "End-to-end extraction time per uploaded document", ("input_type", "outcome"))
+DOCUMENTS = REGISTRY.counter(
+    "invoice_documents_total", "Documents processed", ("input_type", "outcome"))
+CACHE_LOOKUPS = REGISTRY.counter(
+    "invoice_cache_lookups_total", "Extraction cache lookups for parsed results", ("outcome",))
+INFLIGHT_JOINS = REGISTRY.counter(
+    "invoice_inflight_joins_total", "Requests that joined an identical extraction already in flight")
+
+# DeepSeek API (mode: sync, stream, async)
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "invoice_llm_request_duration_seconds", "DeepSeek chat completion latency including retries", ("mode", "outcome"))
+LLM_RETRIES = REGISTRY.counter(
+    "invoice_llm_retries_total", "DeepSeek request attempts that were retried", ("reason",))
+LLM_TOKENS = REGISTRY.counter(
+    "invoice_llm_tokens_total", "Tokens reported in DeepSeek usage (prompt, completion, cached prompt)", ("kind",))
+LLM_ANSWERS = REGISTRY.counter(
+    "invoice_llm_answers_total", "Model answers by outcome: clean JSON, repaired locally, truncated, unrepairable; and re-asks", ("outcome",))
+LLM_ROUTES = REGISTRY.counter(
+    "invoice_llm_routes_total", "Documents routed to the fast or strong model by complexity", ("tier", "input_type"))
+LLM_ESCALATIONS = REGISTRY.counter(
+    "invoice_llm_escalations_total", "Fast-model extractions redone on the strong model", ("reason",))
+LLM_HEDGES = REGISTRY.counter(
+    "invoice_llm_hedged_requests_total", "Requests that fired a hedge attempt, by which attempt answered first", ("winner",))
+LLM_CIRCUIT_STATE = REGISTRY.gauge(
+    "invoice_llm_circuit_state", "DeepSeek circuit breaker state (0 closed, 1 half-open, 2 open)", ("client",))
+LLM_CIRCUIT_REJECTIONS = REGISTRY.counter(
+    "invoice_llm_circuit_rejections_total", "Requests failed fast because the circuit was open", ("client",))
+
+# Supabase and exports
+DB_SECONDS = REGISTRY.histogram(
+    "invoice_db_request_duration_seconds", "Supabase REST call latency", ("operation", "outcome"))
+EXPORT_SECONDS = REGISTRY.histogram(
+    "invoice_export_duration_seconds", "Time to build an export file", ("format", "outcome"))
+
+
+def record_usage(usage: Optional[dict]):
+    """Add a chat completion's usage block to the token counters"""
+    if not usage:
+        return
+    LLM_TOKENS.inc(usage.get("prompt_tokens") or 0, kind="prompt")
+    LLM_TOKENS.inc(usage.get("completion_tokens") or 0, kind="completion")
+    LLM_TOKENS.inc(usage.get("prompt_cache_hit_tokens") or 0, kind="cached_prompt")
+
+
+def _result_outcome(result) -> str:
+    """'error' for the {"error": ...} dicts the extractor returns instead of raising, 'partial' for split documents"""
+    if isinstance(result, dict) and result.get("error"):
+        return "error"
+    if isinstance(result, list) and any(isinstance(r, dict) and r.get("error") for r in result):
+        return "partial"
+    return "ok"
+
+
+@contextmanager
+def _observed(histogram: Histogram, counter: Optional[Counter], labels: dict):
+    """Time a call; the body sets labels["outcome"] once it has a result (an exception leaves "error")"""
+    call_labels = dict(labels, outcome="error")
+    start = time.perf_counter()
+    try:
+        yield call_labels
+    finally:
+        histogram.observe(time.perf_counter() - start, **call_labels)
+        if counter is not None:
+            counter.inc(**call_labels)
+            write_metrics_file()
+
+
+def timed(histogram: Histogram, counter: Optional[Counter] = None, **labels):
+    """Decorator (sync or async): observe each call's duration and count it, with the outcome from the result"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with _observed(histogram, counter, labels) as call_labels:
+                    result = await func(*args, **kwargs)
+                    call_labels["outcome"] = _result_outcome(result)
+                    return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _observed(histogram, counter, labels) as call_labels:
+                result = func(*args, **kwargs)
+                call_labels["outcome"] = _result_outcome(result)
+                return result
+        return wrapper
+    return decorator
+
+
+# Exposure
+_write_lock = threading.Lock()
+_last_write = 0.0
+_server = None
+_server_lock = threading.Lock()
+
+
+def write_metrics_file(path: Optional[str] = None, force: bool = False):
+    """Atomically rewrite the metrics file, at most every METRICS_FILE_INTERVAL seconds unless forced"""
+    global _last_write
+    path = path or config.METRICS_FILE
+    if not path:
+        return
+    with _write_lock:
+        now = time.monotonic()
+        if not force and now - _last_write < config.METRICS_FILE_INTERVAL:
+            return
+        _last_write = now
+    try:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(REGISTRY.render())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write metrics file {path}: {e}")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics: this process's registry, or the contents of server.metrics_file when set"""
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        metrics_file = getattr(self.server, "metrics_file", None)
+        try:
+            if metrics_file:
+                with open(metrics_file, "r", encoding="utf-8") as f:
+                    body = f.read().encode("utf-8")
+            else:
+                body = REGISTRY.render().encode("utf-8")
+        except OSError as e:
+            self.send_error(503, f"Metrics file unavailable: {e}")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0", metrics_file: Optional[str] = None):
+    """Serve /metrics in a daemon thread, once per process (later calls return the running server)"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            except OSError as e:
+                logger.warning(f"Metrics endpoint not started on port {port}: {e}")
+                return None
+            _server.daemon_threads = True
+            _server.metrics_file = metrics_file
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return _server
+
+
+def start_exporter():
+    """Start whatever METRICS_PORT asks for; the metrics file is written as documents complete"""
+    if config.METRICS_PORT:
+        start_metrics_server(config.METRICS_PORT)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a Prometheus text metrics file over HTTP.")
+    parser.add_argument("--file", default=config.METRICS_FILE, required=not config.METRICS_FILE)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=config.METRICS_PORT or 9108)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if start_metrics_server(args.port, args.host, args.file) is None:
+        raise SystemExit(1)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
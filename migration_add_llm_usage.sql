@@ -0,0 +1,26 @@
+-- Token usage, latency and cost of the extraction behind each invoice_history row
+alter table public.invoice_history
+add column if not exists llm_model text,
+add column if not exists llm_calls int,
+add column if not exists prompt_tokens int,
+add column if not exists completion_tokens int,
+add column if not exists cached_tokens int,
+add column if not exists llm_latency_ms double precision,
+add column if not exists cost_usd numeric(12, 6);
+
+-- Per user, per UTC day totals (security_invoker: the history table's RLS still applies, users see their own rows)
+create or replace view public.invoice_usage_daily
+with (security_invoker = on) as
+select
+  user_id,
+  (created_at at time zone 'utc')::date as day,
+  count(*) as invoices,
+  coalesce(sum(llm_calls), 0) as llm_calls,
+  coalesce(sum(prompt_tokens), 0) as prompt_tokens,
+  coalesce(sum(completion_tokens), 0) as completion_tokens,
+  coalesce(sum(cached_tokens), 0) as cached_tokens,
+  coalesce(sum(cost_usd), 0) as cost_usd,
+  avg(llm_latency_ms) as avg_llm_latency_ms,
+  percentile_cont(0.95) within group (order by llm_latency_ms) as p95_llm_latency_ms
+from public.invoice_history
+group by user_id, (created_at at time zone 'utc')::date;
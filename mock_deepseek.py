@@ -0,0 +1,286 @@
+"""
+Local DeepSeek-compatible /chat/completions server for offline load tests: configurable
+latency distribution, 429/5xx injection, a concurrency limit, streaming (SSE) and dropped streams.
+
+    python mock_deepseek.py --port 8765 --latency lognormal:900:0.6 --rate-limit-rate 0.05 --error-rate 0.01
+    DEEPSEEK_BASE_URL=http://127.0.0.1:8765 python main.py --batch invoices/
+
+GET /stats returns request/outcome counters and the peak number of concurrent requests.
+"""
+import argparse
+import json
+import logging
+import math
+import random
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from invoice_chunking import estimate_tokens
+from llm_replay import Cassette, recorded_content, request_key
+
+logger = logging.getLogger(__name__)
+
+COMPLETION_PATHS = ("/chat/completions", "/v1/chat/completions")
+STREAM_CHUNK_CHARS = 4  # Roughly one token per SSE chunk
+SAMPLE_INVOICE = {
+    "vendor_name": "Mock Supplies Inc", "invoice_number": "MOCK-0001", "date": "01/15/2025", "due_date": "02/14/2025",
+    "total_amount": 64.8, "tax_amount": 4.8, "currency": "USD", "warning": None,
+    "items": [
+        {"description": "Paper ream A4", "quantity": 2.0, "unit_price": 20.0, "total_price": 40.0, "category": "Office Supplies"},
+        {"description": "Toner cartridge", "quantity": 1.0, "unit_price": 20.0, "total_price": 20.0, "category": "Office Supplies"},
+    ],
+}
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Latency sampler (ms) from a spec string:
+    fixed:MS, uniform:LO:HI, normal:MEAN:SD, lognormal:MEDIAN:SIGMA, pareto:MIN:ALPHA (heavy tail)
+    """
+    kind, *params = spec.split(":")
+    try:
+        values = [float(p) for p in params]
+        samplers = {
+            "fixed": lambda rng: values[0],
+            "uniform": lambda rng: rng.uniform(values[0], values[1]),
+            "normal": lambda rng: max(0.0, rng.gauss(values[0], values[1])),
+            "lognormal": lambda rng: values[0] * math.exp(rng.gauss(0, values[1])),
+            "pareto": lambda rng: values[0] * rng.paretovariate(values[1]),
+        }
+        sampler = samplers[kind]
+        sampler(random.Random(0))  # Fail now on missing parameters, not on the first request
+        return sampler
+    except (KeyError, IndexError, ValueError):
+        raise ValueError(f"Invalid latency spec {spec!r}; expected e.g. fixed:800, lognormal:800:0.5, pareto:300:1.5")
+
+
+class MockBehavior:
+    """What the mock answers and how: latency, injected failures, answer source, and counters"""
+
+    def __init__(self, latency: str = "lognormal:800:0.5", token_delay_ms: float = 5.0,
+                 rate_limit_rate: float = 0.0, error_rate: float = 0.0, stream_drop_rate: float = 0.0,
+                 retry_after: float = 1.0, max_concurrency: int = 0,
+                 answer: Optional[Callable[[dict], str]] = None, cassette_dir: Optional[str] = None,
+                 seed: Optional[int] = None):
+        self.sample_latency = parse_latency(latency)
+        self.token_delay_ms = token_delay_ms
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.stream_drop_rate = stream_drop_rate
+        self.retry_after = retry_after
+        self.max_concurrency = max_concurrency
+        self.answer = answer or (lambda payload: json.dumps(SAMPLE_INVOICE))
+        self.cassette = Cassette(cassette_dir) if cassette_dir else None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "dropped_streams": 0,
+                      "replayed": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def count(self, key: str, delta: int = 1):
+        with self._lock:
+            self.stats[key] += delta
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+    def _chance(self, rate: float) -> bool:
+        with self._lock:
+            return rate > 0 and self._rng.random() < rate
+
+    def admit(self) -> Optional[int]:
+        """Failure status to inject for a new request (429 or 5xx), None to serve it"""
+        self.count("requests")
+        with self._lock:
+            over_limit = self.max_concurrency and self.stats["in_flight"] >= self.max_concurrency
+        if over_limit or self._chance(self.rate_limit_rate):
+            self.count("rate_limited")
+            return 429
+        if self._chance(self.error_rate):
+            self.count("errors")
+            with self._lock:
+                return self._rng.choice((500, 502, 503))
+        return None
+
+    def latency(self) -> float:
+        """Seconds until the first token"""
+        with self._lock:
+            return self.sample_latency(self._rng) / 1000
+
+    def should_drop_stream(self) -> bool:
+        dropped = self._chance(self.stream_drop_rate)
+        if dropped:
+            self.count("dropped_streams")
+        return dropped
+
+    def content(self, payload: dict) -> str:
+        """Recorded answer for this request if a cassette has it (streamed or not), else the answer callable"""
+        if self.cassette is not None:
+            for variant in (payload, {k: v for k, v in payload.items() if k != "stream"}, dict(payload, stream=True)):
+                entry = self.cassette.get(request_key(json.dumps(variant)))
+                if entry is not None:
+                    self.count("replayed")
+                    return recorded_content(entry)
+        return self.answer(payload)
+
+
+def usage(payload: dict, content: str) -> dict:
+    prompt = sum(estimate_tokens(str(message.get("content", ""))) for message in payload.get("messages", []))
+    completion = estimate_tokens(content)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion,
+            "prompt_cache_hit_tokens": 0, "prompt_cache_miss_tokens": prompt}
+
+
+class MockDeepSeekHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API behind the client's connection pool
+
+    @property
+    def behavior(self) -> MockBehavior:
+        return self.server.behavior
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.behavior.stats)
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Request body is not JSON"}})
+            return
+        if self.path not in COMPLETION_PATHS:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        behavior = self.behavior
+        status = behavior.admit()
+        if status == 429:
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                            {"Retry-After": f"{behavior.retry_after:g}"})
+            return
+        if status is not None:
+            time.sleep(behavior.latency() / 4)  # Errors come back faster than answers
+            self._send_json(status, {"error": {"message": "Injected server error", "type": "server_error"}})
+            return
+
+        behavior.count("in_flight")
+        try:
+            time.sleep(behavior.latency())
+            content = behavior.content(payload)
+            if payload.get("stream"):
+                self._stream(payload, content)
+            else:
+                time.sleep(behavior.token_delay_ms / 1000 * math.ceil(len(content) / STREAM_CHUNK_CHARS))
+                self._send_json(200, self._completion(payload, {"message": {"role": "assistant", "content": content}},
+                                                      usage(payload, content)))
+            behavior.count("ok")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client went away (e.g. its read timeout fired)
+        finally:
+            behavior.count("in_flight", -1)
+
+    @staticmethod
+    def _completion(payload: dict, choice: dict, token_usage: Optional[dict] = None) -> dict:
+        body = {
+            "id": f"mock-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion" if "message" in choice else "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": payload.get("model", "deepseek-chat"),
+            "choices": [dict(choice, index=0)],
+        }
+        if token_usage is not None:
+            body["usage"] = token_usage
+        return body
+
+    def _stream(self, payload: dict, content: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(data: str):
+            chunk = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.flush()
+
+        chunks = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        drop_at = len(chunks) // 2 if self.behavior.should_drop_stream() else None
+        for index, piece in enumerate(chunks):
+            if index == drop_at:
+                self.close_connection = True
+                self.wfile.flush()
+                self.connection.shutdown(socket.SHUT_RDWR)  # Mid-stream disconnect, no terminating chunk
+                return
+            send_event(json.dumps(self._completion(payload, {"delta": {"content": piece}, "finish_reason": None})))
+            time.sleep(self.behavior.token_delay_ms / 1000)
+        send_event(json.dumps(self._completion(payload, {"delta": {}, "finish_reason": "stop"}, usage(payload, content))))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def start_mock_server(behavior: Optional[MockBehavior] = None, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """Serve in a daemon thread (port 0 picks a free port; see server.server_address); stop with shutdown()"""
+    server = ThreadingHTTPServer((host, port), MockDeepSeekHandler)
+    server.daemon_threads = True
+    server.behavior = behavior or MockBehavior()
+    threading.Thread(target=server.serve_forever, name="mock-deepseek", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local DeepSeek-compatible chat completions server for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:800:0.5",
+                        help="Time to first token, ms: fixed:MS, uniform:LO:HI, normal:MEAN:SD, lognormal:MEDIAN:SIGMA, pareto:MIN:ALPHA")
+    parser.add_argument("--token-delay-ms", type=float, default=5.0, help="Delay per ~4-character output chunk")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="Answer 429 beyond this many in-flight requests (0 = no limit)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered 500/502/503")
+    parser.add_argument("--stream-drop-rate", type=float, default=0.0, help="Share of streams cut off halfway")
+    parser.add_argument("--cassettes", help="Answer from responses recorded with DEEPSEEK_REPLAY_MODE=record")
+    parser.add_argument("--corpus", help="Answer from a benchmark corpus's ground truth (benchmark/corpus.py)")
+    parser.add_argument("--seed", type=int, help="Seed for latency and failure sampling")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    answer = None
+    if args.corpus:
+        from benchmark.corpus import load_manifest
+        from benchmark.stub_llm import StubDeepSeekClient
+        answer = StubDeepSeekClient(load_manifest(args.corpus), latency_ms=0).answer
+    behavior = MockBehavior(args.latency, args.token_delay_ms, args.rate_limit_rate, args.error_rate,
+                            args.stream_drop_rate, args.retry_after, args.max_concurrency, answer, args.cassettes, args.seed)
+    server = start_mock_server(behavior, args.host, args.port)
+    logger.info(f"Mock DeepSeek API on http://{args.host}:{server.server_address[1]} (latency {args.latency})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        logger.info(f"Final stats: {json.dumps(behavior.stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Complexity-based model routing. Most documents are short receipts that the fast model
+reads well; long, table-dense or long OCR'd ones go to the strong model. An extraction that
+ran on the fast model and does not parse or validate is escalated to the strong model.
+The decision is a plain dict carried into the result as "_route".
+"""
+import logging
+import re
+from typing import Optional
+
+import config
+from invoice_chunking import estimate_tokens
+from metrics import LLM_ESCALATIONS, LLM_ROUTES
+
+logger = logging.getLogger(__name__)
+
+FAST, STRONG = "fast", "strong"
+
+# A money amount at the end of a line item: "12.50", "1,299.00", "4,03"
+AMOUNT_RE = re.compile(r"\d[\d,]*[.,]\d{2}\b")
+# An OCR box holding only a number ("12.50", "$3.00", "x2"): the value column of the line before it
+NUMBER_FRAGMENT_RE = re.compile(r"^[x×@]?\s*[$€£¥]?\s*-?\d[\d,.]*\s*[$€£¥%]?$", re.IGNORECASE)
+
+
+def merge_ocr_fragments(lines: list) -> list:
+    """
+    OCR returns one line per text box, so a receipt row "Coffee 3.50" arrives as two lines.
+    Number-only boxes are joined to the line before them, giving one line per printed row.
+    """
+    merged = []
+    for line in lines:
+        if merged and NUMBER_FRAGMENT_RE.match(line.strip()):
+            merged[-1] = f"{merged[-1]} {line.strip()}"
+        else:
+            merged.append(line.strip())
+    return merged
+
+
+def complexity_features(text: str, input_type: str, table_items: int = 0) -> dict:
+    lines = [line for line in text.splitlines() if line.strip()]
+    if input_type == "image":
+        lines = merge_ocr_fragments(lines)
+    return {
+        "tokens": estimate_tokens(text),
+        "lines": len(lines),
+        "amount_lines": sum(1 for line in lines if AMOUNT_RE.search(line)),
+        "table_items": table_items,
+        "ocr": input_type == "image",
+    }
+
+
+def complexity_score(features: dict):
+    """(points, reasons) for the features of one document"""
+    points, reasons = 0, []
+    if features["tokens"] > config.LLM_ROUTE_MAX_FAST_TOKENS:
+        points += 2
+        reasons.append(f"long text (~{features['tokens']} tokens)")
+    if features["lines"] > config.LLM_ROUTE_MAX_FAST_LINES:
+        points += 1
+        reasons.append(f"{features['lines']} lines")
+    # Items read from the PDF's tables leave only the header to the model: no table to untangle.
+    # A receipt's item rows are one description and one amount each, not a table to untangle either.
+    if not features["table_items"] and not features["ocr"] and features["amount_lines"] >= config.LLM_ROUTE_TABLE_LINES:
+        points += 1
+        reasons.append(f"dense table ({features['amount_lines']} amount lines)")
+    # OCR noise only tips a document that is already long: alone it never reaches the strong model
+    if features["ocr"] and points:
+        points += 1
+        reasons.append("OCR text")
+    return points, reasons
+
+
+def route_document(text: str, input_type: str, table_items: int = 0) -> dict:
+    """Pick the model for one document's extraction"""
+    features = complexity_features(text, input_type, table_items)
+    score, reasons = complexity_score(features)
+    tier = STRONG if config.LLM_ROUTING_ENABLED and score >= config.LLM_ROUTE_STRONG_SCORE else FAST
+    route = {
+        "tier": tier,
+        "model": config.DEEPSEEK_STRONG_MODEL if tier == STRONG else config.DEEPSEEK_FAST_MODEL,
+        "score": score,
+        "reasons": reasons,
+        "features": features,
+        "escalated": None,
+    }
+    LLM_ROUTES.inc(tier=tier, input_type=input_type)
+    logger.info(f"Routing {input_type} to the {tier} model {route['model']} (score {score}: {', '.join(reasons) or 'simple'})")
+    return route
+
+
+def can_escalate(route: Optional[dict]) -> bool:
+    return (route is not None and route["tier"] == FAST and config.LLM_ROUTING_ENABLED
+            and config.LLM_ROUTE_ESCALATE and config.DEEPSEEK_STRONG_MODEL != config.DEEPSEEK_FAST_MODEL)
+
+
+def escalate(route: dict, reason: str):
+    """Switch a fast route to the strong model (in place), recording why"""
+    logger.info(f"Escalating to the strong model {config.DEEPSEEK_STRONG_MODEL}: {reason}")
+    LLM_ESCALATIONS.inc(reason=reason)
+    route.update(tier=STRONG, model=config.DEEPSEEK_STRONG_MODEL, escalated=reason)
+
+
+def fall_back(route: dict):
+    """Undo escalate: the fast model's answer is the one kept"""
+    route.update(tier=FAST, model=config.DEEPSEEK_FAST_MODEL, escalated=None)
@@ -0,0 +1,202 @@
+import importlib.util
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EasyOCRReaderPool:
+    """
+    Long-lived pool of EasyOCR readers.
+    Building a Reader loads the detection/recognition models (seconds, hundreds of MB),
+    so readers are created once and checked out per image. The pool size bounds how
+    many images are OCR'd concurrently.
+    """
+
+    def __init__(self, languages: List[str], size: int = 1, gpu: bool = False):
+        self.languages = list(languages)
+        self.size = max(1, int(size))
+        self.gpu = gpu
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._warm_thread: Optional[threading.Thread] = None
+
+    def _create_reader(self):
+        import easyocr
+        logger.info(f"Loading EasyOCR reader {self._created}/{self.size} ({','.join(self.languages)})...")
+        return easyocr.Reader(self.languages, gpu=self.gpu)
+
+    def _reserve_slot(self) -> bool:
+        """Claim the right to build one more reader, if the pool is not full yet"""
+        with self._lock:
+            if self._created >= self.size:
+                return False
+            self._created += 1
+            return True
+
+    def _release_slot(self):
+        with self._lock:
+            self._created -= 1
+
+    def _build_into_pool(self):
+        try:
+            reader = self._create_reader()
+        except Exception:
+            self._release_slot()
+            raise
+        self._idle.put(reader)
+
+    def warm_up(self, background: bool = True):
+        """Build every reader up front. By default runs in a daemon thread so startup is not blocked."""
+        if not background:
+            self._warm_all()
+            return
+        with self._lock:
+            if self._warm_thread is not None:
+                return
+            self._warm_thread = threading.Thread(target=self._warm_all, name="ocr-warmup", daemon=True)
+        self._warm_thread.start()
+
+    def _warm_all(self):
+        try:
+            while self._reserve_slot():
+                self._build_into_pool()
+            logger.info(f"EasyOCR pool warmed ({self.size} reader(s)).")
+        except ImportError:
+            logger.warning("EasyOCR is not installed, skipping OCR warm-up.")
+        except Exception as e:
+            logger.error(f"EasyOCR warm-up failed: {e}")
+
+    @contextmanager
+    def reader(self, timeout: Optional[float] = None):
+        """Check out a reader for exclusive use, returning it to the pool afterwards"""
+        try:
+            reader = self._idle.get_nowait()
+        except queue.Empty:
+            if self._reserve_slot():
+                self._build_into_pool()
+            # Either the reader we just built, or wait for one in use / still warming up
+            reader = self._idle.get(timeout=timeout)
+        try:
+            yield reader
+        finally:
+            self._idle.put(reader)
+
+    def readtext(self, image) -> List[str]:
+        """Run OCR on a decoded image and return the recognized text lines"""
+        with self.reader() as reader:
+            return reader.readtext(image, detail=0)
+
+
+# --- Out-of-process OCR workers ---
+# Each worker process builds one Reader in its initializer and keeps it for its lifetime
+_worker_reader = None
+
+
+def _init_ocr_worker(languages: List[str], gpu: bool, torch_threads: int):
+    global _worker_reader
+    # Must be set before torch is imported: caps the OpenMP/MKL pools used by intra-op parallelism
+    os.environ["OMP_NUM_THREADS"] = str(torch_threads)
+    os.environ["MKL_NUM_THREADS"] = str(torch_threads)
+    import torch
+    torch.set_num_threads(torch_threads)
+    import easyocr
+    _worker_reader = easyocr.Reader(languages, gpu=gpu)
+    logging.getLogger(__name__).info(f"OCR worker {os.getpid()} ready ({torch_threads} torch thread(s))")
+
+
+def _worker_ping() -> int:
+    return os.getpid()
+
+
+def _worker_readtext(image) -> List[str]:
+    return _worker_reader.readtext(image, detail=0)
+
+
+class ProcessOCRPool:
+    """
+    EasyOCR in a pool of worker processes, with the same readtext() interface as
+    EasyOCRReaderPool. Inference (torch, CPU-bound) runs outside the calling process,
+    so it no longer competes with the web server's threads for the GIL and cores.
+    Each worker preloads its model once; torch_threads caps its intra-op threads
+    (size * torch_threads should not exceed the cores available for OCR).
+    """
+
+    def __init__(self, languages: List[str], size: int = 1, gpu: bool = False, torch_threads: int = 1):
+        self.languages = list(languages)
+        self.size = max(1, int(size))
+        self.gpu = gpu
+        self.torch_threads = max(1, int(torch_threads))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a multi-threaded server process (Streamlit) is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.size,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_ocr_worker,
+                    initargs=(self.languages, self.gpu, self.torch_threads)
+                )
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        """Drop a broken pool (e.g. a worker crashed or failed to load the model); the next call starts a new one"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self, background: bool = True):
+        """Start every worker so models load before the first image arrives"""
+        if importlib.util.find_spec("easyocr") is None:
+            logger.warning("EasyOCR is not installed, skipping OCR warm-up.")
+            return
+        pool = self._get_pool()
+        # All pings are submitted before any worker is idle, so each one spawns its own process
+        futures = [pool.submit(_worker_ping) for _ in range(self.size)]
+        if background:
+            for future in futures:
+                future.add_done_callback(
+                    lambda f: self._discard_pool(pool) if not f.cancelled() and isinstance(f.exception(), BrokenProcessPool) else None
+                )
+            return
+        try:
+            for future in futures:
+                future.result()
+            logger.info(f"OCR worker pool warmed ({self.size} process(es)).")
+        except BrokenProcessPool as e:
+            self._discard_pool(pool)
+            logger.error(f"OCR worker warm-up failed: {e}")
+
+    def readtext(self, image) -> List[str]:
+        """Run OCR on a decoded image in a worker process and return the recognized text lines"""
+        pool = self._get_pool()
+        try:
+            return pool.submit(_worker_readtext, image).result()
+        except BrokenProcessPool as e:
+            self._discard_pool(pool)
+            raise RuntimeError(f"OCR worker process failed: {e}") from e
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+def create_ocr_pool(backend: str, languages: List[str], size: int, gpu: bool, torch_threads: int = 1):
+    """OCR pool for the configured backend: 'process' (worker processes) or 'thread' (in-process readers)"""
+    if backend == "process":
+        return ProcessOCRPool(languages, size=size, gpu=gpu, torch_threads=torch_threads)
+    return EasyOCRReaderPool(languages, size=size, gpu=gpu)
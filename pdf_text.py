@@ -0,0 +1,223 @@
+import hashlib
+import io
+import logging
+import math
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import pdfplumber
+
+logger = logging.getLogger(__name__)
+
+
+# A file path, or the document content already in memory
+PdfSource = Union[str, os.PathLike, bytes, bytearray, memoryview]
+
+# Text layer quality: fewer visible characters than this means a scanned (image-only) page
+MIN_TEXT_LAYER_CHARS = 20
+# Glyphs pdfplumber could not map to Unicode ("(cid:42)"), or replacement characters
+UNMAPPED_GLYPH_RE = re.compile(r"\(cid:\d+\)|\ufffd")
+# What can be extracted per page, in the order a page is processed
+PAGE_KINDS = ("text", "tables", "words")
+# Documents whose prefetched results are kept until read (see PdfTextExtractor)
+MAX_PREFETCHED_DOCUMENTS = 8
+
+
+def open_pdf(source: PdfSource):
+    """pdfplumber.open for a path or an in-memory buffer (no temp file needed)"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return pdfplumber.open(io.BytesIO(source))
+    return pdfplumber.open(source)
+
+
+def _extract_pages(pdf, start: int, end: int, kinds: Iterable[str]) -> Dict[str, list]:
+    """
+    Every requested kind of pages [start, end) in one pass: text, tables (lists of rows of
+    cell strings) and words ([text, x0, top, x1, bottom] with coordinates relative to the
+    page size). Each page's characters are parsed once and shared by all kinds.
+    """
+    results = {kind: [] for kind in kinds}
+    for index in range(start, end):
+        page = pdf.pages[index]
+        if "text" in results:
+            results["text"].append(page.extract_text() or "")
+        if "tables" in results:
+            results["tables"].append(page.extract_tables())
+        if "words" in results:
+            results["words"].append(_page_words(page))
+        page.close()  # Frees the parsed layout of the page
+    return results
+
+
+def _extract_page_range(path: str, start: int, end: int, kinds: Tuple[str, ...]) -> Dict[str, list]:
+    """Worker: _extract_pages of a page range; each worker opens its own copy of the document from disk"""
+    with open_pdf(path) as pdf:
+        return _extract_pages(pdf, start, end, kinds)
+
+
+@contextmanager
+def _on_disk(source: PdfSource):
+    """A path for the worker processes: an in-memory document is written once to a temp file"""
+    if not isinstance(source, (bytes, bytearray, memoryview)):
+        yield os.fspath(source)
+        return
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(source)
+        yield path
+    finally:
+        os.remove(path)
+
+
+def _document_key(source: PdfSource) -> tuple:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return ("bytes", hashlib.sha256(source).hexdigest())
+    stat = os.stat(source)
+    return ("path", os.fspath(source), stat.st_mtime_ns, stat.st_size)
+
+
+def _page_words(page) -> List[list]:
+    width, height = float(page.width), float(page.height)
+    return [
+        [w["text"], round(w["x0"] / width, 4), round(w["top"] / height, 4), round(w["x1"] / width, 4), round(w["bottom"] / height, 4)]
+        for w in page.extract_words()
+    ]
+
+
+def has_usable_text(text: str) -> bool:
+    """
+    False for pages that need OCR: no text layer, only a few stray characters (page
+    numbers, scanner stamps), or mostly glyphs without a Unicode mapping (garbage).
+    """
+    visible = re.sub(r"\s+", "", text or "")
+    if len(visible) < MIN_TEXT_LAYER_CHARS:
+        return False
+    unmapped = sum(len(match) for match in UNMAPPED_GLYPH_RE.findall(visible))
+    return unmapped / len(visible) < 0.3
+
+
+def render_dpi(width_pt: float, height_pt: float, target_side: int, min_dpi: int, max_dpi: int) -> int:
+    """DPI that renders the page's long side at about target_side pixels, within [min_dpi, max_dpi]"""
+    long_side_inches = max(width_pt, height_pt) / 72.0
+    return int(min(max_dpi, max(min_dpi, target_side / long_side_inches)))
+
+
+def join_pages(page_texts: List[str]) -> str:
+    """Concatenate page texts in order, one trailing newline per non-empty page"""
+    return "".join(f"{text}\n" for text in page_texts if text)
+
+
+class PdfTextExtractor:
+    """
+    Per-page PDF text extraction.
+    Small documents are handled in-process; documents with at least `min_pages` pages
+    are split into contiguous page ranges extracted concurrently by a process pool
+    (pdfplumber is pure Python, so threads would serialize on the GIL) and
+    reassembled in page order. Kinds listed in `prefetch` (e.g. "tables") are extracted
+    in the same pass as the document's text and kept until they are read once.
+    """
+
+    def __init__(self, workers: int, min_pages: int, prefetch: Iterable[str] = ()):
+        self.workers = max(1, workers)
+        self.min_pages = min_pages
+        self.prefetch = tuple(prefetch)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._prefetched: "OrderedDict[tuple, Dict[str, list]]" = OrderedDict()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a multi-threaded server process (Streamlit) is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def page_count(self, source: PdfSource) -> int:
+        with open_pdf(source) as pdf:
+            return len(pdf.pages)
+
+    def _per_page(self, source: PdfSource, what: str) -> list:
+        """One kind for every page; the prefetch kinds are extracted in the same pass as the text"""
+        key = _document_key(source) if self.prefetch else None
+        with self._lock:
+            prefetched = self._prefetched.get(key, {})
+            if what in prefetched:
+                pages = prefetched.pop(what)
+                if not prefetched:
+                    del self._prefetched[key]
+                return pages
+        kinds = tuple(kind for kind in PAGE_KINDS if kind == what or (what == "text" and kind in self.prefetch))
+
+        results = self._extract(source, kinds)
+        if len(kinds) > 1:
+            with self._lock:
+                self._prefetched.setdefault(key, {}).update({kind: results[kind] for kind in kinds if kind != what})
+                self._prefetched.move_to_end(key)
+                while len(self._prefetched) > MAX_PREFETCHED_DOCUMENTS:
+                    self._prefetched.popitem(last=False)
+        return results[what]
+
+    def _extract(self, source: PdfSource, kinds: Tuple[str, ...]) -> Dict[str, list]:
+        with open_pdf(source) as pdf:
+            page_count = len(pdf.pages)
+            if self.workers == 1 or page_count < self.min_pages:
+                return _extract_pages(pdf, 0, page_count, kinds)
+
+        # Twice as many ranges as workers evens out pages that are slower than others
+        range_size = max(1, math.ceil(page_count / (self.workers * 2)))
+        ranges = [(start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+        logger.info(f"Extracting {', '.join(kinds)} of {page_count} pages in {len(ranges)} ranges across {self.workers} processes")
+
+        pool = self._get_pool()
+        # Workers get a path, not a pickled copy of the whole document per range
+        with _on_disk(source) as path:
+            futures = [pool.submit(_extract_page_range, path, start, end, kinds) for start, end in ranges]
+            results = {kind: [] for kind in kinds}
+            for future in futures:
+                for kind, pages in future.result().items():
+                    results[kind].extend(pages)
+        return results
+
+    def page_texts(self, source: PdfSource) -> List[str]:
+        """Text of every page in order ('' for pages without a text layer)"""
+        return self._per_page(source, "text")
+
+    def page_tables(self, source: PdfSource) -> list:
+        """pdfplumber tables of every page in order: pages -> tables -> rows -> cells"""
+        return self._per_page(source, "tables")
+
+    def page_words(self, source: PdfSource) -> List[List[list]]:
+        """Positioned words of every page in order: pages -> [text, x0, top, x1, bottom]"""
+        return self._per_page(source, "words")
+
+    def render_pages(self, source: PdfSource, indexes: List[int], target_side: int, min_dpi: int = 100,
+                     max_dpi: int = 300) -> Iterator[Tuple[int, "PIL.Image.Image"]]:
+        """
+        Rasterize the given pages at an adaptive DPI (see render_dpi), yielding
+        (page index, grayscale PIL image) one page at a time to bound memory.
+        """
+        with open_pdf(source) as pdf:
+            for index in indexes:
+                page = pdf.pages[index]
+                dpi = render_dpi(float(page.width), float(page.height), target_side, min_dpi, max_dpi)
+                yield index, page.to_image(resolution=dpi).original.convert("L")
+                page.close()
+
+    def extract_text(self, source: PdfSource) -> str:
+        return join_pages(self.page_texts(source))
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
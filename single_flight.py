@@ -0,0 +1,84 @@
+"""
+In-process single-flight: concurrent calls for the same key (a document's content hash)
+share one execution. The first caller runs it; callers arriving while it is in flight wait
+and receive a copy of its result, or its exception. Nothing is kept once the call finishes.
+"""
+import asyncio
+import copy
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from metrics import INFLIGHT_JOINS
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, func: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """Run func(*args, **kwargs) once per key at a time. Returns (result, shared with an earlier caller)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            INFLIGHT_JOINS.inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True  # Callers mutate their results (pop, session state)
+
+        try:
+            result = func(*args, **kwargs)
+            call.result = copy.deepcopy(result)  # Snapshot before the leader's caller touches it
+            return result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """The same for coroutines on one event loop"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func: Callable[..., Awaitable], *args, **kwargs) -> Tuple[Any, bool]:
+        future = self._calls.get(key)
+        if future is not None:
+            INFLIGHT_JOINS.inc()
+            # shield: a follower being cancelled must not cancel the shared call
+            return copy.deepcopy(await asyncio.shield(future)), True
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await func(*args, **kwargs)
+            future.set_result(copy.deepcopy(result))
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved: no "exception was never retrieved" warning without followers
+            raise
+        finally:
+            del self._calls[key]
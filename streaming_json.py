@@ -0,0 +1,184 @@
+import json
+import logging
+from typing import Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE = " \t\r\n"
+
+
+class StreamingJSONObjectParser:
+    """
+    Incremental parser for a JSON object arriving in arbitrary chunks (e.g. LLM tokens).
+    feed() returns the events completed by the new chunk:
+    - (key, value) once a top-level field's value is complete
+    - ("key[]", element) for every completed element of a top-level array,
+      so long lists (line items) can be shown while they are still streaming
+    Anything before the opening brace (markdown fences, prose) is skipped. Scanning
+    resumes where it stopped, so each character is examined once.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+        self._reset_value()
+
+    def _reset_value(self):
+        self._value_start = None
+        self._scan_pos = None
+        self._kind = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._is_array = False
+        self._elem_start = None
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._buf += chunk
+        events = []
+        while self._state != "done" and self._step(events):
+            pass
+        return events
+
+    def _skip_whitespace(self) -> bool:
+        """Advance past whitespace; False if the buffer is exhausted"""
+        while self._pos < len(self._buf) and self._buf[self._pos] in WHITESPACE:
+            self._pos += 1
+        return self._pos < len(self._buf)
+
+    def _string_end(self, start: int) -> int:
+        """Index just past the string literal opening at `start`, or -1 if not complete yet"""
+        escape = False
+        for i in range(start + 1, len(self._buf)):
+            ch = self._buf[i]
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                return i + 1
+        return -1
+
+    def _step(self, events) -> bool:
+        if self._state == "start":
+            brace = self._buf.find("{", self._pos)
+            if brace < 0:
+                self._pos = len(self._buf)
+                return False
+            self._pos = brace + 1
+            self._state = "key"
+            return True
+
+        if self._state == "value":
+            return self._scan_value(events)
+
+        if not self._skip_whitespace():
+            return False
+        ch = self._buf[self._pos]
+
+        if self._state == "key":
+            if ch == "}":
+                self._state = "done"
+                return False
+            if ch != '"':
+                self._pos += 1  # Tolerate stray separators
+                return True
+            end = self._string_end(self._pos)
+            if end < 0:
+                return False
+            self._key = json.loads(self._buf[self._pos:end])
+            self._pos = end
+            self._state = "colon"
+            return True
+
+        if self._state == "colon":
+            self._pos += 1 if ch == ":" else 0
+            self._state = "value"
+            self._reset_value()
+            return True
+
+        if self._state == "comma":
+            if ch == "}":
+                self._state = "done"
+                return False
+            if ch == ",":
+                self._pos += 1
+            self._state = "key"
+            return True
+        return False
+
+    def _scan_value(self, events) -> bool:
+        if self._value_start is None:
+            if not self._skip_whitespace():
+                return False
+            self._value_start = self._scan_pos = self._pos
+            first = self._buf[self._pos]
+            self._kind = "container" if first in "{[" else "string" if first == '"' else "scalar"
+            self._is_array = first == "["
+
+        buf = self._buf
+        i = self._scan_pos
+        end = None
+        while i < len(buf):
+            ch = buf[i]
+            if self._kind == "scalar":
+                if ch in ",}" or ch in WHITESPACE:
+                    end = i
+                    break
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._kind == "string":
+                        end = i + 1
+                        break
+            elif ch == '"' and (self._kind == "string" or i > self._value_start):
+                self._in_string = True
+                if self._is_array and self._depth == 1 and self._elem_start is None:
+                    self._elem_start = i
+            elif self._kind == "container":
+                if self._is_array and self._depth == 1 and ch not in WHITESPACE:
+                    if ch in ",]":
+                        self._emit_element(buf[self._elem_start:i] if self._elem_start is not None else "", events)
+                        self._elem_start = None
+                    elif self._elem_start is None:
+                        self._elem_start = i
+                if ch in "{[":
+                    self._depth += 1
+                elif ch in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        end = i + 1
+                        break
+            i += 1
+
+        if end is None:
+            self._scan_pos = len(buf)
+            return False
+
+        text = buf[self._value_start:end].strip()
+        try:
+            events.append((self._key, json.loads(text)))
+        except ValueError:
+            logger.debug(f"Streaming parser could not decode field {self._key!r}")
+        self._pos = end
+        self._state = "comma"
+        return True
+
+    def _emit_element(self, text: str, events):
+        text = text.strip()
+        if not text:
+            return
+        try:
+            events.append((f"{self._key}[]", json.loads(text)))
+        except ValueError:
+            logger.debug(f"Streaming parser could not decode an element of {self._key!r}")
@@ -6,6 +6,8 @@ import hashlib
 import base64
 from urllib.parse import urlencode
 
+from metrics import DB_SECONDS, timed
+
 class SupabaseManager:
     def __init__(self, url: str, key: str):
         self.url = url.rstrip('/')
@@ -151,6 +153,7 @@ class SupabaseManager:
                 
         return AuthResponse(data)
         
+    @timed(DB_SECONDS, operation="get_user_credits")
     def get_user_credits(self, user_id, access_token):
         """Get remaining credits for a user"""
         endpoint = f"{self.url}/rest/v1/user_credits?user_id=eq.{user_id}&select=credits_remaining"
@@ -166,6 +169,7 @@ class SupabaseManager:
             print(f"Error fetching credits: {e}")
             return 0
 
+    @timed(DB_SECONDS, operation="get_user_profile")
     def get_user_profile(self, user_id, access_token):
         """Get full profile including credits and plan"""
         endpoint = f"{self.url}/rest/v1/user_credits?user_id=eq.{user_id}&select=credits_remaining,plan_status"
@@ -183,6 +187,7 @@ class SupabaseManager:
             print(f"Error fetching profile: {e}")
             return {"credits": 0, "plan": "free"}
 
+    @timed(DB_SECONDS, operation="decrement_credits")
     def decrement_credits(self, user_id, access_token):
         """Decrement 1 credit from user"""
         # Ideally use RPC, but simple update for MVP
@@ -194,6 +199,7 @@ class SupabaseManager:
             return True
         return False
 
+    @timed(DB_SECONDS, operation="add_credits")
     def add_credits(self, user_id, amount, access_token):
         """Add credits to user (e.g. for promo codes)"""
         current = self.get_user_credits(user_id, access_token)
@@ -202,6 +208,7 @@ class SupabaseManager:
         res = requests.patch(endpoint, json=payload, headers=self._get_headers(access_token))
         return res.status_code == 200
 
+    @timed(DB_SECONDS, operation="log_invoice")
     def log_invoice(self, user_id, invoice_data, access_token):
         """Log the successful extraction to history"""
         endpoint = f"{self.url}/rest/v1/invoice_history"
@@ -212,8 +219,39 @@ class SupabaseManager:
             "currency": invoice_data.get("currency", "CNY"),
             "invoice_number": invoice_data.get("invoice_number")
         }
-        requests.post(endpoint, json=record, headers=self._get_headers(access_token))
+        usage = invoice_data.get("_usage")
+        if usage:
+            # Columns added by migration_add_llm_usage.sql
+            record.update({
+                "llm_model": usage.get("model"),
+                "llm_calls": usage.get("calls"),
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": usage.get("completion_tokens"),
+                "cached_tokens": usage.get("cached_tokens"),
+                "llm_latency_ms": usage.get("llm_latency_ms"),
+                "cost_usd": usage.get("cost_usd")
+            })
+        response = requests.post(endpoint, json=record, headers=self._get_headers(access_token))
+        if response.status_code == 400 and usage:
+            # Migration not applied yet: keep the history row, without the usage columns
+            print(f"Logging invoice usage failed ({response.text[:200]}), retrying without usage")
+            base = {k: record[k] for k in ("user_id", "vendor_name", "total_amount", "currency", "invoice_number")}
+            requests.post(endpoint, json=base, headers=self._get_headers(access_token))
+
+    @timed(DB_SECONDS, operation="get_daily_usage")
+    def get_daily_usage(self, user_id, access_token, days=30):
+        """Per-day token, latency and cost totals for the user (invoice_usage_daily view), newest first"""
+        endpoint = f"{self.url}/rest/v1/invoice_usage_daily?user_id=eq.{user_id}&order=day.desc&limit={int(days)}"
+        try:
+            response = requests.get(endpoint, headers=self._get_headers(access_token))
+            if response.status_code == 200:
+                return response.json()
+            return []
+        except Exception as e:
+            print(f"Error fetching usage: {e}")
+            return []
 
+    @timed(DB_SECONDS, operation="get_invoice_history")
     def get_invoice_history(self, user_id, access_token):
         """Fetch invoice processing history for the user"""
         endpoint = f"{self.url}/rest/v1/invoice_history?user_id=eq.{user_id}&order=created_at.desc"
@@ -226,6 +264,7 @@ class SupabaseManager:
             print(f"Error fetching history: {e}")
             return []
 
+    @timed(DB_SECONDS, operation="get_admin_stats")
     def get_admin_stats(self, access_token):
         """Fetch admin stats (User count, Invoice count) via RPC"""
         endpoint = f"{self.url}/rest/v1/rpc/get_admin_stats"
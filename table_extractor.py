@@ -0,0 +1,217 @@
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from invoice_splitter import INVOICE_NUMBER_RE
+
+# Header cell keywords for each InvoiceItem field, most specific first, matched as whole
+# words. Order matters: columns are claimed in this order, so "Total Price" goes to
+# total_price before unit_price looks for "price", and "Units" goes to quantity.
+COLUMN_KEYWORDS = {
+    "description": ("description", "item", "product", "service", "details", "particulars", "article"),
+    "total_price": ("line total", "extended", "amount", "total", "ext.", "net amount"),
+    "quantity": ("quantity", "qty", "hours", "hrs", "units"),
+    "unit_price": ("unit price", "unit cost", "price each", "rate", "price"),
+}
+# Rows that are summary lines, not items (same rule as the LLM prompt)
+SUMMARY_ROW_RE = re.compile(r"\b(?:sub\s*total|total|tax|vat|gst|cash|change|balance|amount due|discount)\b", re.IGNORECASE)
+# Columns that never hold an item field, whatever else their header says ("Tax Amount", "Tax Rate", "Disc %")
+EXCLUDED_COLUMN_RE = re.compile(r"\b(?:tax|vat|gst|discount|disc)\b|%")
+AMOUNT_RE = re.compile(r"-?\(?[$€£¥]?\s*-?\d(?:[\d,.]*\d)?\)?")
+
+TOTAL_LINE_RE = re.compile(r"^\s*(?:grand\s+total|total\s+due|amount\s+due|balance\s+due|invoice\s+total|total)\b", re.IGNORECASE)
+TAX_LINE_RE = re.compile(r"^\s*(?:total\s+)?(?:sales\s+)?(?:tax|vat|gst)\b", re.IGNORECASE)
+DATE_LINE_RE = re.compile(r"\b(invoice\s+date|date)\s*[:#]?\s*([0-9A-Za-z,/\-. ]{6,20})", re.IGNORECASE)
+DUE_DATE_LINE_RE = re.compile(r"\bdue\s+date\s*[:#]?\s*([0-9A-Za-z,/\-. ]{6,20})", re.IGNORECASE)
+# First lines that are a document title or a label, never the vendor
+TITLE_LINE_RE = re.compile(
+    r"^(?:(?:tax|sales|commercial|pro\s*forma)\s+)?(?:invoice|receipt|bill|statement|quotation|quote|credit note)\b"
+    r"|^(?:bill|ship|sold)\s+to\b|^page\b|[:#]|\d{3,}",
+    re.IGNORECASE
+)
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "CNY"}
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%d.%m.%Y", "%b %d, %Y", "%B %d, %Y", "%d %b %Y", "%d %B %Y")
+
+
+def _decimal_number(number: str) -> str:
+    """
+    Digits with thousands/decimal separators as a float literal: with both separators the
+    later one is the decimal point ('1.234,56', '1,234.56'); a lone comma before three
+    digits groups thousands ('1,234'), otherwise a lone separator is the decimal point.
+    """
+    last = max(number.rfind(","), number.rfind("."))
+    if last < 0:
+        return number
+    separator = number[last]
+    if "," in number and "." in number:
+        decimal = True
+    else:
+        decimal = number.count(separator) == 1 and not (separator == "," and len(number) - last - 1 == 3)
+    if not decimal:
+        return re.sub(r"[,.]", "", number)
+    return re.sub(r"[,.]", "", number[:last]) + "." + number[last + 1:]
+
+
+def parse_amount(value) -> Optional[float]:
+    """'$1,234.50' -> 1234.5, '1.234,56' -> 1234.56, '(12.00)' -> -12.0; None when the cell holds no number"""
+    if value is None:
+        return None
+    text = str(value).strip()
+    match = AMOUNT_RE.search(text)
+    if not match:
+        return None
+    raw = match.group(0)
+    negative = raw.startswith("(") or "-" in raw
+    number = _decimal_number(re.sub(r"[^\d,.]", "", raw))
+    try:
+        amount = float(number)
+    except ValueError:
+        return None
+    return -amount if negative else amount
+
+
+def normalize_date(text: str) -> Optional[str]:
+    """Parse common date spellings into MM/DD/YYYY (the format the LLM prompt asks for)"""
+    text = text.strip().rstrip(".,")
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%m/%d/%Y")
+        except ValueError:
+            continue
+    return None
+
+
+def _find_date(fragment: str) -> Optional[str]:
+    """Date at the start of a label's trailing text, e.g. 'Jan 26, 2024 Terms: Net 30' -> '01/26/2024'"""
+    words = fragment.split()
+    for count in (3, 2, 1):
+        date = normalize_date(" ".join(words[:count]))
+        if date:
+            return date
+    return None
+
+
+def _map_columns(row: List[Optional[str]]) -> Optional[Dict[str, int]]:
+    """Map InvoiceItem fields to column indices from a header row, or None if it is not one"""
+    cells = [re.sub(r"\s+", " ", (cell or "")).strip().lower() for cell in row]
+    cells = ["" if EXCLUDED_COLUMN_RE.search(cell) else cell for cell in cells]
+    mapping = {}
+    for field, keywords in COLUMN_KEYWORDS.items():
+        for keyword in keywords:
+            pattern = re.compile(rf"(?<!\w){re.escape(keyword)}(?!\w)")
+            index = next(
+                (i for i, cell in enumerate(cells) if cell and pattern.search(cell) and i not in mapping.values()),
+                None
+            )
+            if index is not None:
+                mapping[field] = index
+                break
+    if "description" in mapping and "total_price" in mapping:
+        return mapping
+    return None
+
+
+def _row_to_item(row: List[Optional[str]], mapping: Dict[str, int]) -> Optional[dict]:
+    def cell(field):
+        index = mapping.get(field)
+        return row[index] if index is not None and index < len(row) else None
+
+    description = re.sub(r"\s+", " ", cell("description") or "").strip()
+    total_price = parse_amount(cell("total_price"))
+    if not description or total_price is None or SUMMARY_ROW_RE.search(description):
+        return None
+    quantity = parse_amount(cell("quantity"))
+    unit_price = parse_amount(cell("unit_price"))
+    return {
+        "description": description,
+        "quantity": quantity if quantity is not None else 1.0,
+        "unit_price": unit_price,
+        "total_price": total_price,
+        "category": None,
+    }
+
+
+def table_items_from_pages(page_tables: List[List[List[List[Optional[str]]]]]) -> List[List[dict]]:
+    """
+    Turn pdfplumber tables (per page) into line items (per page).
+    A table's header row (within its first 3 rows) decides the column mapping; tables
+    without a header continue the previous mapping when they have the same width,
+    which covers item tables running across pages.
+    """
+    pages_items = []
+    mapping, width = None, None
+    for tables in page_tables:
+        items = []
+        for table in tables:
+            rows = [row for row in table if row and any(cell for cell in row)]
+            body = rows
+            for offset, row in enumerate(rows[:3]):
+                header = _map_columns(row)
+                if header:
+                    mapping, width = header, len(row)
+                    body = rows[offset + 1:]
+                    break
+            else:
+                if mapping is None or not rows or len(rows[0]) != width:
+                    continue
+            for row in body:
+                item = _row_to_item(row, mapping)
+                if item:
+                    items.append(item)
+        pages_items.append(items)
+    return pages_items
+
+
+def _last_amount(line: str) -> Optional[float]:
+    amounts = [a for a in AMOUNT_RE.findall(line) if re.search(r"\d", a)]
+    return parse_amount(amounts[-1]) if amounts else None
+
+
+def vendor_line(lines: List[str]) -> Optional[str]:
+    """The first line as the vendor name, None when it is a title ("INVOICE"), a label or a number"""
+    if not lines or TITLE_LINE_RE.search(lines[0]) or len(re.findall(r"[^\W\d_]", lines[0])) < 2:
+        return None
+    return lines[0]
+
+
+def extract_header_fields(text: str) -> dict:
+    """
+    Cheap regex pass for the header fields of a digital invoice. Best effort:
+    only used to skip the LLM when the result reconciles with the table items.
+    Fields that could not be read with confidence are None.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    header = {"vendor_name": vendor_line(lines), "invoice_number": None, "date": None,
+              "due_date": None, "total_amount": None, "tax_amount": 0.0, "currency": "USD"}
+
+    number = INVOICE_NUMBER_RE.search(text)
+    if number:
+        header["invoice_number"] = number.group(1)
+    for line in lines:
+        due = DUE_DATE_LINE_RE.search(line)
+        if due and header["due_date"] is None:
+            header["due_date"] = _find_date(due.group(1))
+            continue
+        date = DATE_LINE_RE.search(line)
+        if date and header["date"] is None:
+            header["date"] = _find_date(date.group(2))
+        if TAX_LINE_RE.search(line):
+            tax = _last_amount(line)
+            if tax is not None:
+                header["tax_amount"] = tax
+        elif TOTAL_LINE_RE.search(line):
+            total = _last_amount(line)
+            if total is not None:
+                header["total_amount"] = total  # Last total line wins (grand total comes last)
+    for symbol, code in CURRENCY_SYMBOLS.items():
+        if symbol in text:
+            header["currency"] = code
+            break
+    return header
+
+
+def reconciles(items: List[dict], total_amount: Optional[float], tax_amount: Optional[float], tolerance: float = 0.02) -> bool:
+    """Sum(items.total_price) + tax ~= total"""
+    if total_amount is None or not items:
+        return False
+    return abs(sum(item["total_price"] for item in items) + (tax_amount or 0) - total_amount) < tolerance
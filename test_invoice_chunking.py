@@ -0,0 +1,88 @@
+"""
+Unit tests for splitting long invoices into LLM-sized parts and merging the answers (pure logic, no API calls).
+Run with: python -m pytest -q test_invoice_chunking.py
+"""
+import pytest
+
+import config
+from invoice_chunking import estimate_tokens, head_and_tail, merge_chunk_items, merge_chunk_results, split_into_chunks
+from invoice_extractor import AIInvoiceExtractor
+
+
+def long_invoice(items: int) -> str:
+    header = ["ACME Industrial Supply", "Invoice Number: INV-2024-0042", "Date: 2024-03-18"]
+    rows = [f"Widget part {index:04d}   {index % 7 + 1}   4.00   {(index % 7 + 1) * 4:.2f}" for index in range(items)]
+    return "\n".join(header + rows + ["Tax: 12.00", "TOTAL: 1,234.56"])
+
+
+@pytest.fixture
+def extractor():
+    extractor = AIInvoiceExtractor(prewarm_ocr=False)
+    extractor.cache = extractor.templates = None
+    return extractor
+
+
+def test_head_and_tail_keeps_short_text():
+    text = long_invoice(10)
+    assert head_and_tail(text, 12000) == text
+
+
+def test_head_and_tail_keeps_header_and_totals_within_budget():
+    trimmed = head_and_tail(long_invoice(2000), 1000)
+    lines = trimmed.splitlines()
+    assert estimate_tokens(trimmed) <= 1000 + len(lines)
+    assert lines[:3] == ["ACME Industrial Supply", "Invoice Number: INV-2024-0042", "Date: 2024-03-18"]
+    assert lines[-2:] == ["Tax: 12.00", "TOTAL: 1,234.56"]
+    assert any("lines of line items omitted" in line for line in lines)
+
+
+def test_header_payload_is_cut_to_the_chunk_budget(extractor, monkeypatch):
+    monkeypatch.setattr(config, "LLM_CHUNK_TOKEN_BUDGET", 1000)
+    items = [{"description": "Widget", "quantity": 1, "unit_price": 4.0, "total_price": 4.0}]
+    payload = extractor.header_payload(long_invoice(2000), items)
+    prompt = payload["messages"][-1]["content"]
+    assert "INV-2024-0042" in prompt and "TOTAL: 1,234.56" in prompt
+    assert estimate_tokens(prompt) < 2000
+
+
+def test_split_into_chunks_overlaps_and_numbers_lines():
+    chunks = split_into_chunks(long_invoice(400), 500, 3)
+    assert len(chunks) > 1
+    first, second = chunks[0].splitlines(), chunks[1].splitlines()
+    assert first[0].startswith("1| ACME")
+    assert second[:3] == first[-3:]
+
+
+def test_merge_chunk_items_drops_overlap_duplicates_only():
+    widget = {"description": "Widget", "total_price": 4.0}
+    merged = merge_chunk_items([
+        [dict(widget, line=10), dict(widget, line=11)],
+        [dict(widget, line=11), dict(widget, line=12)],  # line 11 is the overlap
+        [dict(widget, line=11)],  # Not in the previous chunk: a different item
+    ])
+    assert len(merged) == 4
+    assert all("line" not in item for item in merged)
+
+
+def test_merge_chunk_items_keeps_items_without_line_numbers():
+    item = {"description": "Widget", "total_price": 4.0}
+    assert len(merge_chunk_items([[item], [item]])) == 2
+
+
+def test_merge_chunk_results_header_from_first_totals_from_last():
+    items = [{"description": "Widget", "total_price": 10.0}, {"description": "Gadget", "total_price": 5.0}]
+    merged = merge_chunk_results([
+        {"vendor_name": "ACME", "invoice_number": "INV-1", "total_amount": None, "tax_amount": 0},
+        {"vendor_name": None, "invoice_number": "INV-9", "total_amount": 99.0, "tax_amount": 1.0},
+        {"vendor_name": "Other", "total_amount": 16.5, "tax_amount": 1.5},
+    ], items)
+    assert (merged["vendor_name"], merged["invoice_number"]) == ("ACME", "INV-1")
+    assert (merged["total_amount"], merged["tax_amount"]) == (16.5, 1.5)
+    assert merged["warning"] is None
+
+
+def test_merge_chunk_results_computes_a_missing_total():
+    merged = merge_chunk_results([{"tax_amount": 2.0}, {}], [{"description": "Widget", "total_price": 10.0}])
+    assert merged["total_amount"] == 12.0
+    assert merged["vendor_name"] == "Unknown Vendor"
+    assert "computed from line items" in merged["warning"]
@@ -0,0 +1,51 @@
+"""
+Unit tests for splitting a multi-invoice PDF into per-invoice page ranges (pure logic, no API calls).
+Run with: python -m pytest -q test_invoice_splitter.py
+"""
+from invoice_splitter import letterhead_key, split_invoice_pages
+
+
+def page(vendor: str, number: str, body: str = "Widget 1 4.00 4.00", total: bool = True, marker: str = "") -> str:
+    lines = [vendor, "INVOICE", f"Invoice No: {number}", marker, body]
+    if total:
+        lines.append("Total Due: 4.00")
+    return "\n".join(line for line in lines if line)
+
+
+def test_letterhead_key_normalizes_the_first_line():
+    assert letterhead_key("\n  ACME Corp., Ltd.\nInvoice") == "acmecorpltd"
+    assert letterhead_key("   \n") is None
+
+
+def test_different_invoice_numbers_after_a_total_split():
+    pages = [page("ACME", "A-100"), page("ACME", "A-101"), page("Globex", "G-7")]
+    assert split_invoice_pages(pages) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_invoice_continues_until_its_total_block():
+    pages = [page("ACME", "A-100", total=False), page("ACME", "A-999"), page("ACME", "A-101")]
+    assert split_invoice_pages(pages) == [(0, 2), (2, 3)]
+
+
+def test_page_markers_decide():
+    pages = [
+        page("ACME", "A-100", marker="Page 1 of 2"),
+        page("ACME", "A-101", marker="Page 2 of 2"),
+        page("ACME", "A-100", marker="Page 1 of 1"),
+    ]
+    assert split_invoice_pages(pages) == [(0, 2), (2, 3)]
+
+
+def test_continued_pages_and_blank_pages_stay_attached():
+    pages = [page("ACME", "A-100"), "", page("Globex", "G-7", marker="(continued)"), page("Globex", "G-8")]
+    assert split_invoice_pages(pages) == [(0, 3), (3, 4)]
+
+
+def test_statement_listing_other_invoices_stays_whole():
+    statement = "ACME\nSTATEMENT\nInvoice No: A-100  40.00\nInvoice No: A-101  60.00"
+    pages = [statement, "ACME\nInvoice No: A-102  20.00\nBalance Due: 120.00"]
+    assert split_invoice_pages(pages) == [(0, 2)]
+
+
+def test_no_pages():
+    assert split_invoice_pages([]) == []
@@ -0,0 +1,90 @@
+"""
+Unit tests for the local arithmetic and sanity checks on extracted invoices (pure logic, no API calls).
+Run with: python -m pytest -q test_invoice_validation.py
+"""
+import pytest
+
+from invoice_validation import PENALTIES, apply_corrections, suspect_context, validate_invoice
+
+
+def invoice(**fields) -> dict:
+    data = {
+        "vendor_name": "ACME", "date": "03/18/2024", "due_date": "04/17/2024", "tax_amount": 1.6, "total_amount": 21.6,
+        "items": [
+            {"description": "Widget", "quantity": 2, "unit_price": 5.0, "total_price": 10.0},
+            {"description": "Gadget", "quantity": 1, "unit_price": 10.0, "total_price": 10.0},
+        ],
+    }
+    data.update(fields)
+    return data
+
+
+def test_consistent_invoice_passes():
+    report = validate_invoice(invoice())
+    assert report == {"ok": True, "confidence": 1.0, "issues": [], "suspect_items": [], "suspect_fields": []}
+
+
+@pytest.mark.parametrize("total, ok", [
+    (21.62, True),  # Within the 0.02 absolute tolerance
+    (21.63, False),
+    (100021.6, False),
+])
+def test_total_tolerance(total, ok):
+    assert validate_invoice(invoice(total_amount=total))["ok"] is ok
+
+
+def test_large_totals_allow_relative_rounding():
+    items = [{"description": "Machine", "quantity": 3, "unit_price": 33333.33, "total_price": 99999.99}]
+    report = validate_invoice(invoice(items=items, tax_amount=0.0, total_amount=100000.05))
+    assert report["ok"]  # 0.06 off, within 0.1% of the total
+
+
+def test_line_math_marks_the_item_and_the_total():
+    data = invoice()
+    data["items"][0]["total_price"] = 12.0
+    data["total_amount"] = 23.6
+    report = validate_invoice(data)
+    assert report["suspect_items"] == [0]
+    assert report["suspect_fields"] == ["total_amount"]
+    assert report["confidence"] == pytest.approx(1 - PENALTIES["line_math"])
+
+
+def test_wrong_total_lowers_confidence():
+    report = validate_invoice(invoice(total_amount=30.0))
+    assert [issue["check"] for issue in report["issues"]] == ["total"]
+    assert report["suspect_fields"] == ["total_amount", "tax_amount"]
+    assert report["confidence"] == pytest.approx(1 - PENALTIES["total"])
+
+
+@pytest.mark.parametrize("tax, total", [(-1.0, 19.0), (10.0, 30.0)])
+def test_implausible_tax(tax, total):
+    report = validate_invoice(invoice(tax_amount=tax, total_amount=total))
+    assert [issue["check"] for issue in report["issues"]] == ["tax"]
+    assert "tax_amount" in report["suspect_fields"]
+
+
+@pytest.mark.parametrize("fields, suspect", [
+    ({"date": "2024-03-18"}, "date"),
+    ({"date": "03/18/1999"}, "date"),
+    ({"due_date": "03/01/2024"}, "due_date"),
+])
+def test_implausible_dates(fields, suspect):
+    report = validate_invoice(invoice(**fields))
+    assert report["suspect_fields"] == [suspect]
+
+
+def test_suspect_context_and_corrections_touch_only_suspects():
+    data = invoice(total_amount=30.0)
+    data["items"][0]["total_price"] = 12.0
+    report = validate_invoice(data)
+    text = "ACME\nWidget  2  5.00  10.00\nGadget  1  10.00  10.00\nTax 1.60\nTotal 21.60"
+    assert suspect_context(text, data, report) == ["Widget  2  5.00  10.00", "Tax 1.60", "Total 21.60"]
+
+    fixed = apply_corrections(data, {
+        "items": [{"index": 0, "total_price": 10.0}, {"index": 1, "total_price": 99.0}],
+        "total_amount": 21.6, "vendor_name": "Other",
+    }, report)
+    assert [item["total_price"] for item in fixed["items"]] == [10.0, 10.0]
+    assert (fixed["total_amount"], fixed["vendor_name"]) == (21.6, "ACME")
+    assert data["items"][0]["total_price"] == 12.0  # The original is left as it was
+    assert validate_invoice(fixed)["ok"]
@@ -0,0 +1,127 @@
+"""
+Unit tests for local repair of model answers and amount coercion (pure logic, no API calls).
+Run with: python -m pytest -q test_json_repair.py
+"""
+import json
+
+import pytest
+
+import config
+from invoice_extractor import AIInvoiceExtractor, coerce_amount
+from json_repair import JSONRepairError, loads_object, repair
+
+
+def completion(content: str, finish_reason: str = "stop") -> dict:
+    return {"choices": [{"message": {"content": content}, "finish_reason": finish_reason}]}
+
+
+class FakeClient:
+    """Returns queued answers and records the payloads it was sent"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.payloads = []
+
+    def chat_completion(self, payload: dict) -> dict:
+        self.payloads.append(payload)
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def extractor():
+    extractor = AIInvoiceExtractor(prewarm_ocr=False)
+    extractor.cache = extractor.templates = None
+    return extractor
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1.234,56", 1234.56),
+    ("1,234.56", 1234.56),
+    ("$4.03", 4.03),
+    ("4,03", 4.03),
+    ("1,299", 1299.0),
+    ("(12.00)", -12.0),
+    (7, 7),
+])
+def test_coerce_amount(value, expected):
+    assert coerce_amount(value) == expected
+
+
+def test_coerce_amount_rejects_percentages():
+    assert coerce_amount("12.5%") == "12.5%"
+    assert coerce_amount("12,5 %") == "12,5 %"
+
+
+def test_loads_object_strips_prose_and_trailing_commas():
+    data, repairs = loads_object('Here it is:\n```json\n{"vendor_name": "ACME", "items": [1, 2,],}\n```')
+    assert data == {"vendor_name": "ACME", "items": [1, 2]}
+    assert "trailing comma" in repairs
+
+
+def test_repair_drops_cut_off_values():
+    fixed, repairs = repair('{"vendor_name": "ACME", "total_amount": 12.')
+    assert json.loads(fixed) == {"vendor_name": "ACME"}
+    assert "truncated" in repairs and "dropped value" in repairs
+
+
+def test_repair_closes_brackets_without_dropping():
+    fixed, repairs = repair('{"vendor_name": "ACME", "items": [{"total_price": 5}')
+    assert json.loads(fixed) == {"vendor_name": "ACME", "items": [{"total_price": 5}]}
+    assert repairs == ["truncated"]
+
+
+def test_loads_object_without_object():
+    with pytest.raises(JSONRepairError):
+        loads_object("Sorry, I cannot read this invoice.")
+
+
+def test_truncated_answer_is_asked_again_with_more_tokens(extractor):
+    answer = {"vendor_name": "ACME", "total_amount": "1.234,56", "items": []}
+    extractor.client = FakeClient(
+        completion('{"vendor_name": "ACME", "total_amount": 1234.56, "items": [{"description": "Wid', "length"),
+        completion(json.dumps(answer)),
+    )
+    payload = extractor.build_payload("ACME invoice")
+    data = extractor.complete_json(payload, extractor.invoice_dict)
+
+    assert data["total_amount"] == 1234.56
+    assert len(extractor.client.payloads) == 2
+    retry = extractor.client.payloads[1]
+    assert retry["messages"] == payload["messages"]
+    assert retry["max_tokens"] == config.LLM_TRUNCATED_MAX_TOKENS
+
+
+def test_unclosed_brackets_are_closed_without_reask(extractor):
+    extractor.client = FakeClient(
+        completion('{"vendor_name": "ACME", "total_amount": 5, "items": [{"description": "Widget", "total_price": 5}]'),
+    )
+    data = extractor.complete_json(extractor.build_payload("ACME invoice"), extractor.invoice_dict)
+    assert [item["description"] for item in data["items"]] == ["Widget"]
+    assert len(extractor.client.payloads) == 1
+
+
+def test_dropped_value_is_asked_again_without_finish_reason(extractor):
+    extractor.client = FakeClient(
+        completion('{"vendor_name": "ACME", "items": [{"description": "Widget", "total_price": 12.', None),
+        completion('{"vendor_name": "ACME", "items": []}'),
+    )
+    extractor.complete_json(extractor.build_payload("ACME invoice"), extractor.invoice_dict)
+    assert extractor.client.payloads[1]["max_tokens"] == config.LLM_TRUNCATED_MAX_TOKENS
+
+
+def test_reask_never_lowers_the_reasoner_output_limit(extractor):
+    extractor.client = FakeClient(
+        completion('{"vendor_name": "ACME", "items": [', "length"),
+        completion('{"vendor_name": "ACME", "items": []}'),
+    )
+    payload = extractor.build_payload("ACME invoice", model="deepseek-reasoner")
+    extractor.complete_json(payload, extractor.invoice_dict)
+    assert extractor.client.payloads[1]["max_tokens"] == config.LLM_TRUNCATED_MAX_TOKENS_REASONER
+    assert config.LLM_TRUNCATED_MAX_TOKENS_REASONER > 32768  # deepseek-reasoner's default
+
+
+def test_truncated_answer_is_not_accepted_without_reask(extractor, monkeypatch):
+    monkeypatch.setattr(config, "LLM_JSON_REASK", False)
+    extractor.client = FakeClient(completion('{"vendor_name": "ACME", "items": [', "length"))
+    with pytest.raises(JSONRepairError):
+        extractor.complete_json(extractor.build_payload("ACME invoice"), extractor.invoice_dict)
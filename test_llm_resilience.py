@@ -0,0 +1,147 @@
+"""
+Unit tests for the DeepSeek circuit breaker, latency tracker and request single-flight (no API calls).
+Run with: python -m pytest -q test_llm_resilience.py
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+import llm_resilience
+from llm_resilience import CircuitBreaker, CircuitOpenError, LatencyTracker
+from single_flight import AsyncSingleFlight, SingleFlight
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_resilience.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("test", window=30, min_calls=4, error_rate=0.5, cooldown=10)
+
+
+def fail(breaker: CircuitBreaker, count: int):
+    for _ in range(count):
+        breaker.before_request()
+        breaker.record(True, RuntimeError("HTTP 503"))
+
+
+def test_circuit_opens_at_the_error_rate_once_there_are_enough_calls(breaker):
+    fail(breaker, 3)
+    assert breaker.state()["state"] == "closed"  # Under min_calls
+    breaker.record(False)
+    assert breaker.state()["state"] == "open"  # 3 of 4 failed
+    with pytest.raises(CircuitOpenError, match="HTTP 503"):
+        breaker.before_request()
+
+
+def test_old_failures_leave_the_window(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 31
+    breaker.record(True)
+    state = breaker.state()
+    assert (state["state"], state["window_calls"]) == ("closed", 1)
+
+
+def test_half_open_lets_one_probe_through(breaker, clock):
+    fail(breaker, 4)
+    clock.now += 10
+    breaker.before_request()  # The probe
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.record(False)
+    assert breaker.state()["state"] == "closed"
+    breaker.before_request()
+
+
+def test_failed_probe_opens_the_circuit_again(breaker, clock):
+    fail(breaker, 4)
+    clock.now += 10
+    breaker.before_request()
+    breaker.record(True)
+    assert breaker.state()["state"] == "open"
+    assert breaker.state()["open_for_s"] == 10.0
+
+
+def test_lost_probe_is_replaced_after_a_cooldown(breaker, clock):
+    fail(breaker, 4)
+    clock.now += 10
+    breaker.before_request()  # Never reports back
+    clock.now += 10
+    breaker.before_request()
+
+
+def test_latency_percentile():
+    tracker = LatencyTracker(size=100)
+    for value in range(1, 101):
+        tracker.observe(value / 100)
+    assert tracker.percentile(95) == 0.95
+    assert LatencyTracker().percentile(95) is None
+
+
+def test_single_flight_runs_concurrent_calls_once():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def parse():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"items": []}
+
+    def caller():
+        results.append(flight.do("pdf:abc", parse))
+
+    threads = [threading.Thread(target=caller) for _ in range(3)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.1)  # Let the followers reach the in-flight call
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True]
+    first, second = results[0][0], results[1][0]
+    assert first == second and first is not second  # Each caller gets its own copy
+    assert flight.in_flight() == 0
+
+
+def test_single_flight_shares_the_error_and_forgets_the_key():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do("pdf:abc", lambda: (_ for _ in ()).throw(ValueError("bad answer")))
+    assert flight.do("pdf:abc", lambda: 1) == (1, False)
+
+
+def test_async_single_flight_runs_concurrent_calls_once():
+    calls = []
+
+    async def parse():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"items": []}
+
+    async def main():
+        flight = AsyncSingleFlight()
+        return await asyncio.gather(*(flight.do("pdf:abc", parse) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [shared for _, shared in results] == [False, True, True]
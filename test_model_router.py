@@ -0,0 +1,65 @@
+"""
+Unit tests for complexity-based model routing on PDF and OCR text (pure logic, no API calls).
+Run with: python -m pytest -q test_model_router.py
+"""
+import random
+
+import pytest
+
+import config
+from model_router import FAST, STRONG, complexity_features, merge_ocr_fragments, route_document
+
+
+def ocr_receipt(items: int, seed: int = 0) -> str:
+    """Receipt text the way EasyOCR returns it: one line per text box, amounts in their own box"""
+    rng = random.Random(seed)
+    boxes = ["CORNER MARKET", "Invoice No: R-1042", "2024-03-18"]
+    subtotal = 0.0
+    for index in range(items):
+        price = rng.randint(100, 5000) / 100
+        subtotal += price
+        boxes += [f"Item {index + 1} grocery", f"{price:.2f}"]
+    boxes += ["TAX", f"{subtotal * 0.08:.2f}", "TOTAL", f"${subtotal * 1.08:.2f}"]
+    return "\n".join(boxes)
+
+
+@pytest.fixture(autouse=True)
+def routing(monkeypatch):
+    monkeypatch.setattr(config, "LLM_ROUTING_ENABLED", True)
+
+
+def test_merge_ocr_fragments_joins_amount_boxes():
+    lines = ["Coffee", "3.50", "Bagel", "x2", "$4.00", "TOTAL", "7.50"]
+    assert merge_ocr_fragments(lines) == ["Coffee 3.50", "Bagel x2 $4.00", "TOTAL 7.50"]
+
+
+@pytest.mark.parametrize("items", [8, 25, 40])
+def test_ocr_receipts_use_the_fast_model(items):
+    text = ocr_receipt(items)
+    route = route_document(text, "image")
+    assert route["tier"] == FAST, route["reasons"]
+    assert route["features"]["lines"] == items + 5
+
+
+def test_ocr_alone_does_not_select_the_strong_model():
+    assert route_document("ACME\nTOTAL\n5.00", "image")["score"] == 0
+
+
+def test_long_ocr_document_uses_the_strong_model():
+    route = route_document(ocr_receipt(70), "image")
+    assert route["tier"] == STRONG
+    assert "OCR text" in route["reasons"]
+
+
+def test_dense_pdf_table_uses_the_strong_model():
+    rows = [f"Part {index} {index} 4.00 {index * 4:.2f}" for index in range(70)]
+    route = route_document("\n".join(["ACME Corp", "Invoice 12"] + rows), "pdf")
+    assert route["tier"] == STRONG
+    assert any(reason.startswith("dense table") for reason in route["reasons"])
+
+
+def test_table_items_read_from_the_pdf_keep_the_fast_model():
+    rows = [f"Part {index} {index} 4.00 {index * 4:.2f}" for index in range(30)]
+    features = complexity_features("\n".join(rows), "pdf", table_items=30)
+    assert route_document("\n".join(rows), "pdf", table_items=30)["tier"] == FAST
+    assert features["amount_lines"] == 30
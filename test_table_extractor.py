@@ -0,0 +1,74 @@
+"""
+Unit tests for reading line items and header fields from digital PDF text and tables (pure logic, no API calls).
+Run with: python -m pytest -q test_table_extractor.py
+"""
+import pytest
+
+from table_extractor import extract_header_fields, parse_amount, reconciles, table_items_from_pages, vendor_line
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("$1,234.50", 1234.5),
+    ("1.234,56", 1234.56),
+    ("(12.00)", -12.0),
+    ("-3.5", -3.5),
+    ("1,299", 1299.0),
+    ("4,03", 4.03),
+    ("EUR 7", 7.0),
+    ("", None),
+    (None, None),
+    ("n/a", None),
+])
+def test_parse_amount(value, expected):
+    assert parse_amount(value) == expected
+
+
+def test_table_items_map_columns_and_skip_summary_rows():
+    table = [
+        ["Item", "Qty", "Unit Price", "Tax Rate", "Line Total"],
+        ["Widget", "2", "5.00", "8%", "10.00"],
+        ["Gadget\nlarge", "1", "$7.50", "8%", "7.50"],
+        ["Subtotal", "", "", "", "17.50"],
+        ["", "", "", "", ""],
+    ]
+    [items] = table_items_from_pages([[table]])
+    assert items == [
+        {"description": "Widget", "quantity": 2.0, "unit_price": 5.0, "total_price": 10.0, "category": None},
+        {"description": "Gadget large", "quantity": 1.0, "unit_price": 7.5, "total_price": 7.5, "category": None},
+    ]
+
+
+def test_tables_without_an_item_header_are_ignored():
+    assert table_items_from_pages([[[["Name", "Address"], ["ACME", "1 Main St"]]]]) == [[]]
+
+
+@pytest.mark.parametrize("lines, expected", [
+    (["ACME Industrial Supply", "INVOICE"], "ACME Industrial Supply"),
+    (["TAX INVOICE", "ACME"], None),
+    (["Invoice #: 42"], None),
+    (["Bill To: Globex"], None),
+    (["1234567"], None),
+])
+def test_vendor_line(lines, expected):
+    assert vendor_line(lines) == expected
+
+
+def test_extract_header_fields():
+    text = "\n".join([
+        "ACME Industrial Supply", "INVOICE", "Invoice Number: INV-0042",
+        "Invoice Date: Jan 26, 2024 Terms: Net 30", "Due Date: 02/25/2024",
+        "Widget 2 5.00 10.00", "Subtotal 10.00", "Sales Tax 0.80", "Total $10.80",
+    ])
+    header = extract_header_fields(text)
+    assert header == {
+        "vendor_name": "ACME Industrial Supply", "invoice_number": "INV-0042", "date": "01/26/2024",
+        "due_date": "02/25/2024", "total_amount": 10.8, "tax_amount": 0.8, "currency": "USD",
+    }
+
+
+def test_reconciles():
+    items = [{"total_price": 10.0}, {"total_price": 5.0}]
+    assert reconciles(items, 16.2, 1.2)
+    assert not reconciles(items, 16.25, 1.2)
+    assert not reconciles([], 0.0, 0.0)
+    assert not reconciles(items, None, 1.2)
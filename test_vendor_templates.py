@@ -0,0 +1,59 @@
+"""
+Unit tests for learned vendor layout templates (synthetic PDFs, no API calls).
+Run with: python -m pytest -q test_vendor_templates.py
+"""
+import random
+
+import pytest
+
+from benchmark.corpus import digital_pdf, random_invoice
+from invoice_splitter import letterhead_key
+from pdf_text import PdfTextExtractor
+from vendor_templates import VendorTemplateStore, apply_template, layout_signature, learn_template
+
+VENDOR = "Stark Industrial Parts"
+
+
+def invoice_pdf(seed: int, number: int, items: int = 10):
+    truth = random_invoice(random.Random(seed), items, number)
+    truth["vendor_name"] = VENDOR
+    content = digital_pdf(truth, 1, ruled=True)
+    pdf_text = PdfTextExtractor(1, 100)
+    return truth, pdf_text.page_texts(content), pdf_text.page_words(content)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return VendorTemplateStore(str(tmp_path), 0.6)
+
+
+def test_signature_ignores_table_rows():
+    _, _, words_a = invoice_pdf(1, 1)
+    _, _, words_b = invoice_pdf(2, 2)
+    assert layout_signature(words_a) == layout_signature(words_b)
+
+
+def test_template_learned_on_one_invoice_reads_the_next(store):
+    truth_a, pages_a, words_a = invoice_pdf(1, 1)
+    truth_b, pages_b, words_b = invoice_pdf(2, 2, items=7)
+    template = learn_template(words_a, truth_a)
+    assert template is not None
+    store.save(letterhead_key(pages_a[0]), template, "tenant-a")
+
+    found = store.find(letterhead_key(pages_b[0]), layout_signature(words_b), "tenant-a")
+    assert found is not None
+    header = apply_template(found, words_b)
+    assert header["invoice_number"] == truth_b["invoice_number"]
+    assert header["date"] == truth_b["date"]
+    assert header["total_amount"] == pytest.approx(truth_b["total_amount"])
+
+
+def test_templates_are_private_to_their_tenant(store):
+    truth_a, pages_a, words_a = invoice_pdf(1, 1)
+    store.save(letterhead_key(pages_a[0]), learn_template(words_a, truth_a), "tenant-a")
+    vendor_key = letterhead_key(pages_a[0])
+
+    assert store.has_vendor(vendor_key, "tenant-a")
+    assert not store.has_vendor(vendor_key, "tenant-b")
+    assert store.find(vendor_key, layout_signature(words_a), "tenant-b") is None
+    assert store.find(vendor_key, layout_signature(words_a), "tenant-a")["learned_by"] == "tenant-a"
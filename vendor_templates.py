@@ -0,0 +1,279 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from table_extractor import normalize_date, parse_amount
+
+logger = logging.getLogger(__name__)
+
+# Header fields a template can locate, and how their values are read
+AMOUNT_FIELDS = ("total_amount", "tax_amount")
+DATE_FIELDS = ("date", "due_date")
+TEMPLATE_FIELDS = ("invoice_number",) + DATE_FIELDS + AMOUNT_FIELDS
+MAX_LABEL_WORDS = 3
+MAX_LAYOUTS_PER_VENDOR = 5
+# Layout signature: digit-free words in the top part of the first page, on a coarse grid
+SIGNATURE_REGION = 0.4
+SIGNATURE_GRID = 50
+# A money amount ("341.40", "$1,234.56"): lines holding one are table rows, not part of the layout
+MONEY_RE = re.compile(r"^\(?[$€£¥]?-?\d[\d,.]*[.,]\d{2}\)?$")
+
+# A word is pdfplumber's [text, x0, top, x1, bottom] with page-relative coordinates,
+# a line is (page index, [words left to right])
+Line = Tuple[int, List[list]]
+
+
+def _token(text: str) -> str:
+    return re.sub(r"[^\w]", "", text.lower())
+
+
+def _has_digit(text: str) -> bool:
+    return bool(re.search(r"\d", text))
+
+
+def _lines(page_words: List[List[list]]) -> List[Line]:
+    """Group each page's words into text lines, in reading order across pages"""
+    lines = []
+    for page_index, words in enumerate(page_words):
+        current, current_top, current_height = [], None, None
+        for word in sorted(words, key=lambda w: (w[2], w[1])):
+            if current and abs(word[2] - current_top) <= current_height * 0.5:
+                current.append(word)
+                continue
+            if current:
+                lines.append((page_index, sorted(current, key=lambda w: w[1])))
+            current, current_top, current_height = [word], word[2], max(word[4] - word[2], 1e-3)
+        if current:
+            lines.append((page_index, sorted(current, key=lambda w: w[1])))
+    return lines
+
+
+def layout_signature(page_words: List[List[list]]) -> List[str]:
+    """
+    Positions of the static labels at the top of the first page, e.g. 'invoicedate@31,7'.
+    Table rows (lines holding a money amount) are left out: their descriptions change
+    from one invoice to the next while the layout stays the same.
+    """
+    if not page_words:
+        return []
+    signature = set()
+    for _, words in _lines(page_words[:1]):
+        if any(MONEY_RE.match(word[0]) for word in words):
+            continue
+        for text, x0, top, _, _ in words:
+            token = _token(text)
+            if top <= SIGNATURE_REGION and len(token) >= 2 and not _has_digit(token):
+                signature.add(f"{token}@{round(x0 * SIGNATURE_GRID)},{round(top * SIGNATURE_GRID)}")
+    return sorted(signature)
+
+
+def similarity(a: List[str], b: List[str]) -> float:
+    """Jaccard similarity of two layout signatures"""
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a | b else 0.0
+
+
+def containment(template: List[str], document: List[str]) -> float:
+    """Share of a template's signature found in a document's: labels the document adds do not count against it"""
+    template = set(template)
+    return len(template & set(document)) / len(template) if template else 0.0
+
+
+def _value_matcher(field: str, value) -> Optional[Callable[[str], bool]]:
+    """Predicate telling whether a text fragment holds the verified value of a field"""
+    if value in (None, ""):
+        return None
+    if field in AMOUNT_FIELDS:
+        return lambda text: _has_digit(text) and parse_amount(text) is not None and abs(parse_amount(text) - float(value)) < 0.005
+    if field in DATE_FIELDS:
+        expected = normalize_date(str(value)) or str(value)
+        return lambda text: (normalize_date(text) or text) == expected
+    expected = _token(str(value))
+    return lambda text: _token(text) == expected
+
+
+def _label_left(words: List[list], index: int) -> List[list]:
+    """Digit-free words directly before words[index] on its line (nearest MAX_LABEL_WORDS)"""
+    label = []
+    for word in reversed(words[:index]):
+        if _has_digit(word[0]) or len(label) == MAX_LABEL_WORDS:
+            break
+        label.insert(0, word)
+    return label
+
+
+def _label_above(lines: List[Line], line_index: int, value_words: List[list]) -> List[list]:
+    """Digit-free words on the previous line of the same page that sit over the value"""
+    page, _ = lines[line_index]
+    if line_index == 0 or lines[line_index - 1][0] != page:
+        return []
+    left, right = value_words[0][1], value_words[-1][3]
+    above = [w for w in lines[line_index - 1][1] if w[1] < right and w[3] > left]
+    if not above or any(_has_digit(w[0]) for w in above):
+        return []
+    return above[:MAX_LABEL_WORDS]
+
+
+def _find_label(lines: List[Line], label: List[str]) -> List[Tuple[int, int]]:
+    """(line index, index of the word after the label) for every occurrence of the label"""
+    found = []
+    for line_index, (_, words) in enumerate(lines):
+        tokens = [_token(w[0]) for w in words]
+        for start in range(len(tokens) - len(label) + 1):
+            if tokens[start:start + len(label)] == label:
+                found.append((line_index, start + len(label)))
+    return found
+
+
+def _learn_field(lines: List[Line], field: str, matches: Callable[[str], bool]) -> Optional[dict]:
+    """Rule locating a field's value relative to the label next to (or above) it"""
+    candidates = []
+    for line_index, (_, words) in enumerate(lines):
+        for index in range(len(words)):
+            for count in (3, 2, 1) if field in DATE_FIELDS else (1,):
+                value_words = words[index:index + count]
+                if len(value_words) != count or not matches(" ".join(w[0] for w in value_words)):
+                    continue
+                label = _label_left(words, index)
+                direction = "right"
+                if not label:
+                    label, direction = _label_above(lines, line_index, value_words), "below"
+                if label:
+                    candidates.append({"label": [_token(w[0]) for w in label], "direction": direction, "words": count})
+                break
+    if not candidates:
+        return None
+    # Totals are printed last, everything else first
+    rule = candidates[-1] if field in AMOUNT_FIELDS else candidates[0]
+    occurrences = _find_label(lines, rule["label"])
+    rule["occurrence"] = "last" if field in AMOUNT_FIELDS and len(occurrences) > 1 else "first"
+    return rule
+
+
+def learn_template(page_words: List[List[list]], verified: dict) -> Optional[dict]:
+    """
+    Learn where a vendor prints its header fields from one document and its verified
+    InvoiceData dict. Returns None if the invoice total cannot be located.
+    """
+    lines = _lines(page_words)
+    fields = {}
+    for field in TEMPLATE_FIELDS:
+        matches = _value_matcher(field, verified.get(field))
+        rule = _learn_field(lines, field, matches) if matches else None
+        if rule:
+            fields[field] = rule
+    if "total_amount" not in fields:
+        return None
+    return {
+        "signature": layout_signature(page_words),
+        "vendor_name": verified.get("vendor_name"),
+        "currency": verified.get("currency") or "USD",
+        "fields": fields,
+        "learned_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def _read_value(lines: List[Line], field: str, rule: dict):
+    occurrences = _find_label(lines, rule["label"])
+    if not occurrences:
+        return None
+    line_index, after = occurrences[-1] if rule["occurrence"] == "last" else occurrences[0]
+    page, words = lines[line_index]
+    if rule["direction"] == "right":
+        candidates = words[after:]
+    else:
+        if line_index + 1 >= len(lines) or lines[line_index + 1][0] != page:
+            return None
+        label_words = words[after - len(rule["label"]):after]
+        left, right = label_words[0][1], label_words[-1][3]
+        candidates = [w for w in lines[line_index + 1][1] if w[1] < right + 0.05 and w[3] > left - 0.05]
+
+    if field in AMOUNT_FIELDS:
+        # Currency symbols are sometimes separate words: take the first that holds a number
+        return next((parse_amount(w[0]) for w in candidates if _has_digit(w[0])), None)
+    text = " ".join(w[0] for w in candidates[:rule["words"]])
+    if field in DATE_FIELDS:
+        return normalize_date(text)
+    return text.strip("#: ") or None
+
+
+def apply_template(template: dict, page_words: List[List[list]]) -> Optional[dict]:
+    """Header fields read with a learned template, or None if any learned field is missing"""
+    lines = _lines(page_words)
+    header = {"vendor_name": template["vendor_name"], "currency": template["currency"], "tax_amount": 0.0}
+    for field, rule in template["fields"].items():
+        value = _read_value(lines, field, rule)
+        if value is None:
+            logger.info(f"Vendor template for {template['vendor_name']}: '{field}' not found")
+            return None
+        header[field] = value
+    return header
+
+
+class VendorTemplateStore:
+    """
+    Learned layouts on disk, one JSON file per vendor letterhead holding up to
+    MAX_LAYOUTS_PER_VENDOR templates. Lookup first checks the letterhead, then picks
+    the layout whose signature is most similar to the document's. Templates are kept
+    per tenant (the account that learned them): a layout taught by one user is never
+    used to read another user's invoices. tenant=None is the single-user store (CLI).
+    """
+
+    def __init__(self, directory: str, min_similarity: float):
+        self.directory = directory
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _tenant_directory(self, tenant: Optional[str]) -> str:
+        name = hashlib.sha256(tenant.encode("utf-8")).hexdigest()[:32] if tenant else "default"
+        return os.path.join(self.directory, name)
+
+    def _path(self, vendor_key: str, tenant: Optional[str]) -> str:
+        key = hashlib.sha256(vendor_key.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self._tenant_directory(tenant), f"{key}.json")
+
+    def has_vendor(self, vendor_key: Optional[str], tenant: Optional[str] = None) -> bool:
+        return bool(vendor_key) and os.path.exists(self._path(vendor_key, tenant))
+
+    def _layouts(self, vendor_key: str, tenant: Optional[str]) -> List[dict]:
+        try:
+            with open(self._path(vendor_key, tenant), "r", encoding="utf-8") as f:
+                return json.load(f).get("layouts", [])
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable vendor template for {vendor_key}: {e}")
+            return []
+
+    def find(self, vendor_key: Optional[str], signature: List[str], tenant: Optional[str] = None) -> Optional[dict]:
+        """Best matching layout among the tenant's templates for the vendor, if it is similar enough"""
+        if not vendor_key:
+            return None
+        scored = [(containment(layout["signature"], signature), layout) for layout in self._layouts(vendor_key, tenant)]
+        if not scored:
+            return None
+        score, layout = max(scored, key=lambda entry: entry[0])
+        return layout if score >= self.min_similarity else None
+
+    def save(self, vendor_key: str, template: dict, tenant: Optional[str] = None):
+        """Add a layout to the tenant's templates for the vendor, replacing the one it matches (or the oldest when full)"""
+        template = dict(template, learned_by=tenant)  # Who taught it, for audits and removal
+        with self._lock:
+            layouts = [
+                layout for layout in self._layouts(vendor_key, tenant)
+                if similarity(template["signature"], layout["signature"]) < self.min_similarity
+            ]
+            layouts = (layouts + [template])[-MAX_LAYOUTS_PER_VENDOR:]
+            path = self._path(vendor_key, tenant)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"vendor_key": vendor_key, "layouts": layouts}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)